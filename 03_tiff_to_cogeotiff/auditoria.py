@@ -1,6 +1,5 @@
 import os
 import sys
-import time
 
 # Subimos un nivel para encontrar 'Tools'
 carpeta_actual = os.path.dirname(os.path.abspath(__file__))
@@ -14,41 +13,21 @@ CARPETA_COGS = r"C:\Users\becari.g.fernandez\Desktop\test_output_final"
 
 # r"C:\Users\becari.g.fernandez\Desktop\treballs\02_tif_to_cogeotiff\zzIntento 1\ArcGIS_COG" 
 
-Analisis = []
-
-for archivo in os.listdir(CARPETA_COGS):
-    """
-    Itera por cada archivo dentro de la carpeta de COGs que terminen en .tif, les aplica 
-    la función analizar_cog, y añade el resultado del análisi a la lista Analisis -> [].
-    """
-    if archivo.endswith("tif"):
-            print(f"⚙️  Procesando: {archivo}")
-            ruta_completa = os.path.join(CARPETA_COGS, archivo)
-            datos = gdal_utils.analizar_cog(ruta_completa)
-            Analisis.append(datos)
-
-print("\n" + "="*50)
-print(f"📊 Informe de calidad generado: {len(Analisis)} archivos procesados")
-print("="*50 + "\n")
-
-for reporte in Analisis:
-    
-    for clave, valor in reporte.items():
-        if clave == "Archivo":
-            print(f"  📂 Archivo: {valor}")
-        elif clave == "Lista_Overviews":
-            print("   └─ Overviews:")
-            
-            if valor:
-                total_items = len(valor)
-                for i, ov in enumerate(valor):
-                    es_ultimo = (i == total_items - 1)
-                    simbolo = "└─" if es_ultimo else "├─"
-                    print(f"       {simbolo} Nivel {ov['Nivel']}: {ov['Ancho']}x{ov['Alto']} px")
-            else:
-                print("       ⚠️ CRÍTICO: No tiene pirámides de zoom.")
-            
-        else:
-            print(f"   ├─ {clave}: {valor}")
-    
-    print("-" * 40)
\ No newline at end of file
+# Hilos para la auditoría (solo se leen cabeceras, así que pueden ser bastantes)
+NUM_HILOS = 8
+
+# Informes legibles por máquina, FUERA de la carpeta auditada (así no se mezclan con los COG
+# que se publican ni aparecen en la siguiente auditoría)
+CARPETA_INFORMES = os.path.join(os.path.dirname(CARPETA_COGS), "informes_auditoria")
+os.makedirs(CARPETA_INFORMES, exist_ok=True)
+RUTA_CSV = os.path.join(CARPETA_INFORMES, "auditoria_cog.csv")
+RUTA_JSONL = os.path.join(CARPETA_INFORMES, "auditoria_cog.jsonl")
+
+"""
+Audita en paralelo todos los .tif de la carpeta de COGs (mismos datos que analizar_cog).
+Los archivos que fallan no paran la auditoría: salen en el resumen con su motivo.
+"""
+Analisis = gdal_utils.auditar_carpeta(CARPETA_COGS, num_workers=NUM_HILOS, ruta_csv=RUTA_CSV, ruta_jsonl=RUTA_JSONL)
+gdal_utils.mostrar_auditoria(Analisis)
+
+print(f"💾 Informes guardados en:\n   {RUTA_CSV}\n   {RUTA_JSONL}")
@@ -0,0 +1,259 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from osgeo import gdal
+
+# Subimos un nivel para encontrar 'Tools'
+carpeta_actual = os.path.dirname(os.path.abspath(__file__))
+carpeta_superior = os.path.dirname(carpeta_actual)
+sys.path.append(carpeta_superior)
+
+from Tools import gdal_utils, metricas
+
+# --- CASOS DE PRUEBA ---
+# Cada caso es un raster sintético. cardinalidad=None -> superficie continua (flotante).
+# El caso "al_completo" reproduce la escala de distribucio_estimada_Al (~321M píxeles).
+
+SUITES = {
+    "rapida": [
+        {"nombre": "byte_1k", "ancho": 1024, "alto": 1024, "tipo": "Byte", "cardinalidad": 10, "fraccion_nodata": 0.2},
+        {"nombre": "float_1k", "ancho": 1024, "alto": 1024, "tipo": "Float32", "cardinalidad": None, "fraccion_nodata": 0.2},
+    ],
+    "media": [
+        {"nombre": "byte_8k", "ancho": 8192, "alto": 8192, "tipo": "Byte", "cardinalidad": 10, "fraccion_nodata": 0.3},
+        {"nombre": "int16_8k", "ancho": 8192, "alto": 8192, "tipo": "Int16", "cardinalidad": 250, "fraccion_nodata": 0.3},
+        {"nombre": "float_clases_8k", "ancho": 8192, "alto": 8192, "tipo": "Float32", "cardinalidad": 10, "fraccion_nodata": 0.3},
+        {"nombre": "float_8k", "ancho": 8192, "alto": 8192, "tipo": "Float32", "cardinalidad": None, "fraccion_nodata": 0.3},
+    ],
+    "completa": [
+        {"nombre": "al_completo", "ancho": 18000, "alto": 18000, "tipo": "Float32", "cardinalidad": 10, "fraccion_nodata": 0.01},
+    ],
+}
+
+OPERACIONES = ["inspeccionar_carpeta", "generar_inyectar_rat", "convertir_a_cog", "convertir_a_cog_con_tabla", "analizar_cog"]
+
+NODATA = {"Byte": 0, "Int16": -9999, "UInt16": 0, "Int32": -9999, "Float32": -9999.0}
+
+# --- GENERACIÓN DE RASTERS SINTÉTICOS ---
+
+def generar_raster_sintetico(ruta, ancho, alto, tipo="Byte", cardinalidad=10, fraccion_nodata=0.1, semilla=0, filas_por_bloque=512):
+    """
+    Escribe un GeoTIFF (stripped, sin compresión, como los que exporta ArcGIS) por bandas de filas.
+    Los valores forman manchas espacialmente coherentes, como nuestras superficies reales:
+    - cardinalidad=N    -> valores enteros 1..N (aunque el tipo sea flotante).
+    - cardinalidad=None -> superficie continua.
+    El NoData se coloca en manchas hasta ocupar ~fraccion_nodata del raster.
+    """
+    rng = np.random.default_rng(semilla)
+    tipo_gdal = gdal.GetDataTypeByName(tipo)
+    nodata = NODATA.get(tipo, 0)
+
+    ds = gdal.GetDriverByName("GTiff").Create(ruta, ancho, alto, 1, tipo_gdal, options=["BIGTIFF=IF_SAFER"])
+    ds.SetGeoTransform([260000.0, 10.0, 0.0, 4750000.0, 0.0, -10.0])
+    ds.SetProjection("EPSG:25831")
+    banda = ds.GetRasterBand(1)
+    banda.SetNoDataValue(nodata)
+
+    # Campo suave de baja frecuencia + ruido -> clases / concentraciones
+    fx, fy = rng.uniform(2, 6, size=2) * np.pi / max(ancho, alto)
+    desfase = rng.uniform(0, 2 * np.pi, size=2)
+    xs = np.arange(ancho)
+
+    for y0 in range(0, alto, filas_por_bloque):
+        filas = min(filas_por_bloque, alto - y0)
+        ys = np.arange(y0, y0 + filas)[:, None]
+        campo = (np.sin(xs[None, :] * fx + desfase[0]) + np.cos(ys * fy + desfase[1])) / 4 + 0.5
+        campo = campo + rng.normal(0, 0.03, size=(filas, ancho))
+
+        if cardinalidad:
+            datos = np.clip((campo * cardinalidad).astype(np.int64) + 1, 1, cardinalidad)
+        else:
+            datos = campo * 3.0
+
+        # NoData en la "esquina" del campo para que salga en manchas, no en sal y pimienta
+        if fraccion_nodata > 0:
+            umbral = np.quantile(campo[:, ::max(1, ancho // 256)], fraccion_nodata)
+            datos = np.where(campo < umbral, nodata, datos)
+
+        banda.WriteArray(datos.astype(_tipo_numpy(tipo)), 0, y0)
+
+    ds = None
+    return ruta
+
+def _tipo_numpy(tipo):
+    """Nombre de tipo GDAL -> dtype de NumPy."""
+    return {"Byte": np.uint8, "Int16": np.int16, "UInt16": np.uint16, "Int32": np.int32, "Float32": np.float32}[tipo]
+
+# --- MEDICIÓN ---
+
+def _tamano(ruta):
+    return os.path.getsize(ruta) if ruta and os.path.exists(ruta) else None
+
+def _medir_operacion(operacion, ruta_entrada, carpeta_trabajo):
+    """
+    Se ejecuta en un proceso NUEVO para que el pico de memoria sea el de esta operación.
+    Devuelve un diccionario con segundos, bytes de salida y pico de RSS.
+    """
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    carpeta_salida = os.path.join(carpeta_trabajo, f"salida_{operacion}")
+    os.makedirs(carpeta_salida, exist_ok=True)
+    memoria_base = metricas.pico_memoria_mb()
+    ruta_salida = None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        if operacion == "generar_inyectar_rat":
+            # Sobre un VRT en memoria para no dejar .aux.xml junto a la entrada
+            ds = gdal.Translate("/vsimem/benchmark.vrt", ruta_entrada, format="VRT")
+            inicio = time.perf_counter()
+            ok = gdal_utils.generar_inyectar_rat(ds)
+            segundos = time.perf_counter() - inicio
+            ds = None
+            gdal.Unlink("/vsimem/benchmark.vrt")
+        elif operacion == "convertir_a_cog":
+            inicio = time.perf_counter()
+            ruta_salida = gdal_utils.convertir_a_cog(ruta_entrada, carpeta_salida)
+            segundos = time.perf_counter() - inicio
+            ok = ruta_salida is not None
+        elif operacion == "convertir_a_cog_con_tabla":
+            inicio = time.perf_counter()
+            ruta_salida = gdal_utils.convertir_a_cog_con_tabla(ruta_entrada, carpeta_salida)
+            segundos = time.perf_counter() - inicio
+            ok = ruta_salida is not None
+        elif operacion == "analizar_cog":
+            ruta_cog = os.path.join(carpeta_trabajo, "salida_convertir_a_cog", gdal_utils.nombre_salida_cog(ruta_entrada))
+            if not os.path.exists(ruta_cog):
+                gdal_utils.convertir_a_cog(ruta_entrada, os.path.dirname(ruta_cog))
+            inicio = time.perf_counter()
+            ok = gdal_utils.analizar_cog(ruta_cog) is not None
+            segundos = time.perf_counter() - inicio
+        elif operacion == "inspeccionar_carpeta":
+            inicio = time.perf_counter()
+            ok = len(gdal_utils.inspeccionar_carpeta(os.path.dirname(ruta_entrada))) > 0
+            segundos = time.perf_counter() - inicio
+        else:
+            raise ValueError(f"Operación desconocida: {operacion}")
+
+    return {
+        "ok": bool(ok),
+        "segundos": round(segundos, 4),
+        "bytes_salida": _tamano(ruta_salida),
+        "pico_rss_mb": metricas.pico_memoria_mb(),
+        "rss_base_mb": memoria_base,
+    }
+
+def ejecutar_suite(nombre_suite, carpeta_resultados, carpeta_trabajo=None, repeticiones=1, operaciones=OPERACIONES):
+    """
+    Genera los rasters de la suite, mide cada operación y guarda un JSON con todo.
+    Devuelve la ruta del JSON de resultados.
+    """
+    carpeta_trabajo = carpeta_trabajo or tempfile.mkdtemp(prefix="benchmark_cog_")
+    os.makedirs(carpeta_resultados, exist_ok=True)
+
+    informe = {
+        "suite": nombre_suite,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit_actual(),
+        "gdal": gdal.__version__,
+        "python": sys.version.split()[0],
+        "resultados": [],
+    }
+
+    try:
+        for caso in SUITES[nombre_suite]:
+            carpeta_caso = os.path.join(carpeta_trabajo, caso["nombre"])
+            carpeta_entrada = os.path.join(carpeta_caso, "entrada")
+            os.makedirs(carpeta_entrada, exist_ok=True)
+            ruta_entrada = os.path.join(carpeta_entrada, f"{caso['nombre']}.tif")
+
+            print(f"🧪 Generando {caso['nombre']} ({caso['ancho']} x {caso['alto']}, {caso['tipo']})...")
+            generar_raster_sintetico(ruta_entrada, caso["ancho"], caso["alto"], caso["tipo"],
+                                     caso["cardinalidad"], caso["fraccion_nodata"])
+            megapixeles = caso["ancho"] * caso["alto"] / 1e6
+
+            for operacion in operaciones:
+                for repeticion in range(repeticiones):
+                    # Un proceso por medida: memoria y caché de GDAL limpias
+                    with ProcessPoolExecutor(max_workers=1) as executor:
+                        medida = executor.submit(_medir_operacion, operacion, ruta_entrada, carpeta_caso).result()
+
+                    medida.update({
+                        "caso": caso["nombre"],
+                        "operacion": operacion,
+                        "repeticion": repeticion,
+                        "megapixeles": round(megapixeles, 3),
+                        "mpix_s": round(megapixeles / medida["segundos"], 2) if medida["segundos"] > 0 else None,
+                        "bytes_entrada": _tamano(ruta_entrada),
+                    })
+                    informe["resultados"].append(medida)
+                    print(f"   ⏱️  {operacion:<28} {medida['segundos']:>9.3f} s  {medida['mpix_s'] or 0:>9.2f} MPix/s  "
+                          f"RSS {medida['pico_rss_mb']} MB")
+    finally:
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    nombre_json = f"benchmark_{nombre_suite}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    ruta_json = os.path.join(carpeta_resultados, nombre_json)
+    with open(ruta_json, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+
+    print(f"\n📊 Resultados guardados en: {ruta_json}")
+    return ruta_json
+
+def _commit_actual():
+    """Commit de git del repositorio (si lo hay), para saber qué versión se midió."""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=carpeta_superior,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+# --- COMPARACIÓN ENTRE EJECUCIONES ---
+
+def _mejores_tiempos(ruta_json):
+    """(caso, operación) -> mejor tiempo de todas las repeticiones."""
+    with open(ruta_json, "r", encoding="utf-8") as f:
+        informe = json.load(f)
+    mejores = {}
+    for r in informe["resultados"]:
+        if r["ok"]:
+            clave = (r["caso"], r["operacion"])
+            mejores[clave] = min(mejores.get(clave, r["segundos"]), r["segundos"])
+    return mejores
+
+def comparar(ruta_anterior, ruta_nueva):
+    """Imprime, para cada caso/operación, el cambio de tiempo entre dos ejecuciones."""
+    antes = _mejores_tiempos(ruta_anterior)
+    despues = _mejores_tiempos(ruta_nueva)
+
+    print(f"\n{'Caso':<18} {'Operación':<28} {'Antes (s)':>10} {'Ahora (s)':>10} {'Cambio':>9}")
+    print("-" * 80)
+    for clave in sorted(set(antes) | set(despues)):
+        t0, t1 = antes.get(clave), despues.get(clave)
+        if t0 and t1:
+            cambio = f"{(t1 - t0) / t0 * 100:+.1f}%"
+        else:
+            cambio = "—"
+        print(f"{clave[0]:<18} {clave[1]:<28} {t0 if t0 is not None else '—':>10} {t1 if t1 is not None else '—':>10} {cambio:>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline raster -> COG con rasters sintéticos.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="rapida")
+    parser.add_argument("--salida", default=os.path.join(carpeta_actual, "resultados_benchmark"))
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--comparar", nargs=2, metavar=("ANTERIOR", "NUEVO"), help="Compara dos JSON de resultados")
+    args = parser.parse_args()
+
+    if args.comparar:
+        comparar(*args.comparar)
+    else:
+        ejecutar_suite(args.suite, args.salida, repeticiones=args.repeticiones)
@@ -1,3 +1,4 @@
+import argparse
 import arcpy
 import os
 import sys
@@ -12,7 +13,17 @@ sys.path.append(carpeta_superior)
 
 from Tools import gdal_utils
 
-def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
+def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino, incremental=False, reanudar=False,
+                             presupuesto_ram_mb=gdal_utils.PRESUPUESTO_RAM_MB):
+    """
+    Convierte a COG (con RAT y atributos) todas las capas raster de un mapa de ArcGIS Pro.
+    Con incremental=True (o --incremental) se salta las capas cuyo origen, opciones y atributos
+    no han cambiado desde la última ejecución (ver manifiesto en la carpeta de destino).
+    Cada capa queda anotada en el diario de la carpeta de destino; con reanudar=True
+    (o --resume) se continúa el último lote cortado de este mapa sin repetir las capas hechas.
+    Los rasters de geodatabase se leen con GDAL sin exportarlos: el intermedio va a /vsimem
+    (o es un VRT si supera 'presupuesto_ram_mb'), así que solo el COG final se escribe en disco.
+    """
     
     # 1. Abrir Proyecto
     if not os.path.exists(ruta_aprx):
@@ -42,18 +53,40 @@ def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
     if not os.path.exists(carpeta_destino):
         os.makedirs(carpeta_destino)
 
-    # Carpeta temporal
+    # Carpeta temporal (solo si este GDAL no lee rasters de FileGDB y hay que exportar con arcpy)
     carpeta_temp = os.path.join(carpeta_destino, "TEMP_EXPORT")
-    if not os.path.exists(carpeta_temp):
-        os.makedirs(carpeta_temp)
 
     conteo = 0
+    omitidos = 0
+    fallos = 0
+    manifiesto = gdal_utils.cargar_manifiesto(carpeta_destino) if incremental else {}
+
+    # Diario del lote: los COG a medias de una ejecución cortada se borran y,
+    # al reanudar, las capas ya hechas no se repiten
+    parciales = gdal_utils.limpiar_parciales(carpeta_destino)
+    if parciales:
+        print(f"🧹 Borrados {parciales} COG a medio escribir de una ejecución anterior.")
+    capas_raster = [capa for capa in mapa_objetivo.listLayers() if capa.isRasterLayer]
+    diario = gdal_utils.abrir_diario(carpeta_destino)
+    lote_nuevo = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+    lote, hechas = gdal_utils.iniciar_lote(diario, lote_nuevo, f"{os.path.abspath(ruta_aprx)}::{mapa_objetivo.name}",
+                                           [capa.name for capa in capas_raster], reanudar)
+    if lote != lote_nuevo:
+        print(f"♻️  Reanudando lote {lote}: {len(hechas)} capas ya hechas.")
 
     # 2. Iterar Capas
-    for capa in mapa_objetivo.listLayers():
+    for capa in capas_raster:
         if capa.isRasterLayer:
             print("-" * 60)
             print(f"🔎 Analizando capa: '{capa.name}'")
+
+            if capa.name in hechas:
+                print("   ⏭️  Ya convertida en el lote que se reanuda. Se omite.")
+                omitidos += 1
+                continue
+            gdal_utils.marcar_en_diario(diario, lote, capa.name, "en_curso")
+            ruta_gdal = ""
+            en_memoria = False
             
             try:
                 # --- A. LECTURA DE ATRIBUTOS (NUEVO) ---
@@ -81,17 +114,47 @@ def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
                 
                 # --- B. PREPARAR RUTA FÍSICA ---
                 conn_props = capa.connectionProperties
-                if not conn_props: continue
+                if not conn_props:
+                    print("   ❌ La capa no tiene propiedades de conexión.")
+                    gdal_utils.marcar_en_diario(diario, lote, capa.name, "fallido", "La capa no tiene propiedades de conexión")
+                    fallos += 1
+                    continue
                 
                 workspace = conn_props.get('connection_info', {}).get('database', '')
                 dataset = conn_props.get('dataset', '')
                 
-                ruta_gdal = ""
                 es_temp = False
 
-                # Si es GDB -> Exportar a Temp
-                if workspace.endswith('.gdb'):
+                # --- MODO INCREMENTAL: ¿el COG de esta capa sigue siendo válido? ---
+                firma = None
+                if incremental:
+                    if workspace.endswith('.gdb'):
+                        ruta_origen = workspace
+                        nombre_salida = f"{capa.name}_COG.tif"
+                    else:
+                        ruta_origen = os.path.join(workspace, dataset)
+                        if not os.path.exists(ruta_origen):
+                            ruta_origen = capa.dataSource
+                        nombre_salida = gdal_utils.nombre_salida_cog(ruta_origen)
+
+                    if os.path.exists(ruta_origen):
+                        firma = gdal_utils.firma_conversion(ruta_origen, diccionario_datos=diccionario_atributos)
+                        if gdal_utils.esta_al_dia(manifiesto, os.path.join(carpeta_destino, nombre_salida), firma):
+                            print("   ⏭️  Sin cambios desde la última ejecución. Se omite.")
+                            omitidos += 1
+                            gdal_utils.marcar_en_diario(diario, lote, capa.name, "hecho")
+                            continue
+
+                # Si es GDB -> GDAL la lee directamente; el intermedio va a memoria (/vsimem)
+                origen_gdb = gdal_utils.origen_raster_gdb(workspace, dataset) if workspace.endswith('.gdb') else None
+                if origen_gdb:
+                    print("   📦 Origen Geodatabase -> Intermedio en memoria (sin exportar a disco)...")
+                    ruta_gdal = gdal_utils.preparar_intermedio(origen_gdb, capa.name, presupuesto_ram_mb) or ""
+                    en_memoria = bool(ruta_gdal)
+                elif workspace.endswith('.gdb'):
+                    # GDAL < 3.7 no lee rasters de FileGDB: exportación con arcpy (método antiguo)
                     print("   📦 Origen Geodatabase -> Exportando temporal...")
+                    os.makedirs(carpeta_temp, exist_ok=True)
                     ruta_temp = os.path.join(carpeta_temp, f"{capa.name}.tif")
                     
                     if arcpy.Exists(ruta_temp):
@@ -113,7 +176,7 @@ def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
                         ruta_gdal = capa.dataSource
 
                 # --- C. LLAMADA A TU LIBRERÍA ---
-                if ruta_gdal and os.path.exists(ruta_gdal):
+                if ruta_gdal and (en_memoria or os.path.exists(ruta_gdal)):
                     
                     # Llamamos a la función pasando el diccionario de atributos
                     res = gdal_utils.convertir_a_cog_con_tabla(
@@ -124,10 +187,21 @@ def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
                     )
                     
                     if res: conteo += 1
+                    gdal_utils.marcar_en_diario(diario, lote, capa.name, "hecho" if res else "fallido",
+                                                None if res else "Sin salida")
+                    if not res: fallos += 1
+
+                    if firma is not None:
+                        gdal_utils.registrar_en_manifiesto(manifiesto, os.path.join(carpeta_destino, nombre_salida), firma, exito=bool(res))
+                        gdal_utils.guardar_manifiesto(carpeta_destino, manifiesto)
                 else:
                     print("   ❌ No se encontró el archivo físico.")
+                    gdal_utils.marcar_en_diario(diario, lote, capa.name, "fallido", "No se encontró el archivo físico")
+                    fallos += 1
 
                 # Limpieza Temp de este archivo
+                if en_memoria:
+                    gdal_utils.liberar_intermedio(ruta_gdal)
                 if es_temp:
                     try: 
                         if os.path.exists(ruta_gdal): os.remove(ruta_gdal)
@@ -135,12 +209,22 @@ def procesar_rasters_de_mapa(ruta_aprx, nombre_mapa, carpeta_destino):
 
             except Exception as e:
                 print(f"❌ Error procesando capa '{capa.name}': {e}")
+                gdal_utils.marcar_en_diario(diario, lote, capa.name, "fallido", str(e))
+                fallos += 1
+                if en_memoria:
+                    gdal_utils.liberar_intermedio(ruta_gdal)
 
     # Limpieza final carpeta
-    try: shutil.rmtree(carpeta_temp)
-    except: pass
+    if os.path.exists(carpeta_temp):
+        try: shutil.rmtree(carpeta_temp)
+        except: pass
 
-    print(f"\n✅ FIN DEL PROCESO. Rasters convertidos: {conteo}")
+    # Sin fallos el lote queda cerrado; si no, --resume reintenta solo lo que falta
+    if fallos == 0:
+        gdal_utils.cerrar_lote(diario, lote)
+    diario.close()
+
+    print(f"\n✅ FIN DEL PROCESO. Rasters convertidos: {conteo} | Sin cambios: {omitidos} | Fallos: {fallos}")
 
 if __name__ == "__main__":
     # --- CONFIGURACIÓN ---
@@ -148,4 +232,9 @@ if __name__ == "__main__":
     MAPA = "Map"
     SALIDA = r"C:\Users\becari.g.fernandez\Desktop\test_output_final"
 
-    procesar_rasters_de_mapa(PROYECTO, MAPA, SALIDA)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Convierte a COG las capas raster de un mapa de ArcGIS Pro.")
+    parser.add_argument("--resume", action="store_true", help="Continúa el último lote interrumpido de este mapa")
+    parser.add_argument("--incremental", action="store_true", help="Omite las capas sin cambios desde la última ejecución")
+    args = parser.parse_args()
+
+    procesar_rasters_de_mapa(PROYECTO, MAPA, SALIDA, incremental=args.incremental, reanudar=args.resume)
\ No newline at end of file
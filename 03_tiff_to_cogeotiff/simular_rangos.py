@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from osgeo import gdal
+
+# Subimos un nivel para encontrar 'Tools'
+carpeta_actual = os.path.dirname(os.path.abspath(__file__))
+carpeta_superior = os.path.dirname(carpeta_actual)
+sys.path.append(carpeta_superior)
+
+from Tools import estructura_tiff
+
+gdal.DontUseExceptions()
+gdal.PushErrorHandler('CPLQuietErrorHandler')
+
+# --- SIMULADOR DE COSTE HTTP (peticiones Range) DE UN COG ---
+# El visor (Test_Mapa/index.html, ol.source.GeoTIFF) lee el COG por peticiones HTTP Range.
+# Aquí servimos el archivo con un servidor local que apunta cada petición, lo abrimos con
+# /vsicurl/ y leemos las ventanas que pediría el visor en cada nivel de zoom. Así se comparan
+# tamaños de bloque, número de overviews y codecs por lo que cuesta realmente servirlos.
+
+# Vistas simuladas dentro de cada nivel: posición de la esquina superior izquierda (fracción del nivel)
+VISTAS = {
+    "centro": (0.5, 0.5),
+    "esquina": (0.0, 0.0),
+}
+
+# Bytes que lee GDAL al abrir (la "cabecera" que pide también geotiff.js en su primera petición)
+BYTES_APERTURA = 16384
+
+class _ManejadorRangos(BaseHTTPRequestHandler):
+    """Sirve archivos de 'server.carpeta' aceptando 'Range: bytes=a-b' y apunta cada petición."""
+
+    def _ruta_local(self):
+        relativa = unquote(self.path.split("?", 1)[0]).lstrip("/")
+        ruta = os.path.normpath(os.path.join(self.server.carpeta, relativa))
+        if not ruta.startswith(os.path.normpath(self.server.carpeta)) or not os.path.isfile(ruta):
+            return None
+        return ruta
+
+    def do_HEAD(self):
+        ruta = self._ruta_local()
+        if ruta is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(os.path.getsize(ruta)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.server.apuntar("HEAD", 0, 0)
+
+    def do_GET(self):
+        ruta = self._ruta_local()
+        if ruta is None:
+            self.send_error(404)
+            return
+        total = os.path.getsize(ruta)
+        inicio, fin = 0, total - 1
+        rango = self.headers.get("Range")
+        if rango and rango.startswith("bytes="):
+            a, _, b = rango[6:].split(",")[0].partition("-")
+            if a:
+                inicio, fin = int(a), min(int(b), total - 1) if b else total - 1
+            else:
+                inicio, fin = max(0, total - int(b)), total - 1
+            if inicio >= total:
+                self.send_error(416)
+                return
+
+        with open(ruta, "rb") as f:
+            f.seek(inicio)
+            datos = f.read(fin - inicio + 1)
+
+        self.send_response(206 if rango else 200)
+        self.send_header("Content-Length", str(len(datos)))
+        self.send_header("Accept-Ranges", "bytes")
+        if rango:
+            self.send_header("Content-Range", f"bytes {inicio}-{fin}/{total}")
+        self.end_headers()
+        self.wfile.write(datos)
+        self.server.apuntar("GET", inicio, len(datos))
+
+    def log_message(self, formato, *args):
+        pass  # Sin ruido en consola: todo queda en el registro del servidor
+
+class ServidorRangos(ThreadingHTTPServer):
+    """
+    Servidor HTTP local (127.0.0.1, puerto libre) que apunta las peticiones en 'registro'.
+    Se usa como contexto: with ServidorRangos(carpeta) as servidor: ...
+    """
+    daemon_threads = True
+
+    def __init__(self, carpeta):
+        super().__init__(("127.0.0.1", 0), _ManejadorRangos)
+        self.carpeta = carpeta
+        self.registro = []
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def apuntar(self, metodo, inicio, num_bytes):
+        with self._lock:
+            self.registro.append({"metodo": metodo, "inicio": inicio, "bytes": num_bytes})
+
+    def tomar_registro(self):
+        """Devuelve las peticiones apuntadas desde la última llamada y vacía el registro."""
+        with self._lock:
+            registro, self.registro = self.registro, []
+        return registro
+
+    def url(self, nombre_archivo):
+        return f"http://127.0.0.1:{self.server_address[1]}/{quote(nombre_archivo)}"
+
+    def __enter__(self):
+        self._hilo = threading.Thread(target=self.serve_forever, daemon=True)
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+# --- CONFIGURACIÓN DE /vsicurl/ ---
+
+def _configurar_vsicurl(bytes_apertura, tam_chunk):
+    """Fija las opciones de GDAL para la simulación y devuelve las anteriores (para restaurarlas)."""
+    opciones = {
+        "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",   # El visor no lista la carpeta
+        "GDAL_HTTP_MULTIRANGE": "SERIAL",              # Una petición por rango, como el navegador
+        "GDAL_INGESTED_BYTES_AT_OPEN": str(bytes_apertura),
+        "CPL_VSIL_CURL_CHUNK_SIZE": str(tam_chunk) if tam_chunk else None,
+        "GDAL_HTTP_PROXY": None,
+        "NO_PROXY": "127.0.0.1",
+    }
+    anteriores = {}
+    for clave, valor in opciones.items():
+        anteriores[clave] = gdal.GetConfigOption(clave)
+        gdal.SetConfigOption(clave, valor)
+    return anteriores
+
+def _restaurar_config(anteriores):
+    for clave, valor in anteriores.items():
+        gdal.SetConfigOption(clave, valor)
+
+# --- CÁLCULO DE BYTES ÚTILES ---
+
+def _bloques_vista(nivel, x0, y0, ancho, alto):
+    """Rangos (inicio, fin) de los bloques del nivel que tocan la ventana (una banda, PLANARCONFIG=CONTIG)."""
+    bloque_x, bloque_y = nivel["bloque"]
+    por_fila = -(-nivel["ancho"] // bloque_x)
+    rangos = []
+    for fila in range(y0 // bloque_y, (y0 + alto - 1) // bloque_y + 1):
+        for col in range(x0 // bloque_x, (x0 + ancho - 1) // bloque_x + 1):
+            i = fila * por_fila + col
+            if i < len(nivel["offsets"]) and nivel["offsets"][i] and nivel["tamanos"][i]:
+                rangos.append((nivel["offsets"][i], nivel["offsets"][i] + nivel["tamanos"][i]))
+    return rangos
+
+def _unir_rangos(rangos):
+    """Une rangos solapados o contiguos: [(0,10),(5,20)] -> [(0,20)]."""
+    unidos = []
+    for inicio, fin in sorted(rangos):
+        if unidos and inicio <= unidos[-1][1]:
+            unidos[-1] = (unidos[-1][0], max(unidos[-1][1], fin))
+        else:
+            unidos.append((inicio, fin))
+    return unidos
+
+def _bytes_comunes(rangos_a, rangos_b):
+    """Bytes que están a la vez en los dos conjuntos de rangos."""
+    a, b = _unir_rangos(rangos_a), _unir_rangos(rangos_b)
+    total, i, j = 0, 0, 0
+    while i < len(a) and j < len(b):
+        total += max(0, min(a[i][1], b[j][1]) - max(a[i][0], b[j][0]))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return total
+
+def _medir(registro, rangos_utiles=None):
+    """Peticiones, bytes descargados y (si se conocen los bloques necesarios) bytes útiles / desperdiciados."""
+    descargados = [(p["inicio"], p["inicio"] + p["bytes"]) for p in registro if p["bytes"]]
+    total = sum(p["bytes"] for p in registro)
+    medida = {"peticiones": len(registro), "bytes_descargados": total}
+    if rangos_utiles is not None:
+        utiles = _bytes_comunes(descargados, rangos_utiles)
+        medida["bytes_utiles"] = utiles
+        medida["bytes_desperdiciados"] = total - utiles
+        medida["pct_desperdicio"] = round((total - utiles) / total * 100, 1) if total else 0.0
+    return medida
+
+# --- SIMULACIÓN ---
+
+def simular_cog(ruta_cog, ancho_vista=1024, alto_vista=768, vistas=("centro", "esquina"),
+                bytes_apertura=BYTES_APERTURA, tam_chunk=None):
+    """
+    Reproduce el acceso del visor a un COG servido por HTTP y mide su coste.
+    - Fila 'apertura': peticiones para abrir el archivo (cabecera + IFDs).
+    - Una fila por nivel (principal + overviews) y vista: la ventana ancho_vista x alto_vista
+      leída con la cabecera ya en caché, como hace el visor al cambiar de zoom.
+    Devuelve la lista de filas.
+    """
+    estructura = estructura_tiff.auditar_estructura(ruta_cog, con_bloques=True)
+    if estructura is None or not estructura["ifds"]:
+        print(f"❌ No es un TIFF legible: {ruta_cog}")
+        return []
+    niveles = [i for i in estructura["ifds"] if i["tipo"] in ("principal", "overview")]
+
+    carpeta, nombre = os.path.split(os.path.abspath(ruta_cog))
+    filas = []
+    anteriores = _configurar_vsicurl(bytes_apertura, tam_chunk)
+    try:
+        with ServidorRangos(carpeta) as servidor:
+            url = "/vsicurl/" + servidor.url(nombre)
+
+            # 1. Apertura en frío
+            gdal.VSICurlClearCache()
+            servidor.tomar_registro()
+            ds = gdal.Open(url)
+            if ds is None:
+                print(f"❌ GDAL no puede abrir {url}: {gdal.GetLastErrorMsg()}")
+                return []
+            ds = None
+            filas.append({"archivo": nombre, "nivel": "apertura", "dimensiones": None, "vista": None,
+                          "bloques": None, **_medir(servidor.tomar_registro())})
+
+            # 2. Una ventana por nivel y vista
+            for indice, nivel in enumerate(niveles):
+                ancho = min(ancho_vista, nivel["ancho"])
+                alto = min(alto_vista, nivel["alto"])
+                for vista in vistas:
+                    fx, fy = VISTAS[vista]
+                    x0 = int((nivel["ancho"] - ancho) * fx)
+                    y0 = int((nivel["alto"] - alto) * fy)
+
+                    gdal.VSICurlClearCache()
+                    ds = gdal.Open(url)
+                    servidor.tomar_registro()  # La apertura ya está contada arriba
+                    if ds is None:
+                        print(f"❌ GDAL no puede volver a abrir {url}: {gdal.GetLastErrorMsg()}")
+                        return filas
+                    banda = ds.GetRasterBand(1)
+                    if indice > 0:
+                        banda = banda.GetOverview(indice - 1)
+                    banda.ReadRaster(x0, y0, ancho, alto)
+                    ds = None
+
+                    rangos = _bloques_vista(nivel, x0, y0, ancho, alto)
+                    filas.append({
+                        "archivo": nombre,
+                        "nivel": "completo" if indice == 0 else f"overview {indice}",
+                        "dimensiones": f"{nivel['ancho']}x{nivel['alto']}",
+                        "vista": vista,
+                        "bloques": len(rangos),
+                        **_medir(servidor.tomar_registro(), rangos),
+                    })
+    finally:
+        gdal.VSICurlClearCache()
+        _restaurar_config(anteriores)
+    return filas
+
+def imprimir_simulacion(filas):
+    """Tabla por archivo / nivel / vista con peticiones, KB descargados y desperdicio."""
+    print(f"\n{'Archivo':<28} {'Nivel':<12} {'Vista':<8} {'Bloques':>7} {'Petic.':>6} {'KB desc.':>10} "
+          f"{'KB útiles':>10} {'Desperdicio':>11}")
+    print("-" * 100)
+    for f in filas:
+        utiles = f"{f['bytes_utiles'] / 1024:.1f}" if "bytes_utiles" in f else "—"
+        desperdicio = f"{f['pct_desperdicio']:.1f}%" if "pct_desperdicio" in f else "—"
+        print(f"{f['archivo'][:28]:<28} {f['nivel']:<12} {f['vista'] or '—':<8} "
+              f"{f['bloques'] if f['bloques'] is not None else '—':>7} {f['peticiones']:>6} "
+              f"{f['bytes_descargados'] / 1024:>10.1f} {utiles:>10} {desperdicio:>11}")
+
+    # Totales por archivo, para comparar variantes del mismo raster
+    print("\nTotales por archivo (todas las vistas):")
+    for nombre in dict.fromkeys(f["archivo"] for f in filas):
+        propias = [f for f in filas if f["archivo"] == nombre]
+        print(f"   📂 {nombre}: {sum(f['peticiones'] for f in propias)} peticiones, "
+              f"{sum(f['bytes_descargados'] for f in propias) / 1024:.1f} KB, "
+              f"{sum(f.get('bytes_desperdiciados', 0) for f in propias) / 1024:.1f} KB desperdiciados")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coste en peticiones HTTP Range de servir uno o varios COG al visor.")
+    parser.add_argument("cogs", nargs="+", help="COG(s) a comparar")
+    parser.add_argument("--vista", default="1024x768", help="Tamaño de la ventana del visor en píxeles (ANCHOxALTO)")
+    parser.add_argument("--bytes-apertura", type=int, default=BYTES_APERTURA)
+    parser.add_argument("--chunk", type=int, default=None, help="Tamaño mínimo de petición (ej. 65536 como geotiff.js)")
+    parser.add_argument("--json", help="Guarda también las filas en este JSON")
+    args = parser.parse_args()
+
+    ancho_vista, alto_vista = (int(v) for v in args.vista.lower().split("x"))
+    resultados = []
+    for ruta in args.cogs:
+        resultados.extend(simular_cog(ruta, ancho_vista, alto_vista, bytes_apertura=args.bytes_apertura,
+                                      tam_chunk=args.chunk))
+    imprimir_simulacion(resultados)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Resultados guardados en: {args.json}")
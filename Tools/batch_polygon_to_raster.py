@@ -1,9 +1,34 @@
-import arcpy
 import os
+import sys
 import time
 
-aprx = arcpy.mp.ArcGISProject(r"C:\Users\becari.g.fernandez\Desktop\treballs\02_tif_to_cogeotiff\proyecto\tif_to_cogeotiff\tif_to_cogeotiff.aprx")
-m = aprx.listMaps("Map")[0]
+# Subimos un nivel para encontrar 'Tools'
+carpeta_actual = os.path.dirname(os.path.abspath(__file__))
+carpeta_superior = os.path.dirname(carpeta_actual)
+sys.path.append(carpeta_superior)
+
+# --- CONFIGURACIÓN ---
+# "gdal": gdal.Rasterize sobre GeoPackage / Shapefile / FileGDB (sirve en Linux, en paralelo)
+# "arcpy": PolygonToRaster desde el proyecto de ArcGIS Pro (método original, solo Windows)
+MOTOR = "gdal"
+
+APRX_PATH = r"C:\Users\becari.g.fernandez\Desktop\treballs\02_tif_to_cogeotiff\proyecto\tif_to_cogeotiff\tif_to_cogeotiff.aprx"
+GDB_PATH = r"C:\Users\becari.g.fernandez\Desktop\treballs\02_tif_to_cogeotiff\proyecto\tif_to_cogeotiff\tif_to_cogeotiff.gdb"
+
+# Motor GDAL: fuente vectorial (.gpkg, .shp o carpeta .gdb) y carpeta de los GeoTIFF de salida
+RUTA_VECTOR = GDB_PATH
+CARPETA_RASTERS = os.path.join(os.path.dirname(GDB_PATH), "rasters")
+NUM_PROCESOS = 4
+# True: cada capa sale ya como COG Byte con overviews y RAT ('<Elemento>_raster_COG.tif'),
+# sin pasar por la geodatabase ni por 03_tiff_to_cogeotiff/main.py. Por defecto False:
+# GeoTIFF '<Elemento>_raster.tif' como hasta ahora
+SALIDA_COG = False
+# True: capas enormes por teselas (memoria acotada). Las capas van una a una y
+# NUM_PROCESOS reparte las teselas de cada capa (implica salida COG)
+POR_TESELAS = False
+
+CELLSIZE = 10
+PREFIJO_CAMPO = "rang_concentració_"
 
 # Diccionario de elementos y sus acronimos:
 
@@ -38,57 +63,122 @@ acronimos = {
     "Zinc": "Zn"
 }
 
-print(f"--- Buscando capas poligonales en: {m.name}")
+def elemento_de_capa(nombre_capa):
+    """'..._alumini' -> ('Alumini', 'al'): elemento (clave de acronimos) y acrónimo en minúsculas."""
+    elemento = nombre_capa.split("_")[-1]
+    key_elemento_mayuscula = elemento.strip().capitalize()
+    acronimo = acronimos[key_elemento_mayuscula].lower()
+    return key_elemento_mayuscula, acronimo
+
+def batch_polygon_to_raster_gdal(ruta_vector=RUTA_VECTOR, carpeta_salida=CARPETA_RASTERS, num_workers=NUM_PROCESOS,
+                                 salida_cog=SALIDA_COG, por_teselas=POR_TESELAS):
+    """
+    Mismo trabajo que el motor arcpy pero con gdal.Rasterize: una capa por proceso,
+    directamente a GeoTIFF teselado '<Elemento>_raster.tif' con RAT
+    (o a COG con los atributos de los polígonos en la RAT, con salida_cog=True).
+    Con por_teselas=True cada capa se parte en teselas repartidas entre los procesos.
+    """
+    salida_cog = salida_cog or por_teselas
+    from Tools import gdal_utils, rasterizar
+
+    os.makedirs(carpeta_salida, exist_ok=True)
+    parciales = gdal_utils.limpiar_parciales(carpeta_salida)
+    if parciales:
+        print(f"--- 🧹 Borrados {parciales} rasters a medio escribir de una ejecución anterior.")
+    print(f"--- Buscando capas poligonales en: {ruta_vector}")
+
+    trabajos = []
+    for nombre_capa in rasterizar.listar_capas_poligonales(ruta_vector):
+        print(f"\n✅ Candidato encontrado: {nombre_capa}")
+        try:
+            key_elemento_mayuscula, acronimo = elemento_de_capa(nombre_capa)
+        except KeyError:
+            print(f"    - ⚠️  Elemento sin acrónimo conocido. Se omite {nombre_capa}")
+            continue
+        out_name = f"{key_elemento_mayuscula}_raster_COG.tif" if salida_cog else f"{key_elemento_mayuscula}_raster.tif"
+        value_field = PREFIJO_CAMPO + f"{acronimo}"
+        trabajos.append((ruta_vector, nombre_capa, value_field, os.path.join(carpeta_salida, out_name), CELLSIZE))
+
+    print(f"\n    - ⚙️  Rasterizando {len(trabajos)} capas con {num_workers} procesos...")
+    start_time = time.time()
+    if por_teselas:
+        resultados = []
+        for ruta, nombre_capa, campo, ruta_salida, celda in trabajos:
+            inicio = time.time()
+            salida = rasterizar.rasterizar_por_teselas(ruta, nombre_capa, campo, ruta_salida, celda, num_workers=num_workers)
+            resultados.append((nombre_capa, salida, None if salida else "No se generó el raster", time.time() - inicio))
+    else:
+        resultados = rasterizar.rasterizar_capas(trabajos, num_workers=num_workers, como_cog=salida_cog)
 
-for lyr in m.listLayers():
-    if lyr.isFeatureLayer:
-        desc = arcpy.Describe(lyr)
-        if desc.shapeType == "Polygon":
-            print(f"\n✅ Candidato encontrado: {lyr.name}")
-            print(f"    - ⚙️  Procesando {lyr.name}")
+    for nombre_capa, salida, error, segundos in resultados:
+        if salida:
+            print(f"        - ✅ {nombre_capa} procesado con éxito! [Tiempo: {segundos:.2f} s]")
+        else:
+            print(f"        - ❌ Error en {nombre_capa}: {error}")
+    print(f"\n--- Total: {time.time() - start_time:.2f} s")
+    return resultados
+
+def batch_polygon_to_raster_arcpy(aprx_path=APRX_PATH, gdb_path=GDB_PATH):
+    """Método original: PolygonToRaster capa a capa desde el mapa del proyecto de ArcGIS Pro."""
+    import arcpy
+
+    aprx = arcpy.mp.ArcGISProject(aprx_path)
+    m = aprx.listMaps("Map")[0]
+
+    print(f"--- Buscando capas poligonales en: {m.name}")
+
+    for lyr in m.listLayers():
+        if lyr.isFeatureLayer:
+            desc = arcpy.Describe(lyr)
+            if desc.shapeType == "Polygon":
+                print(f"\n✅ Candidato encontrado: {lyr.name}")
+                print(f"    - ⚙️  Procesando {lyr.name}")
             
-            # Para construir el nombre de salida:
-            elemento = (lyr.name).split("_")[-1]
-            key_elemento_mayuscula = elemento.strip().capitalize()
-            acronimo = acronimos[key_elemento_mayuscula].lower()
-            gdb_path = r"C:\Users\becari.g.fernandez\Desktop\treballs\02_tif_to_cogeotiff\proyecto\tif_to_cogeotiff\tif_to_cogeotiff.gdb"
-            out_name = f"{key_elemento_mayuscula}_raster"
+                # Para construir el nombre de salida:
+                key_elemento_mayuscula, acronimo = elemento_de_capa(lyr.name)
+                out_name = f"{key_elemento_mayuscula}_raster"
             
-            # Parámetros para el polygon_to_raster:
-            in_feature = lyr
-            value_field = "rang_concentració_" + f"{acronimo}"
-            out_rasterdataset = os.path.join(gdb_path, out_name)
-            cellsize = 10
-            build_rat = True
+                # Parámetros para el polygon_to_raster:
+                in_feature = lyr
+                value_field = PREFIJO_CAMPO + f"{acronimo}"
+                out_rasterdataset = os.path.join(gdb_path, out_name)
+                cellsize = CELLSIZE
+                build_rat = True
             
-            # --- ⏱️ INICIO DEL TEMPORIZADOR ---
-            start_time = time.time()
+                # --- ⏱️ INICIO DEL TEMPORIZADOR ---
+                start_time = time.time()
                 
-            try:
-                # Ejecución de la herramienta
-                arcpy.PolygonToRaster_conversion(
-                    in_features=in_feature, 
-                    value_field=value_field, 
-                    out_rasterdataset=out_rasterdataset, 
-                    cellsize=cellsize,
-                    build_rat="BUILD"
-                )
+                try:
+                    # Ejecución de la herramienta
+                    arcpy.PolygonToRaster_conversion(
+                        in_features=in_feature, 
+                        value_field=value_field, 
+                        out_rasterdataset=out_rasterdataset, 
+                        cellsize=cellsize,
+                        build_rat="BUILD"
+                    )
                     
-                # --- ⏱️ FIN DEL TEMPORIZADOR ---
-                end_time = time.time()
-                elapsed_time = end_time - start_time
+                    # --- ⏱️ FIN DEL TEMPORIZADOR ---
+                    end_time = time.time()
+                    elapsed_time = end_time - start_time
                     
-                # Imprimimos formateando a 2 decimales (.2f)
-                print(f"        - ✅ Polígono procesado con éxito! [Tiempo: {elapsed_time:.2f} s]")
+                    # Imprimimos formateando a 2 decimales (.2f)
+                    print(f"        - ✅ Polígono procesado con éxito! [Tiempo: {elapsed_time:.2f} s]")
                 
-            except arcpy.ExecuteError:
-                print(f"        - ❌ Error de Geoprocesamiento en {lyr.name}:")
-                print(arcpy.GetMessages(2))
-            except Exception as e:
-                print(f"        - ❌ Error inesperado: {str(e)}")
+                except arcpy.ExecuteError:
+                    print(f"        - ❌ Error de Geoprocesamiento en {lyr.name}:")
+                    print(arcpy.GetMessages(2))
+                except Exception as e:
+                    print(f"        - ❌ Error inesperado: {str(e)}")
                 
+            else:
+                pass
+    
         else:
             pass
-    
+
+if __name__ == "__main__":
+    if MOTOR == "arcpy":
+        batch_polygon_to_raster_arcpy()
     else:
-        pass
\ No newline at end of file
+        batch_polygon_to_raster_gdal()
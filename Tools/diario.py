@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import time
+
+# --- DIARIO DE LOTES (ejecuciones reanudables) ---
+# Cada archivo del lote pasa por pendiente -> en_curso -> hecho / fallido, y cada cambio se
+# guarda en un SQLite de la carpeta de salida al momento. Si el proceso muere, con reanudar=True
+# se continúa el mismo lote: lo hecho no se repite y solo se pierde el archivo que estaba a medias.
+
+NOMBRE_DIARIO = "_diario_cog.sqlite"
+
+ESTADOS_DIARIO = ("pendiente", "en_curso", "hecho", "fallido")
+
+def abrir_diario(carpeta_destino):
+    """Abre (o crea) el diario de la carpeta de salida. Lo pueden usar varios procesos a la vez (WAL)."""
+    conn = sqlite3.connect(os.path.join(carpeta_destino, NOMBRE_DIARIO), timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS lotes (
+            lote TEXT PRIMARY KEY,
+            descripcion TEXT NOT NULL,
+            inicio REAL NOT NULL,
+            fin REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archivos (
+            lote TEXT NOT NULL,
+            clave TEXT NOT NULL,
+            estado TEXT NOT NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            actualizado REAL NOT NULL,
+            PRIMARY KEY (lote, clave)
+        )
+    """)
+    conn.commit()
+    return conn
+
+def iniciar_lote(conn, lote, descripcion, claves, reanudar=False):
+    """
+    Registra un lote nuevo con todas sus 'claves' (rutas o nombres de capa) como pendientes.
+    Con reanudar=True, si hay un lote sin terminar con la misma descripción, se continúa ese:
+    lo que estaba en curso o había fallado vuelve a pendiente.
+    Devuelve (lote, claves_ya_hechas); si el lote devuelto no es el pedido, se está reanudando.
+    """
+    ahora = time.time()
+    anterior = None
+    if reanudar:
+        anterior = conn.execute(
+            "SELECT lote FROM lotes WHERE descripcion = ? AND fin IS NULL ORDER BY inicio DESC LIMIT 1",
+            (descripcion,)
+        ).fetchone()
+
+    if anterior:
+        lote = anterior[0]
+        conn.execute("UPDATE archivos SET estado = 'pendiente', actualizado = ? "
+                     "WHERE lote = ? AND estado IN ('en_curso', 'fallido')", (ahora, lote))
+    else:
+        conn.execute("INSERT INTO lotes (lote, descripcion, inicio) VALUES (?, ?, ?)", (lote, descripcion, ahora))
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO archivos (lote, clave, estado, actualizado) VALUES (?, ?, 'pendiente', ?)",
+        [(lote, clave, ahora) for clave in claves]
+    )
+    conn.commit()
+
+    hechas = {c for (c,) in conn.execute("SELECT clave FROM archivos WHERE lote = ? AND estado = 'hecho'", (lote,))}
+    return lote, hechas
+
+def marcar_en_diario(conn, lote, clave, estado, error=None):
+    """Cambia el estado de un archivo del lote (y lo guarda en el momento)."""
+    conn.execute("""
+        INSERT INTO archivos (lote, clave, estado, intentos, error, actualizado) VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (lote, clave) DO UPDATE SET
+            estado = excluded.estado,
+            intentos = archivos.intentos + excluded.intentos,
+            error = excluded.error,
+            actualizado = excluded.actualizado
+    """, (lote, clave, estado, 1 if estado == "en_curso" else 0, error, time.time()))
+    conn.commit()
+
+def cerrar_lote(conn, lote):
+    """Marca el lote como terminado: ya no se reanudará."""
+    conn.execute("UPDATE lotes SET fin = ? WHERE lote = ?", (time.time(), lote))
+    conn.commit()
@@ -0,0 +1,376 @@
+import os
+import struct
+
+# --- AUDITORÍA DE ESTRUCTURA TIFF / COG SIN GDAL ---
+# Lee solo la cabecera y los IFD (los primeros KB del archivo) y comprueba que el
+# archivo esté realmente optimizado para la nube: IFDs antes de los datos, overviews
+# ordenadas y escritas antes que la resolución completa, bloques en orden, etc.
+# No depende de GDAL, así que sirve para auditar miles de archivos en segundos.
+
+# Tamaño de cada lectura. Un COG normal tiene todos sus IFDs en el primer trozo.
+TAM_LECTURA = 16384
+
+# Máximo de IFDs a recorrer (protección contra cadenas circulares o corruptas)
+MAX_IFDS = 1000
+
+# Por debajo de este tamaño no exigimos tiling ni overviews (igual que el validador de GDAL)
+LADO_MINIMO_COG = 512
+
+# Tipos TIFF: código -> (formato struct, bytes por valor)
+TIPOS_TIFF = {
+    1: ("B", 1), 2: ("c", 1), 3: ("H", 2), 4: ("I", 4), 5: ("II", 8), 6: ("b", 1), 7: ("B", 1),
+    8: ("h", 2), 9: ("i", 4), 10: ("ii", 8), 11: ("f", 4), 12: ("d", 8), 13: ("I", 4),
+    16: ("Q", 8), 17: ("q", 8), 18: ("Q", 8),
+}
+
+# Etiquetas que usamos
+TAG_NEW_SUBFILE_TYPE = 254
+TAG_ANCHO = 256
+TAG_ALTO = 257
+TAG_BITS_POR_MUESTRA = 258
+TAG_COMPRESION = 259
+TAG_STRIP_OFFSETS = 273
+TAG_MUESTRAS_POR_PIXEL = 277
+TAG_FILAS_POR_STRIP = 278
+TAG_STRIP_BYTE_COUNTS = 279
+TAG_PREDICTOR = 317
+TAG_ANCHO_TESELA = 322
+TAG_ALTO_TESELA = 323
+TAG_TILE_OFFSETS = 324
+TAG_TILE_BYTE_COUNTS = 325
+TAG_FORMATO_MUESTRA = 339
+TAG_GDAL_NODATA = 42113
+
+# Etiquetas cuyo valor es un array largo: solo se leen si hacen falta (ver _Ifd.valor)
+TAGS_ARRAYS = {TAG_STRIP_OFFSETS, TAG_STRIP_BYTE_COUNTS, TAG_TILE_OFFSETS, TAG_TILE_BYTE_COUNTS}
+
+NOMBRES_COMPRESION = {
+    1: "NONE", 5: "LZW", 7: "JPEG", 8: "DEFLATE", 32773: "PACKBITS", 32946: "DEFLATE",
+    34887: "LERC", 34925: "LZMA", 50000: "ZSTD", 50001: "WEBP", 50002: "JXL",
+}
+
+class _Lector:
+    """Lectura por trozos con caché: solo se leen del disco los trozos que se tocan."""
+
+    def __init__(self, archivo, tam_trozo=TAM_LECTURA):
+        self.archivo = archivo
+        self.tam_trozo = tam_trozo
+        self.trozos = {}
+        self.bytes_leidos = 0
+
+    def leer(self, offset, n):
+        datos = bytearray()
+        while n > 0:
+            indice, desplazamiento = divmod(offset, self.tam_trozo)
+            if indice not in self.trozos:
+                self.archivo.seek(indice * self.tam_trozo)
+                self.trozos[indice] = self.archivo.read(self.tam_trozo)
+                self.bytes_leidos += len(self.trozos[indice])
+            trozo = self.trozos[indice][desplazamiento:desplazamiento + n]
+            if not trozo:
+                raise ValueError(f"Lectura fuera del archivo (offset {offset})")
+            datos += trozo
+            offset += len(trozo)
+            n -= len(trozo)
+        return bytes(datos)
+
+class _Ifd:
+    """Un IFD: offset, entradas {tag: (tipo, count, posición del valor)} y offset del siguiente."""
+
+    def __init__(self, lector, orden, es_bigtiff, offset):
+        self.lector = lector
+        self.orden = orden
+        self.offset = offset
+        self.entradas = {}
+
+        if es_bigtiff:
+            num_entradas = struct.unpack(orden + "Q", lector.leer(offset, 8))[0]
+            tam_cabecera, tam_entrada, tam_valor, fmt_count = 8, 20, 8, "Q"
+        else:
+            num_entradas = struct.unpack(orden + "H", lector.leer(offset, 2))[0]
+            tam_cabecera, tam_entrada, tam_valor, fmt_count = 2, 12, 4, "I"
+
+        bloque = lector.leer(offset + tam_cabecera, num_entradas * tam_entrada + tam_valor)
+        for i in range(num_entradas):
+            base = i * tam_entrada
+            tag, tipo = struct.unpack(orden + "HH", bloque[base:base + 4])
+            count = struct.unpack(orden + fmt_count, bloque[base + 4:base + 4 + tam_valor])[0]
+            pos_valor = offset + tam_cabecera + base + 4 + tam_valor
+            tam_total = TIPOS_TIFF.get(tipo, ("B", 1))[1] * count
+            if tam_total > tam_valor:
+                # El valor no cabe en la entrada: lo que hay es un offset
+                pos_valor = struct.unpack(orden + ("Q" if es_bigtiff else "I"),
+                                          bloque[base + tam_entrada - tam_valor:base + tam_entrada])[0]
+            self.entradas[tag] = (tipo, count, pos_valor)
+
+        self.fin = offset + tam_cabecera + num_entradas * tam_entrada + tam_valor
+        self.siguiente = struct.unpack(orden + ("Q" if es_bigtiff else "I"), bloque[-tam_valor:])[0]
+
+    def valor(self, tag, defecto=None):
+        """Valor de la etiqueta: un número si count == 1, una lista si no, texto si es ASCII."""
+        if tag not in self.entradas:
+            return defecto
+        tipo, count, pos = self.entradas[tag]
+        if tipo not in TIPOS_TIFF:
+            return defecto
+        fmt, tam = TIPOS_TIFF[tipo]
+        crudo = self.lector.leer(pos, tam * count)
+        if tipo == 2:
+            return crudo.rstrip(b"\0").decode("latin-1")
+        valores = struct.unpack(self.orden + fmt * count, crudo)
+        if tipo in (5, 10):
+            valores = [valores[i] / valores[i + 1] if valores[i + 1] else 0.0 for i in range(0, len(valores), 2)]
+        return valores[0] if count == 1 and len(valores) == 1 else list(valores)
+
+    def zona_arrays(self):
+        """(inicio, fin) de los arrays de offsets/tamaños que están fuera del IFD."""
+        zonas = []
+        for tag in TAGS_ARRAYS & set(self.entradas):
+            tipo, count, pos = self.entradas[tag]
+            tam = TIPOS_TIFF.get(tipo, ("B", 1))[1] * count
+            if pos >= self.fin or pos < self.offset:
+                zonas.append((pos, pos + tam))
+        return zonas
+
+def _tipo_dato(bits, formato):
+    """Nombre del tipo de dato al estilo GDAL (Byte, UInt16, Float32...)."""
+    if isinstance(bits, list):
+        bits = bits[0]
+    if isinstance(formato, list):
+        formato = formato[0]
+    if formato == 3:
+        return f"Float{bits}"
+    if bits == 8:
+        return "Int8" if formato == 2 else "Byte"
+    return f"{'Int' if formato == 2 else 'UInt'}{bits}"
+
+def _leer_metadatos_gdal(lector, offset_inicio, offset_primer_ifd):
+    """
+    Zona 'fantasma' que GDAL escribe tras la cabecera de un COG:
+    GDAL_STRUCTURAL_METADATA_SIZE=XXXXXX bytes / LAYOUT=IFDS_BEFORE_DATA / ...
+    Devuelve un diccionario (vacío si no existe).
+    """
+    prefijo = b"GDAL_STRUCTURAL_METADATA_SIZE="
+    if offset_primer_ifd - offset_inicio < len(prefijo) + 13:
+        return {}
+    try:
+        inicio = lector.leer(offset_inicio, len(prefijo) + 13)
+        if not inicio.startswith(prefijo):
+            return {}
+        tam = int(inicio[len(prefijo):len(prefijo) + 6])
+        texto = lector.leer(offset_inicio + len(prefijo) + 13, tam).decode("latin-1")
+    except (ValueError, UnicodeDecodeError):
+        return {}
+
+    metadatos = {}
+    for linea in texto.splitlines():
+        clave, sep, valor = linea.partition("=")
+        if sep:
+            metadatos[clave.strip()] = valor.strip()
+    return metadatos
+
+def _resumen_ifd(ifd, indice, con_bloques=False):
+    """Datos de un IFD para el informe. Con con_bloques=True incluye los offsets y tamaños de cada bloque."""
+    ancho = ifd.valor(TAG_ANCHO, 0)
+    alto = ifd.valor(TAG_ALTO, 0)
+    subtipo = ifd.valor(TAG_NEW_SUBFILE_TYPE, 0)
+    tiled = TAG_ANCHO_TESELA in ifd.entradas
+
+    if tiled:
+        bloque = (ifd.valor(TAG_ANCHO_TESELA), ifd.valor(TAG_ALTO_TESELA))
+        offsets = ifd.valor(TAG_TILE_OFFSETS, [])
+        tamanos = ifd.valor(TAG_TILE_BYTE_COUNTS, [])
+    else:
+        bloque = (ancho, ifd.valor(TAG_FILAS_POR_STRIP, alto))
+        offsets = ifd.valor(TAG_STRIP_OFFSETS, [])
+        tamanos = ifd.valor(TAG_STRIP_BYTE_COUNTS, [])
+    if not isinstance(offsets, list):
+        offsets = [offsets]
+    if not isinstance(tamanos, list):
+        tamanos = [tamanos]
+
+    if subtipo & 4:
+        tipo = "mascara"
+    elif indice == 0:
+        tipo = "principal"
+    elif subtipo & 1:
+        tipo = "overview"
+    else:
+        tipo = "otra_pagina"
+
+    # Bloques vacíos (offset 0 / tamaño 0) son válidos en GDAL (SPARSE_OK): no cuentan para el orden
+    datos = [(o, t) for o, t in zip(offsets, tamanos) if o and t]
+
+    resumen = {
+        "indice": indice,
+        "tipo": tipo,
+        "offset_ifd": ifd.offset,
+        "ancho": ancho,
+        "alto": alto,
+        "tiled": tiled,
+        "bloque": bloque,
+        "bandas": ifd.valor(TAG_MUESTRAS_POR_PIXEL, 1),
+        "tipo_dato": _tipo_dato(ifd.valor(TAG_BITS_POR_MUESTRA, 1), ifd.valor(TAG_FORMATO_MUESTRA, 1)),
+        "compresion": NOMBRES_COMPRESION.get(ifd.valor(TAG_COMPRESION, 1), str(ifd.valor(TAG_COMPRESION))),
+        "predictor": ifd.valor(TAG_PREDICTOR, 1),
+        "nodata": ifd.valor(TAG_GDAL_NODATA),
+        "num_bloques": len(offsets),
+        "bloques_vacios": len(offsets) - len(datos),
+        "offsets_ordenados": all(datos[i][0] < datos[i + 1][0] for i in range(len(datos) - 1)),
+        "inicio_datos": min((o for o, _ in datos), default=None),
+        "fin_datos": max((o + t for o, t in datos), default=None),
+    }
+    if con_bloques:
+        resumen["offsets"] = offsets
+        resumen["tamanos"] = tamanos
+    return resumen
+
+def auditar_estructura(ruta_archivo, con_bloques=False):
+    """
+    Informe de cumplimiento COG leyendo SOLO la cabecera y los IFD.
+    Devuelve un diccionario con 'es_cog', 'errores', 'avisos', la lista de 'ifds'
+    y los metadatos estructurales de GDAL; o None si no es un TIFF legible.
+    con_bloques=True añade a cada IFD sus listas 'offsets' y 'tamanos' (byte a byte de cada bloque).
+    """
+    informe = {
+        "Archivo": os.path.basename(ruta_archivo),
+        "ruta": ruta_archivo,
+        "tamano_bytes": None,
+        "bigtiff": False,
+        "es_cog": False,
+        "errores": [],
+        "avisos": [],
+        "ifds": [],
+        "metadatos_gdal": {},
+        "bytes_leidos": 0,
+    }
+
+    try:
+        informe["tamano_bytes"] = os.path.getsize(ruta_archivo)
+        with open(ruta_archivo, "rb") as f:
+            lector = _Lector(f)
+            try:
+                _recorrer_tiff(lector, informe, con_bloques)
+            finally:
+                informe["bytes_leidos"] = lector.bytes_leidos
+    except (OSError, ValueError, struct.error) as e:
+        informe["errores"].append(f"No se pudo leer la estructura: {e}")
+        return informe if informe["ifds"] else None
+
+    _comprobar_cog(informe)
+    return informe
+
+def _recorrer_tiff(lector, informe, con_bloques=False):
+    """Lee la cabecera y la cadena de IFDs y rellena 'informe'."""
+    cabecera = lector.leer(0, 16)
+    if cabecera[:2] == b"II":
+        orden = "<"
+    elif cabecera[:2] == b"MM":
+        orden = ">"
+    else:
+        raise ValueError("No es un TIFF (firma desconocida)")
+
+    version = struct.unpack(orden + "H", cabecera[2:4])[0]
+    if version == 42:
+        offset_ifd = struct.unpack(orden + "I", cabecera[4:8])[0]
+        fin_cabecera = 8
+    elif version == 43:
+        informe["bigtiff"] = True
+        offset_ifd = struct.unpack(orden + "Q", cabecera[8:16])[0]
+        fin_cabecera = 16
+    else:
+        raise ValueError(f"Versión TIFF desconocida: {version}")
+
+    informe["metadatos_gdal"] = _leer_metadatos_gdal(lector, fin_cabecera, offset_ifd)
+    informe["fin_cabecera"] = fin_cabecera
+
+    vistos = set()
+    zonas_ifd = []
+    while offset_ifd and len(informe["ifds"]) < MAX_IFDS:
+        if offset_ifd in vistos:
+            informe["errores"].append("Cadena de IFDs circular.")
+            break
+        vistos.add(offset_ifd)
+        ifd = _Ifd(lector, orden, informe["bigtiff"], offset_ifd)
+        informe["ifds"].append(_resumen_ifd(ifd, len(informe["ifds"]), con_bloques))
+        zonas_ifd.append((ifd.offset, ifd.fin))
+        zonas_ifd.extend(ifd.zona_arrays())
+        offset_ifd = ifd.siguiente
+
+    # Final de toda la estructura (IFDs + arrays de offsets) para comprobar que va antes que los datos
+    informe["fin_estructura"] = max((fin for _, fin in zonas_ifd), default=fin_cabecera)
+
+def _comprobar_cog(informe):
+    """Reglas de un COG válido (las mismas que validate_cloud_optimized_geotiff.py de GDAL)."""
+    errores, avisos = informe["errores"], informe["avisos"]
+    ifds = informe["ifds"]
+    if not ifds:
+        errores.append("El archivo no tiene ningún IFD.")
+        return
+
+    principal = ifds[0]
+    overviews = [i for i in ifds if i["tipo"] == "overview"]
+    grande = principal["ancho"] > LADO_MINIMO_COG or principal["alto"] > LADO_MINIMO_COG
+
+    # 1. Tiling
+    if not principal["tiled"] and grande:
+        errores.append("La imagen principal no está en teselas (es stripped).")
+    for ov in overviews:
+        if not ov["tiled"]:
+            errores.append(f"La overview {ov['indice']} no está en teselas.")
+
+    # 2. Overviews presentes y de mayor a menor
+    if not overviews and grande:
+        avisos.append("No tiene overviews (pirámides de zoom).")
+    anterior = principal
+    for ov in overviews:
+        if ov["ancho"] > anterior["ancho"] or ov["alto"] > anterior["alto"]:
+            errores.append(f"La overview {ov['indice']} no es más pequeña que el nivel anterior.")
+        anterior = ov
+
+    # 3. Todos los IFDs (y sus arrays) antes de los datos
+    if any(i["offset_ifd"] < ifds[0]["offset_ifd"] for i in ifds[1:]):
+        errores.append("El IFD principal no es el primero del archivo.")
+    inicio_datos = min((i["inicio_datos"] for i in ifds if i["inicio_datos"] is not None), default=None)
+    if inicio_datos is not None and inicio_datos < informe["fin_estructura"]:
+        errores.append("Hay IFDs o tablas de offsets después del inicio de los datos (IFDS_BEFORE_DATA roto).")
+
+    # 4. Bloques ordenados dentro de cada nivel
+    for i in ifds:
+        if not i["offsets_ordenados"]:
+            errores.append(f"Los bloques del IFD {i['indice']} ({i['tipo']}) no están ordenados.")
+
+    # 5. Datos de las overviews antes que los de la resolución completa (de la más pequeña a la mayor)
+    niveles = [principal] + overviews
+    for mayor, menor in zip(niveles, niveles[1:]):
+        if mayor["inicio_datos"] is None or menor["fin_datos"] is None:
+            continue
+        if menor["fin_datos"] > mayor["inicio_datos"]:
+            errores.append(f"Los datos del IFD {menor['indice']} no van antes que los del IFD {mayor['indice']}.")
+
+    # 6. Marca de GDAL de edición incompatible (IGNORE_COG_LAYOUT_BREAK)
+    metadatos = informe["metadatos_gdal"]
+    if metadatos.get("KNOWN_INCOMPATIBLE_EDITION", "NO").upper() == "YES":
+        errores.append("GDAL marca el archivo como editado tras crearlo (KNOWN_INCOMPATIBLE_EDITION=YES).")
+    if not metadatos:
+        avisos.append("Sin metadatos estructurales de GDAL (no creado con el driver COG).")
+
+    informe["es_cog"] = not errores
+
+def imprimir_auditoria(informe):
+    """Muestra el informe de auditar_estructura en consola."""
+    if informe is None:
+        print("   ❌ No es un TIFF legible.")
+        return
+    estado = "✅ COG VÁLIDO" if informe["es_cog"] else "❌ NO ES COG"
+    print(f"  📂 {informe['Archivo']}  {estado}  ({'BigTIFF' if informe['bigtiff'] else 'TIFF'}, "
+          f"{informe['bytes_leidos'] / 1024:.0f} KB leídos)")
+    for ifd in informe["ifds"]:
+        bloque = f"{ifd['bloque'][0]}x{ifd['bloque'][1]}"
+        print(f"   ├─ IFD {ifd['indice']} [{ifd['tipo']}]: {ifd['ancho']}x{ifd['alto']} px, {ifd['tipo_dato']}, "
+              f"{ifd['compresion']}, bloque {bloque}, {ifd['num_bloques']} bloques")
+    for error in informe["errores"]:
+        print(f"   ├─ ❌ {error}")
+    for aviso in informe["avisos"]:
+        print(f"   ├─ ⚠️  {aviso}")
+    print("-" * 40)
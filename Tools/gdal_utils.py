@@ -1,13 +1,39 @@
+import csv
+import hashlib
+import json
 import os
+import shutil
+import sqlite3
 import time
 import unicodedata  # <--- IMPORTANTE: Para arreglar los caracteres raros
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+import numpy as np
 from osgeo import gdal, osr
 
+from . import estructura_tiff, metricas
+from .diario import NOMBRE_DIARIO, abrir_diario, cerrar_lote, iniciar_lote, marcar_en_diario
+from .manifiesto import (NOMBRE_MANIFIESTO, cargar_manifiesto, esta_al_dia, guardar_manifiesto, hash_diccionario,
+                         huella_entrada, registrar_en_manifiesto)
+
 gdal.DontUseExceptions()
 gdal.PushErrorHandler('CPLQuietErrorHandler')
 
 # Nota: NO activamos UseExceptions() para evitar que falle con proyecciones raras.
 
+# Salida por consola. En lotes muy grandes (10k+ archivos) conviene apagarla con configurar_salida(False).
+VERBOSE = True
+
+def configurar_salida(verbose=True):
+    """Activa / desactiva los mensajes por consola de este módulo."""
+    global VERBOSE
+    VERBOSE = verbose
+
+def _log(*args, **kwargs):
+    if VERBOSE:
+        print(*args, **kwargs)
+
 # --- FUNCIONES AUXILIARES ---
 
 def normalizar_texto(texto):
@@ -23,67 +49,322 @@ def normalizar_texto(texto):
     # Filtra los caracteres que no son de combinación (las tildes)
     return "".join([c for c in nfkd_form if not unicodedata.combining(c)])
 
+# Registro de CRS ya identificados: hash del WKT -> etiqueta legible ("EPSG:25831", ...).
+# Casi todos nuestros archivos comparten el mismo WKT, así que AutoIdentifyEPSG se hace una vez.
+_REGISTRO_CRS = {}
+
+def _hash_wkt(wkt):
+    """Clave corta y estable para un WKT."""
+    return hashlib.sha1(wkt.encode("utf-8")).hexdigest()
+
+def _identificar_crs(wkt):
+    """Resolución 'cara' del WKT con OSR (AutoIdentifyEPSG)."""
+    srs = osr.SpatialReference(wkt)
+    # Intentamos identificar el código EPSG
+    if srs.AutoIdentifyEPSG() == 0:
+        autoridad = srs.GetAuthorityName(None)
+        codigo = srs.GetAuthorityCode(None)
+        if autoridad and codigo:
+            return f"{autoridad}:{codigo}"
+    
+    # Si falla, devolvemos el nombre descriptivo
+    return srs.GetAttrValue("PROJCS") or "Sistema Desconocido"
+
 def _obtener_crs_legible(ds):
-    """Función interna para extraer el CRS de forma segura."""
+    """Función interna para extraer el CRS de forma segura (con memoria por WKT)."""
     try:
         wkt = ds.GetProjection()
         if not wkt:
             return "Sin Referencia Espacial"
         
-        srs = osr.SpatialReference(wkt)
-        # Intentamos identificar el código EPSG
-        if srs.AutoIdentifyEPSG() == 0:
-            autoridad = srs.GetAuthorityName(None)
-            codigo = srs.GetAuthorityCode(None)
-            if autoridad and codigo:
-                return f"{autoridad}:{codigo}"
-        
-        # Si falla, devolvemos el nombre descriptivo
-        return srs.GetAttrValue("PROJCS") or "Sistema Desconocido"
+        clave = _hash_wkt(wkt)
+        etiqueta = _REGISTRO_CRS.get(clave)
+        if etiqueta is None:
+            etiqueta = _identificar_crs(wkt)
+            _REGISTRO_CRS[clave] = etiqueta
+        return etiqueta
     except:
         return "Error leyendo CRS"
 
+def _tamano_archivo(ruta):
+    """Tamaño en bytes (None si no existe o no es un archivo local)."""
+    try:
+        return os.path.getsize(ruta)
+    except (OSError, TypeError):
+        return None
+
 # --- FUNCIONES DE INSPECCIÓN ---
 
-def inspeccionar_carpeta(ruta_carpeta, extensiones_validas=None):
+# --- PRE-FILTRO DE ARCHIVOS (antes de gdal.Open) ---
+
+# Drivers que usamos en los escaneos. Así GDAL no prueba los ~200 drivers con cada archivo.
+DRIVERS_RASTER_ESCANEO = [
+    "GTiff", "COG", "HFA", "AIG", "VRT", "GPKG", "OpenFileGDB",
+    "PNG", "JPEG", "JP2OpenJPEG", "EHdr", "ENVI", "AAIGrid", "netCDF",
+]
+
+# Firmas (primeros bytes) de archivos que sabemos que NO son raster
+FIRMAS_NO_RASTER = [
+    b"<?xml", b"<!DOCTYPE", b"<html", b"<HTML", b"<PAMDataset", b"<metadata",
+    b"%PDF", b"PK\x03\x04", b"{", b"[",
+    b"\x00\x00\x27\x0a",           # Shapefile (.shp / .shx)
+    b"\xd0\xcf\x11\xe0",           # Office antiguo (.doc / .xls)
+]
+
+def _parece_raster(ruta_completa):
+    """
+    Lee los primeros bytes y descarta lo que seguro que no es raster
+    (XML, HTML, .aux.xml, PDF, ZIP, JSON, shapefiles...) sin molestar a GDAL.
+    En caso de duda devuelve True y decide GDAL.
+    """
+    try:
+        with open(ruta_completa, "rb") as f:
+            cabecera = f.read(64)
+    except OSError:
+        return False
+
+    if not cabecera:
+        return False
+
+    inicio = cabecera.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if inicio.startswith(b"<VRTDataset"):
+        return True
+    return not any(inicio.startswith(firma) for firma in FIRMAS_NO_RASTER)
+
+def _leer_cabecera(ruta_completa, drivers_permitidos=DRIVERS_RASTER_ESCANEO):
+    """
+    Abre el archivo con GDAL (solo cabecera) y devuelve su ficha técnica,
+    o None si GDAL no lo reconoce como raster.
+    drivers_permitidos=None deja que GDAL pruebe todos sus drivers.
+    """
+    if not _parece_raster(ruta_completa):
+        return None
+
+    # Intentamos abrir sin miedo a excepciones fatales
+    if drivers_permitidos:
+        ds = gdal.OpenEx(ruta_completa, gdal.OF_RASTER, allowed_drivers=drivers_permitidos)
+    else:
+        ds = gdal.OpenEx(ruta_completa, gdal.OF_RASTER)
+    if ds is None:
+        return None
+
+    # Si GDAL lo abre (aunque tenga warnings), extraemos info
+    ficha = {
+        "driver": ds.GetDriver().LongName,
+        "ancho": ds.RasterXSize,
+        "alto": ds.RasterYSize,
+        "bandas": ds.RasterCount,
+        "crs": _obtener_crs_legible(ds),
+        "tipo_dato": None,
+        "bloque_x": None,
+        "bloque_y": None,
+    }
+    if ds.RasterCount > 0:
+        banda = ds.GetRasterBand(1)
+        ficha["tipo_dato"] = gdal.GetDataTypeName(banda.DataType)
+        ficha["bloque_x"], ficha["bloque_y"] = banda.GetBlockSize()
+
+    ds = None # Cerrar siempre
+    return ficha
+
+def _ficha_a_resultado(nombre_archivo, ruta_completa, ficha):
+    """Convierte la ficha interna al diccionario clásico de inspeccionar_carpeta."""
+    return {
+        "Nombre": nombre_archivo,
+        "Ruta": ruta_completa,
+        "Formato (Driver)": ficha["driver"],
+        "Ancho (X)": ficha["ancho"],
+        "Alto (Y)": ficha["alto"],
+        "Bandas": ficha["bandas"],
+        "CRS": ficha["crs"]
+    }
+
+# --- ÍNDICE PERSISTENTE DE ESCANEO (SQLite) ---
+
+CAMPOS_FICHA = ["driver", "ancho", "alto", "bandas", "crs", "tipo_dato", "bloque_x", "bloque_y"]
+
+def _abrir_indice(ruta_indice):
+    """Abre (o crea) la base de datos SQLite del índice de escaneo."""
+    conn = sqlite3.connect(ruta_indice)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS escaneo (
+            ruta TEXT PRIMARY KEY,
+            tamano INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            es_raster INTEGER NOT NULL,
+            driver TEXT, ancho INTEGER, alto INTEGER, bandas INTEGER,
+            crs TEXT, tipo_dato TEXT, bloque_x INTEGER, bloque_y INTEGER
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS registro_crs (hash_wkt TEXT PRIMARY KEY, etiqueta TEXT NOT NULL)")
+
+    # Cargamos los CRS ya resueltos en escaneos anteriores
+    for clave, etiqueta in conn.execute("SELECT hash_wkt, etiqueta FROM registro_crs"):
+        _REGISTRO_CRS.setdefault(clave, etiqueta)
+    return conn
+
+def _guardar_registro_crs(conn):
+    """Persiste en el índice los CRS resueltos en esta sesión."""
+    conn.executemany(
+        "INSERT OR IGNORE INTO registro_crs (hash_wkt, etiqueta) VALUES (?, ?)",
+        list(_REGISTRO_CRS.items())
+    )
+
+def _consultar_indice(conn, ruta_completa, tamano, mtime):
+    """
+    Busca el archivo en el índice. Devuelve (encontrado, ficha).
+    Solo vale si coinciden tamaño y mtime; si no, hay que reabrirlo.
+    """
+    fila = conn.execute(
+        f"SELECT tamano, mtime, es_raster, {', '.join(CAMPOS_FICHA)} FROM escaneo WHERE ruta = ?",
+        (ruta_completa,)
+    ).fetchone()
+    if fila is None or fila[0] != tamano or fila[1] != mtime:
+        return False, None
+    if not fila[2]:
+        return True, None
+    return True, dict(zip(CAMPOS_FICHA, fila[3:]))
+
+def _guardar_en_indice(conn, ruta_completa, tamano, mtime, ficha):
+    """Guarda (o actualiza) la ficha del archivo. ficha=None -> no es raster."""
+    valores = [ficha[c] for c in CAMPOS_FICHA] if ficha else [None] * len(CAMPOS_FICHA)
+    conn.execute(
+        f"INSERT OR REPLACE INTO escaneo (ruta, tamano, mtime, es_raster, {', '.join(CAMPOS_FICHA)}) "
+        f"VALUES ({', '.join('?' * (4 + len(CAMPOS_FICHA)))})",
+        [ruta_completa, tamano, mtime, 1 if ficha else 0] + valores
+    )
+
+def _purgar_indice(conn, ruta_carpeta, rutas_vistas):
+    """Elimina del índice los archivos de esta carpeta que ya no existen."""
+    prefijo = os.path.join(ruta_carpeta, "")
+    for (ruta,) in conn.execute("SELECT ruta FROM escaneo").fetchall():
+        if ruta.startswith(prefijo) and ruta not in rutas_vistas:
+            conn.execute("DELETE FROM escaneo WHERE ruta = ?", (ruta,))
+
+def inspeccionar_carpeta(ruta_carpeta, extensiones_validas=None, ruta_indice=None):
     """
     Busca archivos raster en una carpeta y subcarpetas.
     Es robusta ante errores de proyección.
+    Si se indica 'ruta_indice' (archivo SQLite) se reutiliza el escaneo anterior:
+    solo se abren con GDAL los archivos nuevos o modificados (tamaño/mtime).
     """
+    with metricas.etapa("scan", archivo=ruta_carpeta) as evento:
+        lista_resultados = _inspeccionar_carpeta(ruta_carpeta, extensiones_validas, ruta_indice)
+        evento["archivos"] = len(lista_resultados)
+    return lista_resultados
+
+def _inspeccionar_carpeta(ruta_carpeta, extensiones_validas, ruta_indice):
+    """Cuerpo de inspeccionar_carpeta (separado para poder medirlo como etapa 'scan')."""
     lista_resultados = []
     ruta_carpeta = os.path.normpath(ruta_carpeta)
 
-    print(f"🔍 Buscando en: {ruta_carpeta} ...") 
+    _log(f"🔍 Buscando en: {ruta_carpeta} ...") 
+
+    conn = _abrir_indice(ruta_indice) if ruta_indice else None
+    rutas_vistas = set()
+    reabiertos = 0
+
+    try:
+        for raiz, _, archivos in os.walk(ruta_carpeta):
+            for nombre_archivo in archivos:
+                ruta_completa = os.path.join(raiz, nombre_archivo)
+                rutas_vistas.add(ruta_completa)
+                
+                # Filtro opcional por extensión
+                if extensiones_validas:
+                    _, ext = os.path.splitext(nombre_archivo)
+                    if ext.lower() not in extensiones_validas:
+                        continue
+
+                if conn is None:
+                    ficha = _leer_cabecera(ruta_completa)
+                else:
+                    try:
+                        st = os.stat(ruta_completa)
+                    except OSError:
+                        continue
+                    encontrado, ficha = _consultar_indice(conn, ruta_completa, st.st_size, st.st_mtime_ns)
+                    if not encontrado:
+                        ficha = _leer_cabecera(ruta_completa)
+                        _guardar_en_indice(conn, ruta_completa, st.st_size, st.st_mtime_ns, ficha)
+                        reabiertos += 1
+                
+                if ficha is not None:
+                    lista_resultados.append(_ficha_a_resultado(nombre_archivo, ruta_completa, ficha))
 
-    for raiz, _, archivos in os.walk(ruta_carpeta):
-        for nombre_archivo in archivos:
+        if conn is not None:
+            _purgar_indice(conn, ruta_carpeta, rutas_vistas)
+            _guardar_registro_crs(conn)
+            conn.commit()
+            _log(f"   🗂️  Índice: {reabiertos} archivos nuevos o modificados (resto servido desde caché).")
+    finally:
+        if conn is not None:
+            conn.close()
             
+    return lista_resultados
+
+def _recorrer_scandir(ruta_carpeta):
+    """Recorrido recursivo con os.scandir (más barato que os.walk). Devuelve (nombre, ruta)."""
+    pila = [ruta_carpeta]
+    while pila:
+        carpeta = pila.pop()
+        try:
+            with os.scandir(carpeta) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pila.append(entrada.path)
+                        elif entrada.is_file():
+                            yield entrada.name, entrada.path
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+def _leer_cabecera_hilo(nombre_archivo, ruta_completa):
+    """Versión para hilos: el manejador de errores de GDAL es por hilo, lo silenciamos aquí también."""
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        ficha = _leer_cabecera(ruta_completa)
+    finally:
+        gdal.PopErrorHandler()
+    return _ficha_a_resultado(nombre_archivo, ruta_completa, ficha) if ficha else None
+
+def iterar_carpeta_concurrente(ruta_carpeta, extensiones_validas=None, num_hilos=8):
+    """
+    Versión concurrente de inspeccionar_carpeta para discos lentos / unidades de red.
+    Recorre con os.scandir y abre las cabeceras en un pool de hilos acotado.
+    Es un GENERADOR: entrega cada resultado en cuanto está listo (el orden no está garantizado),
+    así el consumidor puede empezar a trabajar mientras el recorrido continúa.
+    """
+    ruta_carpeta = os.path.normpath(ruta_carpeta)
+    _log(f"🔍 Buscando (concurrente, {num_hilos} hilos) en: {ruta_carpeta} ...")
+
+    max_en_vuelo = max(1, num_hilos) * 2
+    pendientes = set()
+
+    with ThreadPoolExecutor(max_workers=max(1, num_hilos)) as executor:
+        for nombre_archivo, ruta_completa in _recorrer_scandir(ruta_carpeta):
             # Filtro opcional por extensión
             if extensiones_validas:
                 _, ext = os.path.splitext(nombre_archivo)
                 if ext.lower() not in extensiones_validas:
                     continue
 
-            ruta_completa = os.path.join(raiz, nombre_archivo)
-            
-            # Intentamos abrir sin miedo a excepciones fatales
-            ds = gdal.Open(ruta_completa)
-            
-            if ds is not None:
-                # Si GDAL lo abre (aunque tenga warnings), extraemos info
-                info_archivo = {
-                    "Nombre": nombre_archivo,
-                    "Ruta": ruta_completa,
-                    "Formato (Driver)": ds.GetDriver().LongName,
-                    "Ancho (X)": ds.RasterXSize,
-                    "Alto (Y)": ds.RasterYSize,
-                    "Bandas": ds.RasterCount,
-                    "CRS": _obtener_crs_legible(ds)
-                }
-                lista_resultados.append(info_archivo)
-                ds = None # Cerrar siempre
-            
-    return lista_resultados
+            pendientes.add(executor.submit(_leer_cabecera_hilo, nombre_archivo, ruta_completa))
+
+            # No dejamos que la cola crezca sin límite si el recorrido va más rápido que las aperturas
+            if len(pendientes) >= max_en_vuelo:
+                hechos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in hechos:
+                    resultado = futuro.result()
+                    if resultado:
+                        yield resultado
+
+        for futuro in as_completed(pendientes):
+            resultado = futuro.result()
+            if resultado:
+                yield resultado
 
 def mostrar_informe(lista_datos):
     """Muestra los resultados bonitos en consola."""
@@ -100,65 +381,285 @@ def mostrar_informe(lista_datos):
         print(f"   └─ CRS:     {item['CRS']}")
         print("-" * 40)
 
+def _datos_bandas(ds):
+    """Tipo, NoData, bloque, compresión y overviews de CADA banda (pueden no coincidir con la 1)."""
+    compresion_ds = ds.GetMetadata('IMAGE_STRUCTURE').get('COMPRESSION', 'Desconocida')
+    lista = []
+    for num_banda in range(1, ds.RasterCount + 1):
+        banda = ds.GetRasterBand(num_banda)
+        bloque_x, bloque_y = banda.GetBlockSize()
+        overviews = [(banda.GetOverview(i).XSize, banda.GetOverview(i).YSize) for i in range(banda.GetOverviewCount())]
+        lista.append({
+            "banda": num_banda,
+            "tipo_dato": gdal.GetDataTypeName(banda.DataType),
+            "nodata": banda.GetNoDataValue(),
+            "compresion": (banda.GetMetadata('IMAGE_STRUCTURE') or {}).get('COMPRESSION', compresion_ds),
+            "bloque_x": bloque_x,
+            "bloque_y": bloque_y,
+            "num_overviews": len(overviews),
+            "overviews": overviews,
+        })
+    return lista
+
+def _datos_cog(ruta_archivo):
+    """
+    Datos técnicos en bruto de un COG (números y booleanos, sin formato):
+    los usan analizar_cog (consola) y auditar_carpeta (CSV / JSON-lines).
+    Lanza RuntimeError si GDAL no puede abrir el archivo.
+    """
+    ds = gdal.Open(ruta_archivo)
+    if not ds:
+        raise RuntimeError(gdal.GetLastErrorMsg() or "GDAL no puede abrir el archivo")
+
+    banda = ds.GetRasterBand(1)
+    bloque_x, bloque_y = banda.GetBlockSize()
+    overviews = []
+    for i in range(banda.GetOverviewCount()):
+        ov = banda.GetOverview(i)
+        overviews.append((ov.XSize, ov.YSize))
+
+    datos = {
+        "ancho": ds.RasterXSize,
+        "alto": ds.RasterYSize,
+        "bandas": ds.RasterCount,
+        "tipo_dato": gdal.GetDataTypeName(banda.DataType),
+        "compresion": ds.GetMetadata('IMAGE_STRUCTURE').get('COMPRESSION', 'Desconocida'),
+        "bloque_x": bloque_x,
+        "bloque_y": bloque_y,
+        "tiled": bloque_x != ds.RasterXSize,
+        "num_overviews": len(overviews),
+        "overviews": overviews,
+        "lista_bandas": _datos_bandas(ds),
+    }
+    datos["tipos_bandas"] = ";".join(b["tipo_dato"] for b in datos["lista_bandas"])
+    ds = None
+
+    # Estructura interna (sin GDAL, solo los IFD)
+    informe = estructura_tiff.auditar_estructura(ruta_archivo)
+    datos["cumple_cog"] = informe["es_cog"] if informe else None
+    datos["problemas_cog"] = informe["errores"] if informe else ["No se pudo leer la estructura"]
+    return datos
+
 def analizar_cog(ruta_archivo):
     """
     Auditoría técnica profunda de un archivo COG.
-    Incluye Bit Depth, Overviews y Tiling.
+    Incluye Bit Depth, Overviews y Tiling, y si la estructura cumple COG (estructura_tiff).
     """
     try:
-        ds = gdal.Open(ruta_archivo)
-        if not ds:
-            return None
+        datos = _datos_cog(ruta_archivo)
+    except Exception as e:
+        _log(f"Error analizando {ruta_archivo}: {e}")
+        return None
 
-        # Metadatos básicos
-        compresion = ds.GetMetadata('IMAGE_STRUCTURE').get('COMPRESSION', 'Desconocida')
-        banda = ds.GetRasterBand(1)
-        
-        # --- BIT DEPTH ---
-        tipo_dato_codigo = banda.DataType
-        tipo_dato_texto = gdal.GetDataTypeName(tipo_dato_codigo)
-        # -----------------
+    if datos["cumple_cog"] is None:
+        cumple = "❓ No se pudo leer la estructura"
+    elif datos["cumple_cog"]:
+        cumple = "✅ SÍ"
+    else:
+        cumple = f"❌ NO ({datos['problemas_cog'][0]})"
 
-        num_overviews = banda.GetOverviewCount()
-        bloque_x, bloque_y = banda.GetBlockSize()
-        es_tiled = bloque_x != ds.RasterXSize
-        
-        info_tecnica = {
-            "Archivo": os.path.basename(ruta_archivo),
-            "Dimensiones Originales": f"{ds.RasterXSize} x {ds.RasterYSize}",
-            "Tipo de Dato": tipo_dato_texto, 
-            "Compresión": compresion,
-            "Overviews": num_overviews,
-            "Es Tiled": "✅ SÍ" if es_tiled else "❌ NO (Es Stripped)",
-            "Tamaño Bloque": f"{bloque_x}x{bloque_y}",
-            "Lista_Overviews": [] 
-        }
-        
-        # Bucle de Overviews
-        if num_overviews > 0:
-            for i in range(num_overviews):
-                ov = banda.GetOverview(i)
-                desc_ov = {
-                    "Nivel": i,
-                    "Ancho": ov.XSize,
-                    "Alto": ov.YSize
-                }
-                info_tecnica["Lista_Overviews"].append(desc_ov)
-        
-        ds = None
-        return info_tecnica
+    return {
+        "Archivo": os.path.basename(ruta_archivo),
+        "Dimensiones Originales": f"{datos['ancho']} x {datos['alto']}",
+        "Tipo de Dato": datos["tipo_dato"],
+        "Compresión": datos["compresion"],
+        "Overviews": datos["num_overviews"],
+        "Es Tiled": "✅ SÍ" if datos["tiled"] else "❌ NO (Es Stripped)",
+        "Tamaño Bloque": f"{datos['bloque_x']}x{datos['bloque_y']}",
+        "Cumple COG": cumple,
+        "Lista_Overviews": [
+            {"Nivel": i, "Ancho": ancho, "Alto": alto} for i, (ancho, alto) in enumerate(datos["overviews"])
+        ],
+        "Lista_Bandas": [
+            {"Banda": b["banda"], "Tipo de Dato": b["tipo_dato"], "NoData": b["nodata"], "Compresión": b["compresion"],
+             "Tamaño Bloque": f"{b['bloque_x']}x{b['bloque_y']}", "Overviews": b["num_overviews"]}
+            for b in datos["lista_bandas"]
+        ],
+    }
+
+# --- AUDITORÍA DE CARPETAS ---
 
+# Columnas del CSV de auditoría (en este orden)
+CAMPOS_AUDITORIA = [
+    "archivo", "ruta", "ok", "error", "ancho", "alto", "bandas", "tipo_dato", "tipos_bandas", "compresion",
+    "bloque_x", "bloque_y", "tiled", "num_overviews", "overviews", "cumple_cog", "problemas_cog", "tamano_mb",
+]
+
+def _auditar_archivo_hilo(ruta_archivo):
+    """
+    Fila de auditoría de un archivo. Nunca lanza: si falla, la fila lleva ok=False y el motivo.
+    El manejador de errores de GDAL es por hilo, lo silenciamos aquí también.
+    """
+    fila = {"archivo": os.path.basename(ruta_archivo), "ruta": ruta_archivo, "ok": False, "error": None}
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        fila.update(_datos_cog(ruta_archivo))
+        fila["ok"] = True
     except Exception as e:
-        print(f"Error analizando {ruta_archivo}: {e}")
-        return None
+        fila["error"] = str(e)
+    finally:
+        gdal.PopErrorHandler()
+    fila["tamano_mb"] = round((_tamano_archivo(ruta_archivo) or 0) / (1024 * 1024), 2)
+    return fila
+
+def _escribir_auditoria(filas, ruta_csv=None, ruta_jsonl=None):
+    """Guarda las filas en CSV (utf-8-sig, para que Excel lea los acentos) y/o JSON-lines."""
+    if ruta_csv:
+        with open(ruta_csv, "w", encoding="utf-8-sig", newline="") as f:
+            escritor = csv.DictWriter(f, fieldnames=CAMPOS_AUDITORIA, extrasaction="ignore")
+            escritor.writeheader()
+            for fila in filas:  # 'lista_bandas' solo va al JSON-lines (en el CSV, 'tipos_bandas')
+                plana = dict(fila)
+                plana["overviews"] = ";".join(f"{a}x{b}" for a, b in fila.get("overviews") or [])
+                plana["problemas_cog"] = " | ".join(fila.get("problemas_cog") or [])
+                escritor.writerow(plana)
+    if ruta_jsonl:
+        with open(ruta_jsonl, "w", encoding="utf-8") as f:
+            for fila in filas:
+                f.write(json.dumps(fila, ensure_ascii=False) + "\n")
+
+def auditar_carpeta(carpeta, num_workers=8, ruta_csv=None, ruta_jsonl=None, extensiones_validas=None, recursivo=False):
+    """
+    Audita todos los COG de una carpeta en un pool de hilos (GDAL libera el GIL al leer).
+    Devuelve una fila por archivo, ordenadas por ruta; los fallos no paran la auditoría,
+    quedan como filas con ok=False. Opcionalmente las guarda en CSV y/o JSON-lines.
+    """
+    extensiones_validas = extensiones_validas or ['.tif', '.tiff']
+    if recursivo:
+        rutas = [ruta for _, ruta in _recorrer_scandir(carpeta)]
+    else:
+        rutas = [os.path.join(carpeta, nombre) for nombre in os.listdir(carpeta)]
+    rutas = sorted(r for r in rutas if os.path.splitext(r)[1].lower() in extensiones_validas and os.path.isfile(r))
+
+    _log(f"🕵️  Auditando {len(rutas)} archivos en {carpeta} ({num_workers} hilos)...")
+    with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+        filas = list(executor.map(_auditar_archivo_hilo, rutas))
+
+    _escribir_auditoria(filas, ruta_csv, ruta_jsonl)
+    return filas
+
+def mostrar_auditoria(filas, detalle=True):
+    """Informe en consola: detalle por archivo (opcional) y resumen con los archivos a revisar."""
+    if detalle:
+        for fila in filas:
+            print(f"  📂 Archivo: {fila['archivo']}")
+            if not fila["ok"]:
+                print(f"   └─ ❌ Error: {fila['error']}")
+                print("-" * 40)
+                continue
+            print(f"   ├─ Dimensiones Originales: {fila['ancho']} x {fila['alto']}")
+            print(f"   ├─ Tipo de Dato: {fila['tipo_dato']}")
+            print(f"   ├─ Compresión: {fila['compresion']}")
+            print(f"   ├─ Es Tiled: {'✅ SÍ' if fila['tiled'] else '❌ NO (Es Stripped)'}")
+            print(f"   ├─ Tamaño Bloque: {fila['bloque_x']}x{fila['bloque_y']}")
+            print(f"   ├─ Cumple COG: {'✅ SÍ' if fila['cumple_cog'] else '❌ NO'}")
+            if fila["bandas"] > 1:
+                print(f"   ├─ Bandas: {fila['bandas']}")
+                for b in fila["lista_bandas"]:
+                    print(f"   │   ├─ Banda {b['banda']}: {b['tipo_dato']} | NoData: {b['nodata']} | "
+                          f"{b['compresion']} | Bloque {b['bloque_x']}x{b['bloque_y']} | Overviews: {b['num_overviews']}")
+            print("   └─ Overviews:")
+            if fila["overviews"]:
+                for i, (ancho, alto) in enumerate(fila["overviews"]):
+                    simbolo = "└─" if i == len(fila["overviews"]) - 1 else "├─"
+                    print(f"       {simbolo} Nivel {i}: {ancho}x{alto} px")
+            else:
+                print("       ⚠️ CRÍTICO: No tiene pirámides de zoom.")
+            print("-" * 40)
+
+    fallos = [f for f in filas if not f["ok"]]
+    sin_overviews = [f for f in filas if f["ok"] and f["num_overviews"] == 0]
+    stripped = [f for f in filas if f["ok"] and not f["tiled"]]
+    no_cog = [f for f in filas if f["ok"] and f["cumple_cog"] is False]
+
+    print("\n" + "="*50)
+    print(f"📊 Informe de calidad: {len(filas)} archivos | Fallos: {len(fallos)} | Sin overviews: {len(sin_overviews)} "
+          f"| Stripped: {len(stripped)} | No COG: {len(no_cog)}")
+    for titulo, lista in (("❌ No se pudieron abrir", fallos), ("⚠️  Sin overviews", sin_overviews),
+                          ("⚠️  Stripped (sin teselas)", stripped), ("❌ Estructura no COG", no_cog)):
+        if lista:
+            print(f"   {titulo}:")
+            for fila in lista:
+                motivo = fila["error"] if not fila["ok"] else " | ".join(fila.get("problemas_cog") or [])
+                print(f"      - {fila['archivo']}" + (f": {motivo}" if titulo.startswith("❌") else ""))
+    print("="*50 + "\n")
 
 # --- FUNCIONES DE CONVERSIÓN Y RAT ---
 
-def convertir_a_cog(ruta_entrada, carpeta_destino):
+# Sufijo de los COG a medio escribir. Solo se renombran a su nombre final cuando están completos.
+SUFIJO_PARCIAL = ".parcial"
+# Carpeta de teselas de rasterizar_por_teselas, junto al '.parcial' de su COG
+SUFIJO_TESELAS = SUFIJO_PARCIAL + "_teselas"
+
+def _ruta_parcial(ruta_final):
+    """'x_COG.tif' -> 'x_COG.tif.parcial' (nombre temporal mientras se escribe)."""
+    return ruta_final + SUFIJO_PARCIAL
+
+def _publicar_salida(ruta_parcial, ruta_final):
+    """
+    Mueve el COG terminado (y su .aux.xml, donde GTiff guarda la RAT) a su nombre final.
+    os.replace es atómico dentro del mismo disco: o está el archivo viejo o el nuevo completo.
+    """
+    aux_parcial, aux_final = ruta_parcial + ".aux.xml", ruta_final + ".aux.xml"
+    if os.path.exists(aux_parcial):
+        os.replace(aux_parcial, aux_final)
+    elif os.path.exists(aux_final):
+        os.remove(aux_final)  # El .aux.xml de una versión anterior ya no corresponde
+    os.replace(ruta_parcial, ruta_final)
+
+def _borrar_parcial(ruta_parcial):
+    """Borra lo que quede de una escritura fallida o interrumpida."""
+    for ruta in (ruta_parcial, ruta_parcial + ".aux.xml"):
+        try:
+            if os.path.exists(ruta):
+                os.remove(ruta)
+        except OSError:
+            pass
+
+def limpiar_parciales(carpeta_destino):
+    """
+    Borra los '.parcial' (y las carpetas '.parcial_teselas') que haya dejado una ejecución
+    interrumpida. Devuelve cuántos había.
+    """
+    borrados = 0
+    try:
+        nombres = os.listdir(carpeta_destino)
+    except OSError:
+        return 0
+    for nombre in nombres:
+        ruta = os.path.join(carpeta_destino, nombre)
+        if nombre.endswith(SUFIJO_PARCIAL):
+            _borrar_parcial(ruta)
+            borrados += 1
+        elif nombre.endswith(SUFIJO_TESELAS) and os.path.isdir(ruta):
+            shutil.rmtree(ruta, ignore_errors=True)
+            borrados += 1
+    return borrados
+
+def _translate_medido(ruta_final, origen, ruta_entrada, **opciones):
+    """
+    gdal.Translate medido como etapa 'translate' (tiempo, bytes, píxeles) y con
+    callback de progreso (MB/s, ETA). Devuelve True si se escribió la salida.
+    """
+    bytes_entrada = _tamano_archivo(ruta_entrada)
+    opciones["callback"] = metricas.callback_progreso("translate", ruta_entrada, bytes_entrada, VERBOSE)
+
+    with metricas.etapa("translate", archivo=ruta_entrada, bytes_entrada=bytes_entrada) as evento:
+        ds = gdal.Translate(ruta_final, origen, options=gdal.TranslateOptions(**opciones))
+        evento["ok"] = ds is not None
+        if ds is not None:
+            evento["pixeles"] = ds.RasterXSize * ds.RasterYSize * ds.RasterCount
+        ds = None # Cerrar para guardar en disco
+        evento["bytes_salida"] = _tamano_archivo(ruta_final)
+    return evento["ok"]
+
+def convertir_a_cog(ruta_entrada, carpeta_destino, compresion=None):
     """
     Versión SIMPLE de conversión (sin tabla).
     Mantengo esta función porque estaba en tu archivo original.
+    compresion="auto" elige codec/predictor probando muestras del raster.
     """
+    ruta_parcial = None
     try:
         if not os.path.exists(carpeta_destino):
             os.makedirs(carpeta_destino)
@@ -168,50 +669,543 @@ def convertir_a_cog(ruta_entrada, carpeta_destino):
         nombre_cog = f"{nombre_sin_ext}_COG.tif"
         ruta_final = os.path.join(carpeta_destino, nombre_cog)
         
-        print(f"⚙️ Procesando (Simple): {nombre_archivo}")
+        _log(f"⚙️ Procesando (Simple): {nombre_archivo}")
+        
+        opciones_creacion, metadatos = _resolver_compresion(ruta_entrada, compresion, [
+            "COMPRESS=LZW",
+            "PREDICTOR=2",
+            "OVERVIEWS=IGNORE_EXISTING"
+        ])
         
-        mis_opciones = gdal.TranslateOptions(
+        ruta_parcial = _ruta_parcial(ruta_final)
+        if not _translate_medido(
+            ruta_parcial, ruta_entrada, ruta_entrada,
             format="COG",
             outputSRS="EPSG:25831",
-            creationOptions=[
-                "COMPRESS=LZW",
-                "PREDICTOR=2",
-                "OVERVIEWS=IGNORE_EXISTING"
-            ]
-        )
-        
-        ds = gdal.Translate(ruta_final, ruta_entrada, options=mis_opciones)
-        ds = None
+            creationOptions=opciones_creacion,
+            metadataOptions=metadatos
+        ):
+            return None
+        _publicar_salida(ruta_parcial, ruta_final)
         return ruta_final
 
     except Exception as e:
-        print(f"❌ Error convirtiendo: {e}")
+        _log(f"❌ Error convirtiendo: {e}")
+        return None
+    finally:
+        if ruta_parcial:
+            _borrar_parcial(ruta_parcial)
+
+# Rango máximo (max - min) para contar con bincount. Por encima usamos np.unique.
+MAX_RANGO_BINCOUNT = 1 << 24
+
+# Por encima de 2^53 un flotante siempre "parece" entero (ya no tiene decimales que perder):
+# valores así suelen ser rellenos sin declarar (±3.4e38) y no se cuentan como enteros.
+MAX_ENTERO_FLOTANTE = 1 << 53
+
+def _iterar_filas_bloques(banda):
+    """
+    Recorre la banda por filas de bloques nativos (ancho completo x alto de bloque).
+    Devuelve (y, array). La memoria máxima es una fila de bloques.
+    """
+    _, bloque_y = banda.GetBlockSize()
+    bloque_y = max(1, bloque_y)
+    ancho, alto = banda.XSize, banda.YSize
+    for y in range(0, alto, bloque_y):
+        filas = min(bloque_y, alto - y)
+        yield y, banda.ReadAsArray(0, y, ancho, filas)
+
+def _contar_nan(array, nodata):
+    """NaN que NO son el NoData declarado (en flotantes sin NoData, o con otro NoData)."""
+    if array.dtype.kind != 'f' or (nodata is not None and np.isnan(nodata)):
+        return 0
+    return int(np.count_nonzero(np.isnan(array)))
+
+def _valores_validos(array, nodata):
+    """Aplana el bloque quitando el NoData (y los NaN en flotantes)."""
+    valores = array.ravel()
+    if nodata is not None:
+        if np.isnan(nodata):
+            return valores[~np.isnan(valores)]
+        valores = valores[valores != nodata]
+    if valores.dtype.kind == 'f':
+        valores = valores[~np.isnan(valores)]
+    return valores
+
+class _AcumuladorHistograma:
+    """
+    Histograma exacto que se va completando bloque a bloque (bincount sobre un rango que crece).
+    Permite llevar varios a la vez, uno por banda, sobre la MISMA lectura.
+    """
+
+    def __init__(self):
+        self.conteos = None   # Array acumulado: conteos[i] -> píxeles con valor (base + i)
+        self.base = 0
+        self.extra = None     # Respaldo {valor: conteo} con np.unique si el rango es enorme (Int32/UInt32)
+        self.nans = 0         # Píxeles NaN no declarados como NoData (se excluyen, pero hay que saberlo)
+
+    def anadir(self, valores):
+        """
+        Suma los valores válidos de un bloque. Devuelve False si hay flotantes no enteros
+        o valores que no caben en un int64 sin perder exactitud.
+        """
+        if valores.size == 0:
+            return True
+        if valores.dtype.kind == 'f':
+            # Solo contamos flotantes si TODOS los valores son enteros exactos
+            if not (np.isfinite(valores).all() and np.array_equal(valores, np.trunc(valores))):
+                return False
+            if np.abs(valores).max() > MAX_ENTERO_FLOTANTE:
+                return False
+        elif valores.dtype.kind == 'u' and valores.dtype.itemsize == 8:
+            if valores.max() > np.iinfo(np.int64).max:
+                return False
+        valores = valores.astype(np.int64, copy=False)
+        vmin, vmax = int(valores.min()), int(valores.max())
+        conteos, base = self.conteos, self.base
+
+        if self.extra is None:
+            nueva_base = vmin if conteos is None else min(base, vmin)
+            nuevo_tope = vmax if conteos is None else max(base + len(conteos) - 1, vmax)
+            if nuevo_tope - nueva_base > MAX_RANGO_BINCOUNT:
+                # Rango demasiado grande para bincount: pasamos al respaldo
+                self.extra = {}
+                if conteos is not None:
+                    for i in np.flatnonzero(conteos).tolist():
+                        self.extra[base + i] = int(conteos[i])
+                    self.conteos = None
+
+        if self.extra is not None:
+            unicos, cuentas = np.unique(valores, return_counts=True)
+            for v, c in zip(unicos.tolist(), cuentas.tolist()):
+                self.extra[v] = self.extra.get(v, 0) + c
+            return True
+
+        if conteos is None or nueva_base != base or nuevo_tope != base + len(conteos) - 1:
+            # Creamos / ampliamos el acumulador para cubrir el nuevo rango
+            nuevo = np.zeros(nuevo_tope - nueva_base + 1, dtype=np.int64)
+            if conteos is not None:
+                nuevo[base - nueva_base:base - nueva_base + len(conteos)] = conteos
+            self.base, self.conteos = nueva_base, nuevo
+
+        parcial = np.bincount(valores - vmin)
+        self.conteos[vmin - self.base:vmin - self.base + len(parcial)] += parcial
+        return True
+
+    def resultado(self):
+        """Diccionario del histograma (ver calcular_histograma_exacto), o None si no hubo píxeles válidos."""
+        if self.extra:
+            valores_finales = np.array(sorted(self.extra), dtype=np.int64)
+            conteos_finales = np.array([self.extra[v] for v in valores_finales.tolist()], dtype=np.int64)
+        elif self.conteos is not None:
+            indices = np.flatnonzero(self.conteos)
+            valores_finales = indices.astype(np.int64) + self.base
+            conteos_finales = self.conteos[indices]
+        else:
+            return None
+        stats = _diccionario_histograma(valores_finales, conteos_finales)
+        stats["nans"] = self.nans
+        return stats
+
+def _diccionario_histograma(valores, conteos):
+    """Diccionario de histograma a partir de valores (ordenados) y conteos (sin ceros)."""
+    # Media y desviación exactas a partir de los conteos (sin releer el raster)
+    total = int(conteos.sum())
+    media = float((valores * conteos).sum(dtype=np.float64) / total)
+    varianza = float((conteos * (valores - media) ** 2).sum(dtype=np.float64) / total)
+
+    return {
+        "min": int(valores[0]),
+        "max": int(valores[-1]),
+        "valores": valores,
+        "conteos": conteos,
+        "total": total,
+        "media": media,
+        "desviacion": varianza ** 0.5,
+    }
+
+def calcular_histograma_exacto(banda):
+    """
+    Histograma EXACTO de una banda entera en UNA sola lectura por bloques.
+    Sustituye a ComputeStatistics + ComputeRasterMinMax + GetHistogram (3 lecturas).
+    Excluye el NoData. Devuelve None si no hay píxeles válidos, o un diccionario:
+    { 'min', 'max', 'valores', 'conteos', 'total', 'media', 'desviacion', 'nans' }
+    'nans' cuenta los NaN que no son el NoData declarado (no entran en los conteos).
+    En bandas flotantes también devuelve None en cuanto aparece un valor no entero.
+    """
+    nodata = banda.GetNoDataValue()
+    acumulador = _AcumuladorHistograma()
+    for _, array in _iterar_filas_bloques(banda):
+        acumulador.nans += _contar_nan(array, nodata)
+        if not acumulador.anadir(_valores_validos(array, nodata)):
+            return None
+    return acumulador.resultado()
+
+def _iterar_filas_bloques_dataset(ds):
+    """
+    Como _iterar_filas_bloques pero leyendo TODAS las bandas a la vez (ds.ReadAsArray):
+    en un TIFF pixel-interleaved cada bloque se lee y descomprime una sola vez.
+    Devuelve (y, array de forma (bandas, filas, ancho)).
+    """
+    _, bloque_y = ds.GetRasterBand(1).GetBlockSize()
+    bloque_y = max(1, bloque_y)
+    ancho, alto = ds.RasterXSize, ds.RasterYSize
+    for y in range(0, alto, bloque_y):
+        filas = min(bloque_y, alto - y)
+        array = ds.ReadAsArray(0, y, ancho, filas)
+        yield y, array.reshape(ds.RasterCount, filas, ancho)
+
+def calcular_histogramas_bandas(ds):
+    """
+    Histograma exacto de CADA banda con una sola lectura entrelazada del dataset.
+    Devuelve una lista (una entrada por banda) de diccionarios como calcular_histograma_exacto,
+    o None en las bandas sin píxeles válidos o flotantes con decimales.
+    """
+    nodatas = [ds.GetRasterBand(b).GetNoDataValue() for b in range(1, ds.RasterCount + 1)]
+    acumuladores = [_AcumuladorHistograma() for _ in nodatas]
+
+    for _, array in _iterar_filas_bloques_dataset(ds):
+        for i, acumulador in enumerate(acumuladores):
+            if acumulador is None:
+                continue
+            acumulador.nans += _contar_nan(array[i], nodatas[i])
+            if not acumulador.anadir(_valores_validos(array[i], nodatas[i])):
+                acumuladores[i] = None
+        if all(a is None for a in acumuladores):
+            break
+
+    return [a.resultado() if a is not None else None for a in acumuladores]
+
+# --- ESTADÍSTICAS YA CALCULADAS (PAM / .aux.xml) ---
+# Muchos rásters llegan con un .aux.xml que ya trae el histograma completo (no aproximado).
+# Si es fiable, de él salen los conteos exactos por valor sin leer ni un píxel.
+# En bandas flotantes solo se reutilizan min/max/media/desviación: el histograma no demuestra
+# que todos los valores sean enteros, así que la RAT (y la reducción de tipo) sí releen la banda.
+
+def _metadatos_pam(elem_banda):
+    """{clave: texto} de los <MDI> del dominio por defecto de una <PAMRasterBand>."""
+    metadatos = {}
+    for md in elem_banda.findall("Metadata"):
+        if md.get("domain"):
+            continue
+        for mdi in md.findall("MDI"):
+            metadatos[mdi.get("key")] = (mdi.text or "").strip()
+    return metadatos
+
+def _flotante_pam(metadatos, clave):
+    try:
+        return float(metadatos[clave])
+    except (KeyError, ValueError):
+        return None
+
+def _conteos_desde_cubetas(hist_min, hist_max, conteos_cubetas, posicion):
+    """
+    Asigna cada entero de [hist_min, hist_max] a su cubeta con la fórmula 'posicion'.
+    Devuelve (valores, conteos) si cada entero cae en una cubeta distinta y todas las
+    cubetas con píxeles quedan cubiertas; si no, None (la cubeta mezcla varios valores).
+    """
+    valores = np.arange(int(np.ceil(hist_min)), int(np.floor(hist_max)) + 1, dtype=np.int64)
+    if valores.size == 0:
+        return None
+    indices = np.clip(posicion(valores), 0, len(conteos_cubetas) - 1)
+    if len(np.unique(indices)) != len(indices):
+        return None
+    conteos = conteos_cubetas[indices]
+    if int(conteos.sum()) != int(conteos_cubetas.sum()):
+        return None
+    usados = conteos > 0
+    return valores[usados], conteos[usados]
+
+def _estadisticas_exactas(metadatos):
+    """Los STATISTICS_* del .aux.xml se calcularon sobre todos los píxeles (ni aproximados ni diezmados)."""
+    if metadatos.get("STATISTICS_APPROXIMATE", "").upper() == "YES":
+        return False
+    for clave in ("STATISTICS_SKIPFACTORX", "STATISTICS_SKIPFACTORY"):
+        if _flotante_pam(metadatos, clave) not in (None, 1.0):
+            return False
+    return True
+
+def _estadisticas_pam(elem_banda, ancho, alto):
+    """
+    Solo min/max/media/desviación (sin 'valores'/'conteos') de una <PAMRasterBand>, o None
+    si faltan o no son exactas. Basta para SetStatistics y evitar STATISTICS=YES.
+    """
+    metadatos = _metadatos_pam(elem_banda)
+    if not _estadisticas_exactas(metadatos):
+        return None
+    valores = [_flotante_pam(metadatos, f"STATISTICS_{clave}") for clave in ("MINIMUM", "MAXIMUM", "MEAN", "STDDEV")]
+    if any(v is None or np.isnan(v) for v in valores) or valores[0] > valores[1]:
+        return None
+    cuenta = _flotante_pam(metadatos, "STATISTICS_COUNT")
+    if cuenta is not None and cuenta > ancho * alto:
+        return None  # Calculadas sobre otro raster (más grande)
+    return {"min": valores[0], "max": valores[1], "media": valores[2], "desviacion": valores[3]}
+
+def _histograma_pam(elem_banda, ancho, alto, nodata):
+    """
+    Histograma exacto (como calcular_histograma_exacto) de una <PAMRasterBand>, o None si no es fiable:
+    tiene que ser no aproximado, con cubetas de anchura <= 1 (un entero por cubeta), sumar
+    exactamente STATISTICS_COUNT (o VALID_PERCENT) y cuadrar con STATISTICS_MIN/MAX/MEAN.
+    GDAL y ArcGIS reparten las cubetas de forma distinta; se prueban las dos y se
+    descarta el histograma si no queda una única lectura coherente.
+    """
+    metadatos = _metadatos_pam(elem_banda)
+    if not _estadisticas_exactas(metadatos):
+        return None
+
+    for item in elem_banda.findall("Histograms/HistItem"):
+        try:
+            if item.findtext("Approximate", "1").strip() != "0":
+                continue
+            hist_min = float(item.findtext("HistMin"))
+            hist_max = float(item.findtext("HistMax"))
+            conteos_cubetas = np.array([int(c) for c in item.findtext("HistCounts").split("|")], dtype=np.int64)
+        except (TypeError, ValueError):
+            continue
+        n = len(conteos_cubetas)
+        if n == 0 or int(item.findtext("BucketCount", str(n))) != n or hist_max <= hist_min:
+            continue
+        if (hist_max - hist_min) / n > 1:
+            continue
+
+        total = int(conteos_cubetas.sum())
+        cuenta = _flotante_pam(metadatos, "STATISTICS_COUNT")
+        porcentaje = _flotante_pam(metadatos, "STATISTICS_VALID_PERCENT")
+        if total == 0 or total > ancho * alto:
+            continue
+        if cuenta is not None and int(cuenta) != total:
+            continue
+        if cuenta is None and porcentaje is not None and abs(porcentaje / 100 * ancho * alto - total) > ancho * alto * 1e-4:
+            continue
+
+        candidatos = []
+        for posicion in (
+            lambda v: np.floor((v - hist_min) * n / (hist_max - hist_min)).astype(np.int64),        # GDAL
+            lambda v: np.floor((v - hist_min) * (n - 1) / (hist_max - hist_min)).astype(np.int64),  # ArcGIS
+        ):
+            conteos = _conteos_desde_cubetas(hist_min, hist_max, conteos_cubetas, posicion)
+            if conteos is None:
+                continue
+            stats = _diccionario_histograma(*conteos)
+            if nodata is not None and nodata in stats["valores"].tolist():
+                continue  # Histograma calculado sin el NoData actual: caducado
+            if not _cuadra_con_metadatos(stats, metadatos):
+                continue
+            if not any(np.array_equal(stats["valores"], c["valores"]) and np.array_equal(stats["conteos"], c["conteos"])
+                       for c in candidatos):
+                candidatos.append(stats)
+        if len(candidatos) == 1:
+            return candidatos[0]
+    return None
+
+def _cuadra_con_metadatos(stats, metadatos):
+    """El histograma derivado reproduce los STATISTICS_* que traiga el .aux.xml."""
+    minimo = _flotante_pam(metadatos, "STATISTICS_MINIMUM")
+    maximo = _flotante_pam(metadatos, "STATISTICS_MAXIMUM")
+    media = _flotante_pam(metadatos, "STATISTICS_MEAN")
+    if minimo is not None and minimo != stats["min"]:
+        return False
+    if maximo is not None and maximo != stats["max"]:
+        return False
+    if media is not None and abs(media - stats["media"]) > 1e-6 * max(1.0, abs(media)):
+        return False
+    return True
+
+def leer_estadisticas_pam(ruta_raster, ds):
+    """
+    Reutiliza el histograma del '<ruta_raster>.aux.xml' si es fiable. 'ds' es el dataset
+    que se va a procesar (el propio raster o un VRT sobre él): da dimensiones, tipos y NoData.
+    Devuelve una lista (una entrada por banda) de diccionarios como calcular_histograma_exacto.
+    En bandas flotantes (o enteras sin histograma exacto) el diccionario solo trae
+    min/max/media/desviación, sin 'valores': vale para las estadísticas pero la RAT
+    relee la banda. None donde no hay nada fiable, o si el .aux.xml es más antiguo
+    que el raster (editado después de calcular las estadísticas).
+    """
+    sin_datos = [None] * ds.RasterCount
+    ruta_aux = ruta_raster + ".aux.xml"
+    try:
+        if os.path.getmtime(ruta_aux) < os.path.getmtime(ruta_raster):
+            _log("   ℹ️  El .aux.xml es más antiguo que el raster. Se recalculan las estadísticas.")
+            return sin_datos
+        raiz = ElementTree.parse(ruta_aux).getroot()
+    except (OSError, ElementTree.ParseError):
+        return sin_datos
+
+    resultado = list(sin_datos)
+    for elem_banda in raiz.findall("PAMRasterBand"):
+        try:
+            num_banda = int(elem_banda.get("band", "0"))
+        except ValueError:
+            continue
+        if not 1 <= num_banda <= ds.RasterCount:
+            continue
+        banda = ds.GetRasterBand(num_banda)
+        stats = None
+        if banda.DataType <= 5:  # En flotantes el histograma no demuestra que los valores sean enteros
+            stats = _histograma_pam(elem_banda, ds.RasterXSize, ds.RasterYSize, banda.GetNoDataValue())
+        resultado[num_banda - 1] = stats or _estadisticas_pam(elem_banda, ds.RasterXSize, ds.RasterYSize)
+
+    histogramas = sum(s is not None and "valores" in s for s in resultado)
+    solo_estadisticas = sum(s is not None and "valores" not in s for s in resultado)
+    if histogramas:
+        _log(f"   ♻️  Histograma reutilizado del .aux.xml ({histogramas}/{ds.RasterCount} bandas). Sin escanear píxeles.")
+    if solo_estadisticas:
+        _log(f"   ♻️  Estadísticas (min/max/media/desviación) reutilizadas del .aux.xml en {solo_estadisticas} bandas.")
+    return resultado
+
+def _solo_histogramas(stats_bandas):
+    """Deja solo los histogramas completos (con 'valores'), los que sirven para la RAT."""
+    return [s if s is not None and "valores" in s else None for s in stats_bandas]
+
+def _aplicar_estadisticas(ds, stats_bandas):
+    """SetStatistics en las bandas con estadísticas conocidas. True si las tienen todas."""
+    for num_banda, stats in enumerate(stats_bandas, start=1):
+        if stats is not None:
+            ds.GetRasterBand(num_banda).SetStatistics(stats["min"], stats["max"], stats["media"], stats["desviacion"])
+    return all(s is not None for s in stats_bandas)
+
+# --- RAT POR CLASES (rásters flotantes continuos) ---
+
+# Lado máximo de la muestra (lectura diezmada) para derivar cortes de los datos
+LADO_MUESTRA_CORTES = 1024
+
+def resolver_cortes(banda, cortes):
+    """
+    Devuelve la lista ordenada de cortes [c0, c1, ..., cn] (n clases).
+    'cortes' puede ser una lista de valores o un texto que los deriva de los datos:
+      "iguales:N"   -> N intervalos iguales entre el mínimo y el máximo
+      "cuantiles:N" -> N clases con (aprox.) el mismo número de píxeles
+    Para derivarlos se lee una versión diezmada de la banda, no la resolución completa.
+    """
+    if not isinstance(cortes, str):
+        lista = sorted(float(c) for c in cortes)
+        if len(lista) < 2:
+            raise ValueError("Hacen falta al menos 2 cortes (1 clase).")
+        return lista
+
+    metodo, _, num = cortes.partition(":")
+    num_clases = int(num) if num else 5
+    if metodo not in ("iguales", "cuantiles") or num_clases < 1:
+        raise ValueError(f"Cortes no reconocidos: {cortes}")
+
+    factor = max(1, int(np.ceil(max(banda.XSize, banda.YSize) / LADO_MUESTRA_CORTES)))
+    muestra = banda.ReadAsArray(buf_xsize=max(1, banda.XSize // factor), buf_ysize=max(1, banda.YSize // factor))
+    valores = _valores_validos(muestra, banda.GetNoDataValue())
+    valores = valores[np.isfinite(valores)]
+    if valores.size == 0:
         return None
 
-def generar_inyectar_rat(ds, diccionario_datos=None):
+    if metodo == "iguales":
+        lista = np.linspace(float(valores.min()), float(valores.max()), num_clases + 1)
+    else:
+        lista = np.unique(np.quantile(valores, np.linspace(0.0, 1.0, num_clases + 1)))
+    if len(lista) < 2:
+        lista = [float(valores.min()), float(valores.max())]
+    return [float(c) for c in lista]
+
+def calcular_conteos_clases(banda, cortes):
+    """
+    Cuenta los píxeles de cada clase [c_i, c_i+1) en UNA lectura por bloques (searchsorted + bincount).
+    La primera y la última clase son abiertas: lo que cae fuera de los cortes cuenta en ellas.
+    Devuelve None si no hay píxeles válidos, o { 'conteos', 'total', 'min', 'max', 'media', 'desviacion' }.
+    """
+    nodata = banda.GetNoDataValue()
+    interiores = np.asarray(cortes[1:-1], dtype=np.float64)
+    conteos = np.zeros(len(cortes) - 1, dtype=np.int64)
+    total, media, m2 = 0, 0.0, 0.0
+    vmin, vmax = None, None
+
+    for _, array in _iterar_filas_bloques(banda):
+        valores = _valores_validos(array, nodata)
+        valores = valores[np.isfinite(valores)].astype(np.float64, copy=False)
+        if valores.size == 0:
+            continue
+
+        conteos += np.bincount(np.searchsorted(interiores, valores, side="right"), minlength=len(conteos))
+
+        # Media / varianza combinando bloques (Chan), sin acumular sumas de cuadrados enormes
+        n_b = valores.size
+        media_b = float(valores.mean())
+        m2_b = float(((valores - media_b) ** 2).sum())
+        delta = media_b - media
+        n = total + n_b
+        media += delta * n_b / n
+        m2 += m2_b + delta * delta * total * n_b / n
+        total = n
+
+        bmin, bmax = float(valores.min()), float(valores.max())
+        vmin = bmin if vmin is None else min(vmin, bmin)
+        vmax = bmax if vmax is None else max(vmax, bmax)
+
+    if total == 0:
+        return None
+    return {
+        "conteos": conteos,
+        "total": total,
+        "min": vmin,
+        "max": vmax,
+        "media": media,
+        "desviacion": (m2 / total) ** 0.5,
+    }
+
+def _crear_columnas_extra(rat, diccionario_datos):
+    """
+    Crea una columna de texto por cada campo de 'diccionario_datos' (nombres normalizados).
+    Devuelve la lista de tuplas (nombre_original, nombre_limpio), en el orden de las columnas.
+    """
+    columnas_extra_mapa = []
+    if diccionario_datos and len(diccionario_datos) > 0:
+        try:
+            # Cogemos las llaves del primer elemento
+            primer_val = next(iter(diccionario_datos.values()))
+            for raw_key in primer_val.keys():
+                # Limpiamos el nombre de la cabecera (rang_concentració -> rang_concentracio)
+                col_name_clean = normalizar_texto(raw_key)
+                rat.CreateColumn(col_name_clean, gdal.GFT_String, gdal.GFU_Generic)
+                columnas_extra_mapa.append((raw_key, col_name_clean))
+        except StopIteration:
+            pass
+    return columnas_extra_mapa
+
+def _rellenar_columnas_extra(rat, fila, primera_columna, columnas_extra_mapa, info_extra):
+    """Escribe en la fila los valores de 'info_extra' ({ 'Campo': 'Valor', ... }) usando la clave ORIGINAL."""
+    for j, (raw_key, _) in enumerate(columnas_extra_mapa):
+        rat.SetValueAsString(fila, primera_columna + j, str(info_extra.get(raw_key, "")))
+
+def generar_inyectar_rat(ds, diccionario_datos=None, stats=None, cortes_clases=None, num_banda=1):
     """
     Calcula el histograma, crea la RAT básica (Value/Count) 
     e inyecta columnas extra si vienen en 'diccionario_datos'.
     INCLUYE LIMPIEZA DE CARACTERES (UTF-8).
+    Si ya se tiene el histograma (calcular_histograma_exacto) se pasa en 'stats' y no se relee la banda.
+    En rásters flotantes, con 'cortes_clases' se crea una RAT por clases (ver generar_rat_clases).
+    'num_banda' elige la banda (para todas a la vez, ver generar_inyectar_rat_bandas).
     """
-    banda = ds.GetRasterBand(1)
+    banda = ds.GetRasterBand(num_banda)
+    if stats is not None and "valores" not in stats:
+        stats = None  # Solo estadísticas (leer_estadisticas_pam en flotantes): no valen para la RAT
     
     # 1. Comprobación de Tipo (Solo Enteros)
-    if banda.DataType > 5: 
-        print("   ⚠️  AVISO: Raster Flotante. Se omite RAT.")
+    if stats is None and banda.DataType > 5: 
+        if cortes_clases is not None:
+            return generar_rat_clases(ds, cortes_clases, diccionario_datos=diccionario_datos, num_banda=num_banda)
+        _log("   ⚠️  AVISO: Raster Flotante. Se omite RAT.")
         return False
 
-    print("   🔨 Generando Raster Attribute Table (RAT)...")
+    _log("   🔨 Generando Raster Attribute Table (RAT)..." + (f" [banda {num_banda}]" if ds.RasterCount > 1 else ""))
 
-    # 2. Calcular Histograma
+    # 2. Calcular Histograma (una sola lectura por bloques)
     try:
-        banda.ComputeStatistics(0)
-        min_val, max_val = banda.ComputeRasterMinMax(True)
-        min_val, max_val = int(min_val), int(max_val)
-        
-        hist = banda.GetHistogram(min_val - 0.5, max_val + 0.5, max_val - min_val + 1, False, False)
+        if stats is None:
+            with metricas.etapa("histogram", archivo=ds.GetDescription(), pixeles=banda.XSize * banda.YSize) as evento:
+                stats = calcular_histograma_exacto(banda)
+                evento["ok"] = stats is not None
+        if stats is None:
+            _log("   ⚠️  AVISO: La banda no tiene píxeles válidos. Se omite RAT.")
+            return False
+        banda.SetStatistics(stats["min"], stats["max"], stats["media"], stats["desviacion"])
     except Exception as e:
-        print(f"   ❌ Error calculando histograma: {e}")
+        _log(f"   ❌ Error calculando histograma: {e}")
         return False
 
     # 3. Crear la Tabla (RAT)
@@ -220,177 +1214,1002 @@ def generar_inyectar_rat(ds, diccionario_datos=None):
     rat.CreateColumn("Count", gdal.GFT_Integer, gdal.GFU_PixelCount)
     
     # --- CREAR COLUMNAS EXTRA (CON LIMPIEZA DE TEXTO) ---
-    columnas_extra_mapa = [] # Lista de tuplas (nombre_original, nombre_limpio)
-    
-    if diccionario_datos and len(diccionario_datos) > 0:
-        try:
-            # Cogemos las llaves del primer elemento
-            primer_val = next(iter(diccionario_datos.values()))
-            raw_keys = list(primer_val.keys())
-            
-            for raw_key in raw_keys:
-                # 1. Limpiamos el nombre de la cabecera (rang_concentració -> rang_concentracio)
-                col_name_clean = normalizar_texto(raw_key)
-                
-                # 2. Creamos columna
-                rat.CreateColumn(col_name_clean, gdal.GFT_String, gdal.GFU_Generic)
-                
-                # 3. Guardamos la relación para luego buscar los datos
-                columnas_extra_mapa.append((raw_key, col_name_clean))
-                
-        except StopIteration:
-            pass 
-    # ---------------------------------------------------
+    columnas_extra_mapa = _crear_columnas_extra(rat, diccionario_datos)
 
     # 4. Rellenar la tabla
     row_index = 0
     valores_inyectados = 0
     
-    for i, count in enumerate(hist):
+    for valor, count in zip(stats["valores"].tolist(), stats["conteos"].tolist()):
         if count > 0:
-            pixel_value = int(min_val + i)
+            pixel_value = int(valor)
             
             rat.SetValueAsInt(row_index, 0, pixel_value) # Col 0: Value
             rat.SetValueAsInt(row_index, 1, int(count))  # Col 1: Count
             
-            # --- RELLENAR DATOS EXTRA ---
+            # --- RELLENAR DATOS EXTRA (Offset de 2) ---
             if diccionario_datos and pixel_value in diccionario_datos:
-                info_extra = diccionario_datos[pixel_value] # { 'Campo': 'Valor', ... }
-                
-                # Iteramos sobre las columnas mapeadas
-                for j, (raw_key, _) in enumerate(columnas_extra_mapa):
-                    
-                    # Obtenemos el valor usando la clave ORIGINAL (con acentos)
-                    valor_original = str(info_extra.get(raw_key, ""))
-                    
-                    # Escribimos en la columna correspondiente (Offset de 2)
-                    idx_columna = 2 + j 
-                    rat.SetValueAsString(row_index, idx_columna, valor_original)
-            # ---------------------------
+                _rellenar_columnas_extra(rat, row_index, 2, columnas_extra_mapa, diccionario_datos[pixel_value])
             
             row_index += 1
             valores_inyectados += 1
 
     # 5. Guardar en el dataset
-    err = banda.SetDefaultRAT(rat)
+    with metricas.etapa("rat_write", archivo=ds.GetDescription(), filas=valores_inyectados) as evento:
+        err = banda.SetDefaultRAT(rat)
+        evento["ok"] = err == 0
+    if err != 0:
+        _log("   ❌ Error crítico seteando la RAT.")
+        return False
+
+    _log(f"   ✅ RAT inyectada correctamente. Filas: {valores_inyectados}. Atributos extra: {len(columnas_extra_mapa)}")
+    return True
+
+def generar_rat_clases(ds, cortes, diccionario_datos=None, num_banda=1):
+    """
+    RAT por rangos para rásters flotantes continuos: una fila por clase con
+    Clase / Min (GFU_Min) / Max (GFU_Max) / Count / Etiqueta.
+    'cortes' es una lista de valores o "iguales:N" / "cuantiles:N" (ver resolver_cortes).
+    'diccionario_datos' se indexa por número de clase (1, 2, ...).
+    No se escribe ninguna copia clasificada del raster: solo se cuentan los píxeles.
+    """
+    banda = ds.GetRasterBand(num_banda)
+    _log("   🔨 Generando RAT por clases (raster flotante)...")
+
+    try:
+        cortes = resolver_cortes(banda, cortes)
+        if cortes is None:
+            _log("   ⚠️  AVISO: La banda no tiene píxeles válidos. Se omite RAT.")
+            return False
+        with metricas.etapa("histogram", archivo=ds.GetDescription(), pixeles=banda.XSize * banda.YSize) as evento:
+            clases = calcular_conteos_clases(banda, cortes)
+            evento["ok"] = clases is not None
+        if clases is None:
+            _log("   ⚠️  AVISO: La banda no tiene píxeles válidos. Se omite RAT.")
+            return False
+        banda.SetStatistics(clases["min"], clases["max"], clases["media"], clases["desviacion"])
+    except Exception as e:
+        _log(f"   ❌ Error calculando clases: {e}")
+        return False
+
+    # Las clases extremas son abiertas: sus límites cubren todo lo que se ha contado
+    cortes[0] = min(cortes[0], clases["min"])
+    cortes[-1] = max(cortes[-1], clases["max"])
+
+    rat = gdal.RasterAttributeTable()
+    if hasattr(rat, "SetTableType"):
+        rat.SetTableType(gdal.GRTT_ATHEMATIC)
+    rat.CreateColumn("Clase", gdal.GFT_Integer, gdal.GFU_Generic)
+    rat.CreateColumn("Min", gdal.GFT_Real, gdal.GFU_Min)
+    rat.CreateColumn("Max", gdal.GFT_Real, gdal.GFU_Max)
+    rat.CreateColumn("Count", gdal.GFT_Integer, gdal.GFU_PixelCount)
+    rat.CreateColumn("Etiqueta", gdal.GFT_String, gdal.GFU_Name)
+    columnas_extra_mapa = _crear_columnas_extra(rat, diccionario_datos)
+
+    # Todas las clases, aunque estén vacías, para que los rangos sean contiguos
+    for fila, count in enumerate(clases["conteos"].tolist()):
+        clase = fila + 1
+        rat.SetValueAsInt(fila, 0, clase)
+        rat.SetValueAsDouble(fila, 1, cortes[fila])
+        rat.SetValueAsDouble(fila, 2, cortes[fila + 1])
+        rat.SetValueAsInt(fila, 3, int(count))
+        rat.SetValueAsString(fila, 4, f"{cortes[fila]:g} - {cortes[fila + 1]:g}")
+        if diccionario_datos and clase in diccionario_datos:
+            _rellenar_columnas_extra(rat, fila, 5, columnas_extra_mapa, diccionario_datos[clase])
+
+    with metricas.etapa("rat_write", archivo=ds.GetDescription(), filas=len(clases["conteos"])) as evento:
+        err = banda.SetDefaultRAT(rat)
+        evento["ok"] = err == 0
     if err != 0:
-        print("   ❌ Error crítico seteando la RAT.")
+        _log("   ❌ Error crítico seteando la RAT.")
         return False
 
-    print(f"   ✅ RAT inyectada correctamente. Filas: {valores_inyectados}. Atributos extra: {len(columnas_extra_mapa)}")
+    _log(f"   ✅ RAT por clases inyectada. Clases: {len(clases['conteos'])}. Atributos extra: {len(columnas_extra_mapa)}")
     return True
 
+def generar_inyectar_rat_bandas(ds, diccionario_datos=None, cortes_clases=None, stats_bandas=None):
+    """
+    generar_inyectar_rat para TODAS las bandas. Los histogramas de las bandas enteras
+    (y flotantes con solo enteros) salen de una única lectura entrelazada del dataset,
+    en vez de una pasada completa por banda. Devuelve True si todas las bandas tienen RAT.
+    'stats_bandas' (p. ej. de leer_estadisticas_pam): si cubre todas las bandas enteras, no se lee el raster.
+    """
+    if stats_bandas:
+        stats_bandas = _solo_histogramas(stats_bandas)
+    if ds.RasterCount == 1:
+        return generar_inyectar_rat(ds, diccionario_datos=diccionario_datos, cortes_clases=cortes_clases,
+                                    stats=stats_bandas[0] if stats_bandas else None)
+
+    todas = stats_bandas
+    enteras = [b for b in range(1, ds.RasterCount + 1) if ds.GetRasterBand(b).DataType <= 5]
+    if not todas or any(todas[b - 1] is None for b in enteras):
+        _log(f"   🔨 Histogramas de {ds.RasterCount} bandas en una sola lectura...")
+        try:
+            with metricas.etapa("histogram", archivo=ds.GetDescription(),
+                                pixeles=ds.RasterXSize * ds.RasterYSize * ds.RasterCount) as evento:
+                todas = calcular_histogramas_bandas(ds)
+                evento["ok"] = any(s is not None for s in todas)
+        except Exception as e:
+            _log(f"   ❌ Error calculando histogramas: {e}")
+            return False
+
+    exitos = 0
+    for num_banda, stats in enumerate(todas, start=1):
+        if stats is None and ds.GetRasterBand(num_banda).DataType <= 5:
+            _log(f"   ⚠️  AVISO: La banda {num_banda} no tiene píxeles válidos. Se omite RAT.")
+            continue
+        # Las bandas flotantes con decimales (stats None) van por la RAT por clases, si se pidió
+        if generar_inyectar_rat(ds, diccionario_datos=diccionario_datos, stats=stats, cortes_clases=cortes_clases,
+                                num_banda=num_banda):
+            exitos += 1
+    return exitos == ds.RasterCount
+
 def verificar_rat(ruta_archivo):
-    """Abre el archivo y confirma que la tabla existe."""
+    """Abre el archivo y confirma que la tabla existe (en todas sus bandas)."""
+    with metricas.etapa("verify", archivo=ruta_archivo) as evento:
+        evento["ok"] = _verificar_rat(ruta_archivo)
+    return evento["ok"]
+
+def _verificar_rat(ruta_archivo):
     ds = gdal.Open(ruta_archivo, gdal.GA_ReadOnly)
     if not ds: return False
     
-    banda = ds.GetRasterBand(1)
-    rat = banda.GetDefaultRAT()
-    
-    if rat is None:
-        ds = None
-        return False
-    
-    cols = rat.GetColumnCount()
-    rows = rat.GetRowCount()
-    print(f"   🕵️  DEBUG: Tabla final -> Columnas: {cols}, Filas: {rows}")
+    correcto = True
+    for num_banda in range(1, ds.RasterCount + 1):
+        rat = ds.GetRasterBand(num_banda).GetDefaultRAT()
+        if rat is None:
+            _log(f"   🕵️  DEBUG: Banda {num_banda} sin tabla.")
+            correcto = False
+            continue
+
+        cols = rat.GetColumnCount()
+        rows = rat.GetRowCount()
+        prefijo = f"Banda {num_banda} -> " if ds.RasterCount > 1 else ""
+        _log(f"   🕵️  DEBUG: Tabla final -> {prefijo}Columnas: {cols}, Filas: {rows}")
+        correcto = correcto and cols > 0 and rows > 0
     ds = None
-    return (cols > 0 and rows > 0)
+    return correcto
+
+# --- COMPRESIÓN AUTOMÁTICA ---
+
+# Tolerancia de tamaño de cada política: entre los candidatos que no superen
+# (tamaño mínimo x tolerancia) se elige el que se decodifica más rápido.
+POLITICAS_COMPRESION = {
+    "tamano": 1.0,        # El más pequeño, sin mirar la velocidad
+    "equilibrada": 1.05,  # Hasta un 5% más grande si se lee más rápido
+    "rapida": 1.25,       # Hasta un 25% más grande si se lee más rápido
+}
+
+def _tolerancia_compresion(politica):
+    """Nombre de política o tolerancia numérica (>= 1) -> tolerancia. ValueError si no es válida."""
+    if isinstance(politica, str):
+        if politica not in POLITICAS_COMPRESION:
+            raise ValueError(f"Política de compresión no reconocida: '{politica}' "
+                             f"(válidas: {', '.join(POLITICAS_COMPRESION)} o una tolerancia numérica >= 1)")
+        return POLITICAS_COMPRESION[politica]
+    if not politica >= 1:
+        raise ValueError(f"La tolerancia de compresión debe ser >= 1: {politica}")
+    return float(politica)
+
+def _codecs_disponibles():
+    """Codecs que soporta el GTiff de esta instalación de GDAL (ZSTD no siempre está)."""
+    lista = gdal.GetDriverByName("GTiff").GetMetadataItem("DMD_CREATIONOPTIONLIST") or ""
+    return [c for c in ("LZW", "DEFLATE", "ZSTD") if c in lista]
+
+def _candidatos_compresion(tipo_dato, permitir_predictor=True):
+    """Combinaciones codec / nivel / predictor a probar según el tipo de dato."""
+    es_flotante = tipo_dato in (gdal.GDT_Float32, gdal.GDT_Float64)
+    predictores = ["1"]
+    if permitir_predictor:
+        predictores.append("3" if es_flotante else "2")
 
-def convertir_a_cog_con_tabla(ruta_entrada, carpeta_destino, inyectar_tabla=True, diccionario_datos=None):
+    codecs = _codecs_disponibles()
+    candidatos = []
+    for predictor in predictores:
+        if "LZW" in codecs:
+            candidatos.append({"COMPRESS": "LZW", "PREDICTOR": predictor})
+        if "DEFLATE" in codecs:
+            for nivel in (1, 6, 9):
+                candidatos.append({"COMPRESS": "DEFLATE", "LEVEL": nivel, "PREDICTOR": predictor})
+        if "ZSTD" in codecs:
+            for nivel in (1, 9, 15):
+                candidatos.append({"COMPRESS": "ZSTD", "LEVEL": nivel, "PREDICTOR": predictor})
+    return candidatos
+
+def _opciones_gtiff(candidato):
+    """Candidato -> opciones del driver GTiff (el nivel se llama distinto según el codec)."""
+    opciones = [f"COMPRESS={candidato['COMPRESS']}", f"PREDICTOR={candidato['PREDICTOR']}"]
+    if "LEVEL" in candidato:
+        clave = "ZSTD_LEVEL" if candidato["COMPRESS"] == "ZSTD" else "ZLEVEL"
+        opciones.append(f"{clave}={candidato['LEVEL']}")
+    return opciones
+
+def opciones_cog_de(candidato):
+    """Candidato -> opciones del driver COG."""
+    opciones = [f"COMPRESS={candidato['COMPRESS']}", f"PREDICTOR={candidato['PREDICTOR']}"]
+    if "LEVEL" in candidato:
+        opciones.append(f"LEVEL={candidato['LEVEL']}")
+    return opciones
+
+def _muestra_en_memoria(ds, num_muestras, tam_muestra):
     """
-    Función Maestra AVANZADA:
-    1. Convierte a COG (PREDICTOR=1).
-    2. Espera desbloqueo de Windows.
-    3. Abre con OpenEx (IGNORE_COG_LAYOUT_BREAK) e inyecta tabla + atributos.
+    Copia 'num_muestras' ventanas repartidas por el raster a un dataset MEM
+    (apiladas en vertical). Es lo único que se lee de la entrada.
     """
-    if not os.path.exists(carpeta_destino):
-        try: os.makedirs(carpeta_destino)
-        except: pass
-            
-    nombre_archivo = os.path.basename(ruta_entrada)
-    nombre_sin_ext = os.path.splitext(nombre_archivo)[0]
-    nombre_cog = f"{nombre_sin_ext}_COG.tif"
-    ruta_final = os.path.join(carpeta_destino, nombre_cog)
-    
-    print(f"\n⚙️  PROCESANDO: {nombre_archivo}")
+    ancho_m = min(tam_muestra, ds.RasterXSize)
+    alto_m = min(tam_muestra, ds.RasterYSize)
+    lado = max(1, int(np.ceil(np.sqrt(num_muestras))))
+    xs = np.linspace(0, ds.RasterXSize - ancho_m, lado).astype(int).tolist()
+    ys = np.linspace(0, ds.RasterYSize - alto_m, lado).astype(int).tolist()
+    posiciones = [(x, y) for y in ys for x in xs][:num_muestras]
+
+    banda_ref = ds.GetRasterBand(1)
+    mem = gdal.GetDriverByName("MEM").Create("", ancho_m, alto_m * len(posiciones), ds.RasterCount, banda_ref.DataType)
+    for b in range(1, ds.RasterCount + 1):
+        origen = ds.GetRasterBand(b)
+        destino = mem.GetRasterBand(b)
+        if origen.GetNoDataValue() is not None:
+            destino.SetNoDataValue(origen.GetNoDataValue())
+        for k, (x, y) in enumerate(posiciones):
+            destino.WriteArray(origen.ReadAsArray(x, y, ancho_m, alto_m), 0, k * alto_m)
+    return mem
+
+def elegir_compresion(ruta_entrada, politica="equilibrada", num_muestras=9, tam_muestra=512, permitir_predictor=True):
+    """
+    Prueba los codecs candidatos sobre unas cuantas ventanas del raster y devuelve el mejor
+    según la política ('tamano', 'equilibrada', 'rapida' o una tolerancia numérica).
+    Devuelve el candidato (dict) con 'BYTES_MUESTRA' y 'MS_LECTURA' añadidos, o None si falla.
+    """
+    tolerancia = _tolerancia_compresion(politica)
+    ds = gdal.Open(ruta_entrada)
+    if ds is None or ds.RasterCount == 0:
+        return None
+
+    mem = _muestra_en_memoria(ds, num_muestras, tam_muestra)
+    tipo_dato = ds.GetRasterBand(1).DataType
+    ds = None
+
+    ruta_prueba = f"/vsimem/prueba_compresion_{os.getpid()}.tif"
+    pruebas = []
+    for candidato in _candidatos_compresion(tipo_dato, permitir_predictor):
+        opciones = ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512"] + _opciones_gtiff(candidato)
+        ds_prueba = gdal.Translate(ruta_prueba, mem, options=gdal.TranslateOptions(format="GTiff", creationOptions=opciones))
+        if ds_prueba is None:
+            continue
+        ds_prueba = None
+        tamano = gdal.VSIStatL(ruta_prueba).size
+
+        # Velocidad de decodificación: mejor de 2 lecturas completas
+        tiempos = []
+        for _ in range(2):
+            inicio = time.perf_counter()
+            ds_lectura = gdal.Open(ruta_prueba)
+            ds_lectura.ReadRaster()
+            ds_lectura = None
+            tiempos.append(time.perf_counter() - inicio)
+        gdal.Unlink(ruta_prueba)
+        pruebas.append((tamano, min(tiempos), candidato))
+
+    mem = None
+    if not pruebas:
+        return None
+
+    tamano_minimo = min(p[0] for p in pruebas)
+    aceptables = [p for p in pruebas if p[0] <= tamano_minimo * tolerancia]
+    tamano, tiempo, elegido = min(aceptables, key=lambda p: (p[1], p[0]))
+
+    return dict(elegido, BYTES_MUESTRA=tamano, MS_LECTURA=round(tiempo * 1000, 2))
+
+def _politica_compresion(compresion):
+    """
+    "auto" / "auto:<politica>" -> nombre de la política o tolerancia numérica.
+    ValueError si no es modo auto o la política no existe: no hay opción de codec fijo
+    (compresion="zstd" no elige ZSTD), para eso están las opciones por defecto.
+    """
+    modo, separador, politica = str(compresion).partition(":")
+    if modo != "auto":
+        raise ValueError(f"Compresión no reconocida: {compresion!r} (usa \"auto\" o \"auto:<politica>\")")
+    if not separador:
+        politica = "equilibrada"
+    try:
+        politica = float(politica)
+    except ValueError:
+        pass
+    _tolerancia_compresion(politica)
+    return politica
+
+def _sin_opciones_codec(opciones):
+    """Quita de una lista de opciones COG las del codec (las pone elegir_compresion)."""
+    return [o for o in opciones if not o.startswith(("COMPRESS=", "PREDICTOR=", "LEVEL="))]
+
+def opciones_creacion_previstas(compresion=None, opciones_por_defecto=None):
+    """
+    Opciones de creación con las que se escribirá el COG, resueltas sin leer el raster.
+    Con compresion="auto" el codec sale de una prueba cronometrada y puede variar entre
+    ejecuciones; en su lugar se devuelven la política y los codecs que se van a probar.
+    """
+    opciones_por_defecto = OPCIONES_COG_TABLA if opciones_por_defecto is None else opciones_por_defecto
+    if not compresion:
+        return list(opciones_por_defecto)
+    return [f"COMPRESS=AUTO:{_politica_compresion(compresion)}",
+            f"CODECS={','.join(_codecs_disponibles())}"] + _sin_opciones_codec(opciones_por_defecto)
+
+def _resolver_compresion(ruta_entrada, compresion, opciones_por_defecto):
+    """
+    compresion=None -> opciones fijas de siempre.
+    compresion="auto" / "auto:<politica>" -> elegir_compresion.
+    Devuelve (opciones_creacion, metadatos) para gdal.Translate.
+    """
+    if not compresion:
+        return list(opciones_por_defecto), []
+
+    politica = _politica_compresion(compresion)
+
+    with metricas.etapa("compresion", archivo=ruta_entrada) as evento:
+        elegido = elegir_compresion(ruta_entrada, politica=politica)
+        evento["ok"] = elegido is not None
+    if elegido is None:
+        _log("   ⚠️  No se pudo evaluar la compresión. Se usan las opciones por defecto.")
+        return list(opciones_por_defecto), []
+
+    _log(f"   🗜️  Compresión elegida: {' '.join(opciones_cog_de(elegido))} "
+          f"(muestra: {elegido['BYTES_MUESTRA']} bytes, {elegido['MS_LECTURA']} ms)")
+
+    opciones = _sin_opciones_codec(opciones_por_defecto)
+    metadatos = [
+        f"COMPRESION_AUTO_POLITICA={politica}",
+        f"COMPRESION_AUTO_CODEC={elegido['COMPRESS']}",
+        f"COMPRESION_AUTO_NIVEL={elegido.get('LEVEL', '')}",
+        f"COMPRESION_AUTO_PREDICTOR={elegido['PREDICTOR']}",
+    ]
+    return opciones_cog_de(elegido) + opciones, metadatos
+
+# --- REDUCCIÓN DE TIPO (flotantes que solo contienen enteros) ---
+
+# Tipos enteros candidatos, de menor a mayor: (tipo GDAL, mínimo, máximo)
+TIPOS_ENTEROS_REDUCCION = [
+    (gdal.GDT_Byte, 0, 255),
+    (gdal.GDT_UInt16, 0, 65535),
+    (gdal.GDT_Int16, -32768, 32767),
+]
+
+def tipo_entero_minimo(stats, necesita_nodata=True):
+    """
+    Tipo entero más pequeño que contiene [min, max] del histograma, y un valor NoData
+    libre dentro de ese tipo (preferimos 0, que el visor ya pinta transparente).
+    Si el histograma tiene NaN ('nans'), siempre hace falta NoData: un entero no puede
+    representarlos y acabarían como 0, un valor real.
+    Devuelve (tipo_gdal, nodata) o None si no cabe en ninguno.
+    """
+    necesita_nodata = necesita_nodata or stats.get("nans", 0) > 0
+    usados = set(stats["valores"].tolist())
+    for tipo, minimo, maximo in TIPOS_ENTEROS_REDUCCION:
+        if stats["min"] < minimo or stats["max"] > maximo:
+            continue
+        if not necesita_nodata:
+            return tipo, None
+        for nodata in (0, maximo, minimo):
+            if nodata not in usados:
+                return tipo, nodata
+    return None
+
+def _vrt_tipo_entero(ds_origen, ruta_origen, ruta_vrt, tipo, nodata, con_nan=False):
+    """
+    VRT (en /vsimem) que lee 'ruta_origen' como entero. Con un ComplexSource con <NODATA>
+    los píxeles NoData del origen no se copian y quedan con el NoData nuevo del VRT.
+    con_nan=True: el origen tiene NaN sin NoData declarado; se tratan como NoData (<NODATA>nan).
+    """
+    banda = ds_origen.GetRasterBand(1)
+    nodata_origen = banda.GetNoDataValue()
+    if nodata_origen is None and con_nan:
+        nodata_origen = float("nan")
+    bloque_x, bloque_y = banda.GetBlockSize()
+
+    xml = [f'<VRTDataset rasterXSize="{ds_origen.RasterXSize}" rasterYSize="{ds_origen.RasterYSize}">']
+    if ds_origen.GetProjection():
+        xml.append(f"  <SRS>{escape(ds_origen.GetProjection())}</SRS>")
+    xml.append(f"  <GeoTransform>{', '.join(repr(v) for v in ds_origen.GetGeoTransform())}</GeoTransform>")
+    xml.append(f'  <VRTRasterBand dataType="{gdal.GetDataTypeName(tipo)}" band="1" blockXSize="{bloque_x}" blockYSize="{bloque_y}">')
+    if nodata is not None:
+        xml.append(f"    <NoDataValue>{nodata}</NoDataValue>")
+    xml.append("    <ComplexSource>")
+    xml.append(f'      <SourceFilename relativeToVRT="0">{escape(ruta_origen)}</SourceFilename>')
+    xml.append("      <SourceBand>1</SourceBand>")
+    if nodata_origen is not None:
+        xml.append(f"      <NODATA>{repr(float(nodata_origen))}</NODATA>")
+    xml.append("    </ComplexSource>")
+    xml.append("  </VRTRasterBand>")
+    xml.append("</VRTDataset>")
+
+    gdal.FileFromMemBuffer(ruta_vrt, "\n".join(xml))
+    return gdal.Open(ruta_vrt)
+
+def _reducir_a_entero(ds_vrt, ruta_vrt, stats_pam=None):
+    """
+    Si la banda es flotante pero TODOS sus valores válidos son enteros en un rango estrecho,
+    devuelve (ds_entero, stats): un VRT Byte/UInt16/Int16 con el NoData remapeado y el
+    histograma ya calculado (sirve para la RAT sin releer). Si no, (None, None).
+    Con las estadísticas del .aux.xml ('stats_pam') se evita la lectura completa cuando
+    ya se ve que no se puede reducir (min/max con decimales o fuera de rango). Si se puede,
+    hay que leer igualmente: el .aux.xml no demuestra que no haya decimales.
+    """
+    banda = ds_vrt.GetRasterBand(1)
+    if ds_vrt.RasterCount != 1 or banda.DataType not in (gdal.GDT_Float32, gdal.GDT_Float64):
+        return None, None
+
+    if stats_pam is not None:
+        minimo, maximo = stats_pam["min"], stats_pam["max"]
+        if minimo != int(minimo) or maximo != int(maximo):
+            _log("   ℹ️  Según el .aux.xml contiene decimales. Se mantiene el tipo flotante.")
+            return None, None
+        if not any(tipo_min <= minimo and maximo <= tipo_max for _, tipo_min, tipo_max in TIPOS_ENTEROS_REDUCCION):
+            _log("   ℹ️  Según el .aux.xml el rango es demasiado amplio para un entero pequeño. Se mantiene el tipo flotante.")
+            return None, None
+
+    _log("   🔎 Comprobando si el raster flotante solo contiene enteros...")
+    with metricas.etapa("histogram", archivo=ds_vrt.GetDescription(), pixeles=banda.XSize * banda.YSize) as evento:
+        stats = calcular_histograma_exacto(banda)
+        evento["ok"] = stats is not None
+    if stats is None:
+        _log("   ℹ️  Contiene decimales (o está vacío). Se mantiene el tipo flotante.")
+        return None, None
+
+    destino = tipo_entero_minimo(stats, necesita_nodata=banda.GetNoDataValue() is not None)  # + NaN (stats['nans'])
+    if destino is None:
+        _log("   ℹ️  Rango demasiado amplio para un entero pequeño. Se mantiene el tipo flotante.")
+        return None, None
+
+    tipo, nodata = destino
+    ds_vrt.FlushCache()  # El VRT de origen tiene que estar escrito en /vsimem
+    ruta_entero = ruta_vrt.replace(".vrt", "_entero.vrt")
+    ds_entero = _vrt_tipo_entero(ds_vrt, ruta_vrt, ruta_entero, tipo, nodata, con_nan=stats.get("nans", 0) > 0)
+    if ds_entero is None:
+        return None, None
+
+    tipo_original = gdal.GetDataTypeName(banda.DataType)
+    ds_entero.SetMetadataItem("TIPO_ORIGINAL", tipo_original)
+    ds_entero.GetRasterBand(1).SetStatistics(stats["min"], stats["max"], stats["media"], stats["desviacion"])
+    _log(f"   🔽 {tipo_original} con valores enteros {stats['min']}..{stats['max']} -> "
+         f"{gdal.GetDataTypeName(tipo)} (NoData: {nodata})")
+    return ds_entero, stats
+
+# Opciones de creación del COG "con tabla" (comunes a los dos modos)
+OPCIONES_COG_TABLA = [
+    "COMPRESS=LZW",
+    "PREDICTOR=1",  # Vital para compatibilidad con GDBs
+    "OVERVIEWS=IGNORE_EXISTING",
+    "RESAMPLING=NEAREST",  # Overviews por vecino más próximo: no inventan clases
+]
+
+def _convertir_pipeline(ruta_entrada, ruta_final, inyectar_tabla=True, diccionario_datos=None, compresion=None, reducir_tipo=False,
+                        cortes_clases=None):
+    """
+    Modo 'pipeline': calcula la RAT ANTES de escribir el COG.
+    1. Crea un VRT en memoria (/vsimem) sobre la entrada.
+       Con reducir_tipo=True, si es flotante con solo enteros, otro VRT lo pasa a Byte/UInt16/Int16.
+    2. Inyecta la RAT y las estadísticas en el VRT.
+    3. Un único gdal.Translate(format="COG") escribe el archivo final con la tabla.
+    Sin reaperturas, sin pausas y sin romper el layout del COG.
+    """
+    nombre_vrt = os.path.splitext(os.path.basename(ruta_final))[0]
+    ruta_vrt = f"/vsimem/{nombre_vrt}_{os.getpid()}.vrt"
 
+    ds_vrt = gdal.Translate(ruta_vrt, ruta_entrada, options=gdal.TranslateOptions(format="VRT", outputSRS="EPSG:25831"))
+    if ds_vrt is None:
+        _log(f"❌ Error CRÍTICO creando VRT intermedio: {gdal.GetLastErrorMsg()}")
+        return None
+
+    ds_entero = None
+    try:
+        # El .aux.xml de la entrada (si es fiable): histograma en enteros, estadísticas en flotantes
+        stats_pam = leer_estadisticas_pam(ruta_entrada, ds_vrt)
+        stats = None
+        if reducir_tipo:
+            ds_entero, stats = _reducir_a_entero(ds_vrt, ruta_vrt, stats_pam[0])
+        ds_fuente = ds_entero if ds_entero is not None else ds_vrt
+
+        stats_bandas = [stats] if ds_entero is not None else stats_pam
+        estadisticas_completas = _aplicar_estadisticas(ds_fuente, stats_bandas)
+        stats = _solo_histogramas(stats_bandas)[0]
+
+        exito_rat = False
+        if inyectar_tabla:
+            if ds_fuente.RasterCount > 1:
+                exito_rat = generar_inyectar_rat_bandas(ds_fuente, diccionario_datos=diccionario_datos,
+                                                        cortes_clases=cortes_clases, stats_bandas=stats_bandas)
+            else:
+                exito_rat = generar_inyectar_rat(ds_fuente, diccionario_datos=diccionario_datos, stats=stats,
+                                                 cortes_clases=cortes_clases)
+            if not exito_rat:
+                _log("   ⚠️  No se generó la tabla.")
+
+        # Si ya tenemos estadísticas exactas no hace falta que el driver COG las recalcule
+        opciones_creacion, metadatos = _resolver_compresion(ruta_entrada, compresion, OPCIONES_COG_TABLA)
+        if not exito_rat and not estadisticas_completas:
+            opciones_creacion.append("STATISTICS=YES")
+
+        if not _translate_medido(ruta_final, ds_fuente, ruta_entrada, format="COG",
+                                 creationOptions=opciones_creacion, metadataOptions=metadatos):
+            _log(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
+            return None
+    finally:
+        ds_fuente = ds_entero = ds_vrt = None
+        gdal.Unlink(ruta_vrt)
+        if reducir_tipo:
+            gdal.Unlink(ruta_vrt.replace(".vrt", "_entero.vrt"))
+
+    if exito_rat:
+        if verificar_rat(ruta_final):
+            _log("   ✨ ÉXITO TOTAL: COG creado y Tabla completa.")
+        else:
+            _log("   ⚠️  ALERTA: Falló la verificación de la tabla.")
+
+    return ruta_final
+
+def _convertir_reapertura(ruta_entrada, ruta_final, inyectar_tabla=True, diccionario_datos=None, compresion=None,
+                          cortes_clases=None):
+    """Modo 'reapertura' (método antiguo): COG primero y después reabrir para inyectar la tabla."""
     # 1. Configuración GDAL
-    opciones_cog = gdal.TranslateOptions(
+    opciones_creacion, metadatos = _resolver_compresion(ruta_entrada, compresion, OPCIONES_COG_TABLA)
+
+    # Con un .aux.xml fiable las estadísticas viajan con los metadatos de la entrada: no se recalculan
+    ds_entrada = gdal.Open(ruta_entrada)
+    stats_bandas = leer_estadisticas_pam(ruta_entrada, ds_entrada) if ds_entrada else [None]
+    ds_entrada = None
+    if not all(s is not None for s in stats_bandas):
+        opciones_creacion = opciones_creacion + ["STATISTICS=YES"]
+    
+    # 2. Conversión
+    exito_translate = _translate_medido(
+        ruta_final, ruta_entrada, ruta_entrada,
         format="COG",
         outputSRS="EPSG:25831", 
-        creationOptions=[
-            "COMPRESS=LZW",
-            "PREDICTOR=1",  # Vital para compatibilidad con GDBs
-            "OVERVIEWS=IGNORE_EXISTING",
-            "STATISTICS=YES"
-        ]
+        creationOptions=opciones_creacion,
+        metadataOptions=metadatos
     )
     
-    # 2. Conversión
-    ds_cog = gdal.Translate(ruta_final, ruta_entrada, options=opciones_cog)
-    
-    if ds_cog is None:
-        print(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
+    if not exito_translate:
+        _log(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
         return None
     
-    ds_cog = None # Cerrar para guardar en disco
-    
     # 3. Pausa Táctica (File Locking)
     time.sleep(1.0) 
     
     # 4. Inyección
     if inyectar_tabla:
-        print("   🔄 Reabriendo para inyección de tabla y atributos...")
+        _log("   🔄 Reabriendo para inyección de tabla y atributos...")
         
         # Usamos OpenEx para permitir editar el COG
-        ds_update = gdal.OpenEx(
-            ruta_final,
-            gdal.OF_RASTER | gdal.OF_UPDATE, 
-            open_options=["IGNORE_COG_LAYOUT_BREAK=YES"]
-        )
+        with metricas.etapa("reopen", archivo=ruta_final) as evento:
+            ds_update = gdal.OpenEx(
+                ruta_final,
+                gdal.OF_RASTER | gdal.OF_UPDATE, 
+                open_options=["IGNORE_COG_LAYOUT_BREAK=YES"]
+            )
+            evento["ok"] = ds_update is not None
         
         if ds_update:
             # Pasamos el diccionario aquí
-            exito_rat = generar_inyectar_rat(ds_update, diccionario_datos=diccionario_datos)
+            exito_rat = generar_inyectar_rat_bandas(ds_update, diccionario_datos=diccionario_datos, cortes_clases=cortes_clases,
+                                                    stats_bandas=stats_bandas)
             ds_update = None 
             
             if exito_rat:
                 if verificar_rat(ruta_final):
-                    print("   ✨ ÉXITO TOTAL: COG creado y Tabla completa.")
+                    _log("   ✨ ÉXITO TOTAL: COG creado y Tabla completa.")
                 else:
-                    print("   ⚠️  ALERTA: Falló la verificación de la tabla.")
+                    _log("   ⚠️  ALERTA: Falló la verificación de la tabla.")
             else:
-                print("   ⚠️  No se generó la tabla.")
+                _log("   ⚠️  No se generó la tabla.")
         else:
-            print(f"   ❌ Error reabriendo archivo: {gdal.GetLastErrorMsg()}")
+            _log(f"   ❌ Error reabriendo archivo: {gdal.GetLastErrorMsg()}")
 
     return ruta_final
 
-def procesar_todo_a_cog(carpeta_origen, carpeta_destino):
+def convertir_a_cog_con_tabla(ruta_entrada, carpeta_destino, inyectar_tabla=True, diccionario_datos=None, modo="pipeline",
+                              compresion=None, reducir_tipo=False, cortes_clases=None):
+    """
+    Función Maestra AVANZADA.
+    compresion="auto" (o "auto:tamano", "auto:rapida") elige codec/predictor por raster.
+    reducir_tipo=True (solo modo pipeline): los flotantes con solo valores enteros se
+    guardan como Byte/UInt16/Int16 sin pérdida, y así recuperan su RAT.
+    cortes_clases: en flotantes continuos, RAT por rangos (lista de cortes o "cuantiles:N").
+    modo="pipeline" (por defecto): la RAT se calcula antes y el COG se escribe UNA vez.
+    modo="reapertura" (método antiguo):
+    1. Convierte a COG (PREDICTOR=1).
+    2. Espera desbloqueo de Windows.
+    3. Abre con OpenEx (IGNORE_COG_LAYOUT_BREAK) e inyecta tabla + atributos.
+    En los dos modos el COG se escribe como '<nombre>_COG.tif.parcial' y se renombra al terminar.
+    """
+    if not os.path.exists(carpeta_destino):
+        try: os.makedirs(carpeta_destino)
+        except: pass
+            
+    nombre_archivo = os.path.basename(ruta_entrada)
+    nombre_sin_ext = os.path.splitext(nombre_archivo)[0]
+    nombre_cog = f"{nombre_sin_ext}_COG.tif"
+    ruta_final = os.path.join(carpeta_destino, nombre_cog)
+    
+    _log(f"\n⚙️  PROCESANDO: {nombre_archivo}")
+
+    # Se escribe con un nombre temporal y se mueve al final: nunca queda un _COG.tif a medias
+    ruta_parcial = _ruta_parcial(ruta_final)
+    try:
+        if modo == "pipeline":
+            resultado = _convertir_pipeline(ruta_entrada, ruta_parcial, inyectar_tabla, diccionario_datos, compresion,
+                                            reducir_tipo, cortes_clases)
+        else:
+            resultado = _convertir_reapertura(ruta_entrada, ruta_parcial, inyectar_tabla, diccionario_datos, compresion,
+                                              cortes_clases)
+        if not resultado:
+            return None
+        _publicar_salida(ruta_parcial, ruta_final)
+        return ruta_final
+    finally:
+        _borrar_parcial(ruta_parcial)
+
+# --- INTERMEDIOS EN MEMORIA (/vsimem) ---
+# Las etapas intermedias no escriben en disco: solo el COG final lo toca.
+
+# Tamaño máximo (sin comprimir) para copiar el origen a RAM; por encima, cadena de VRT
+PRESUPUESTO_RAM_MB = 2048
+
+def origen_raster_gdb(ruta_gdb, nombre_raster):
+    """
+    Cadena GDAL de un raster dentro de una FileGDB (driver OpenFileGDB, GDAL >= 3.7),
+    o None si este GDAL no puede leerlo (entonces hay que exportarlo con arcpy).
+    """
+    origen = f'OpenFileGDB:"{ruta_gdb}":{nombre_raster}'
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    try:
+        ds = gdal.Open(origen)
+    finally:
+        gdal.PopErrorHandler()
+    if ds is None:
+        return None
+    ds = None
+    return origen
+
+def preparar_intermedio(origen, nombre, presupuesto_mb=PRESUPUESTO_RAM_MB):
+    """
+    Etapa intermedia sin tocar disco, con nombre '<nombre>' (de él sale el nombre del COG):
+    - Si el raster sin comprimir cabe en 'presupuesto_mb': GeoTIFF en /vsimem
+      (el histograma y el COG leen de RAM, no del origen).
+    - Si no: VRT en /vsimem que solo referencia al origen (memoria constante).
+    Devuelve la ruta en /vsimem (liberar con liberar_intermedio) o None si falla.
+    """
+    ds = gdal.Open(origen)
+    if ds is None:
+        _log(f"❌ No se puede abrir el origen: {gdal.GetLastErrorMsg()}")
+        return None
+
+    banda = ds.GetRasterBand(1)
+    bytes_raster = ds.RasterXSize * ds.RasterYSize * ds.RasterCount * gdal.GetDataTypeSize(banda.DataType) // 8
+    carpeta = f"/vsimem/intermedios_{os.getpid()}"
+    if bytes_raster <= presupuesto_mb * 1024 * 1024:
+        ruta = f"{carpeta}/{nombre}.tif"
+        opciones = dict(format="GTiff", creationOptions=["TILED=YES", "BIGTIFF=IF_SAFER"])
+        _log(f"   🧠 Intermedio en memoria ({bytes_raster / (1024 * 1024):.0f} MB)")
+    else:
+        ruta = f"{carpeta}/{nombre}.vrt"
+        opciones = dict(format="VRT")
+        _log(f"   🔗 Intermedio VRT ({bytes_raster / (1024 * 1024):.0f} MB superan {presupuesto_mb} MB de RAM)")
+
+    with metricas.etapa("stage", archivo=origen, pixeles=ds.RasterXSize * ds.RasterYSize * ds.RasterCount) as evento:
+        ds_intermedio = gdal.Translate(ruta, ds, options=gdal.TranslateOptions(**opciones))
+        evento["ok"] = ds_intermedio is not None
+    ds_intermedio = ds = None
+    if not evento["ok"]:
+        _log(f"❌ Error creando el intermedio: {gdal.GetLastErrorMsg()}")
+        liberar_intermedio(ruta)
+        return None
+    return ruta
+
+def liberar_intermedio(ruta):
+    """Borra un intermedio de /vsimem (y el .aux.xml que le haya dejado GDAL)."""
+    for r in (ruta, ruta + ".aux.xml"):
+        if gdal.VSIStatL(r) is not None:
+            gdal.Unlink(r)
+
+# --- MANIFIESTO INCREMENTAL (estilo 'make') ---
+# El manifiesto (lectura, escritura, comparación) está en manifiesto.py; aquí solo la firma.
+
+def firma_conversion(ruta_entrada, inyectar_tabla=True, diccionario_datos=None, modo="pipeline", **opciones):
+    """
+    Todo lo que, si cambia, obliga a regenerar el COG.
+    'opciones' son el resto de argumentos de convertir_a_cog_con_tabla (compresion, reducir_tipo...).
+    "creacion" son las opciones ya resueltas para esa compresión (ver opciones_creacion_previstas).
+    """
+    return {
+        "entrada": huella_entrada(ruta_entrada),
+        "opciones": {
+            "creacion": opciones_creacion_previstas(opciones.get("compresion")),
+            "inyectar_tabla": bool(inyectar_tabla),
+            "modo": modo,
+            **opciones,
+        },
+        "hash_rat": hash_diccionario(diccionario_datos),
+    }
+
+def nombre_salida_cog(ruta_entrada):
+    """Devuelve el nombre del COG de salida: 'archivo.tif' -> 'archivo_COG.tif'."""
+    nombre_sin_ext = os.path.splitext(os.path.basename(ruta_entrada))[0]
+    return f"{nombre_sin_ext}_COG.tif"
+
+def _convertir_grupo(rutas_entrada, carpeta_destino, opciones=None, lote_diario=None):
+    """
+    Worker del modo paralelo. Se ejecuta en un proceso hijo con su propio estado GDAL.
+    Convierte en orden los archivos del grupo (todos comparten nombre de salida) y
+    devuelve una lista de tuplas (ruta_entrada, ruta_salida o None, mensaje_error).
+    Con 'lote_diario' anota en el diario de la carpeta de salida el estado de cada archivo.
+    """
+    diario = abrir_diario(carpeta_destino) if lote_diario else None
+    resultados = []
+    try:
+        for ruta in rutas_entrada:
+            if diario:
+                marcar_en_diario(diario, lote_diario, ruta, "en_curso")
+            try:
+                resultado = convertir_a_cog_con_tabla(ruta, carpeta_destino, inyectar_tabla=True, **(opciones or {}))
+                resultados.append((ruta, resultado, None if resultado else "Sin salida"))
+            except Exception as e:
+                resultados.append((ruta, None, str(e)))
+            if diario:
+                _, salida, error = resultados[-1]
+                marcar_en_diario(diario, lote_diario, ruta, "hecho" if salida else "fallido", error)
+    finally:
+        if diario:
+            diario.close()
+    return resultados
+
+def _inicializar_worker(verbose, ruta_metricas, lote):
+    """Los procesos hijos heredan la configuración de consola y métricas del lote."""
+    configurar_salida(verbose)
+    metricas.activar(ruta_metricas, lote)
+
+def _crear_pool(num_workers):
+    """Pool de procesos para el lote, con la misma configuración que el proceso padre."""
+    registro = metricas.actual()
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=_inicializar_worker,
+                               initargs=(VERBOSE, registro.ruta_jsonl, registro.lote))
+
+def _imprimir_resumen(resultados, omitidos=0):
+    """Resumen final de un lote: éxitos, fallos (con su motivo) y archivos sin cambios."""
+    exitos = sum(1 for _, salida, _ in resultados if salida) - omitidos
+    errores = len(resultados) - exitos - omitidos
+            
+    print("\n" + "="*50)
+    print(f"RESUMEN FINAL: Éxitos: {exitos} | Fallos: {errores} | Sin cambios: {omitidos}")
+    for ruta, salida, error in resultados:
+        if not salida:
+            print(f"   ❌ {os.path.basename(ruta)}: {error}")
+    print("="*50 + "\n")
+
+def _comprobar_al_dia(ruta, carpeta_destino, manifiesto, firmas, opciones=None):
+    """
+    Modo incremental: True si el COG de 'ruta' sigue válido y se puede saltar.
+    Si no, guarda la firma en 'firmas' para registrarla tras convertir.
+    """
+    ruta_final = os.path.join(carpeta_destino, nombre_salida_cog(ruta))
+    try:
+        firma = firma_conversion(ruta, **(opciones or {}))
+    except OSError:
+        return False
+    if esta_al_dia(manifiesto, ruta_final, firma):
+        _log(f"   ⏭️  Sin cambios, se omite: {os.path.basename(ruta)}")
+        return True
+    firmas[ruta] = firma
+    return False
+
+def _iniciar_lote(diario, lote, descripcion, claves, reanudar):
+    """iniciar_lote si hay diario; sin diario no hay lote ni nada hecho de antes."""
+    if diario is None:
+        return None, set()
+    lote_diario, hechas = iniciar_lote(diario, lote, descripcion, claves, reanudar)
+    if lote_diario != lote:
+        _log(f"♻️  Reanudando lote {lote_diario}: {len(hechas)} archivos ya hechos.")
+    return lote_diario, hechas
+
+def _ya_hecho(ruta, carpeta_destino, hechas):
+    """Al reanudar: True si la ruta ya se convirtió en el lote anterior y su COG sigue ahí."""
+    if not hechas or ruta not in hechas:
+        return False
+    if not os.path.exists(os.path.join(carpeta_destino, nombre_salida_cog(ruta))):
+        return False
+    _log(f"   ⏭️  Ya convertido en el lote que se reanuda: {os.path.basename(ruta)}")
+    return True
+
+def _actualizar_manifiesto(carpeta_destino, manifiesto, firmas, resultados):
+    """Registra en el manifiesto las conversiones hechas en este lote y lo guarda."""
+    for ruta, salida, _ in resultados:
+        if ruta in firmas:
+            ruta_final = os.path.join(carpeta_destino, nombre_salida_cog(ruta))
+            registrar_en_manifiesto(manifiesto, ruta_final, firmas[ruta], exito=bool(salida))
+    guardar_manifiesto(carpeta_destino, manifiesto)
+
+def _procesar_en_streaming(carpeta_origen, carpeta_destino, extensiones, num_workers, num_hilos_escaneo,
+                           manifiesto=None, firmas=None, opciones=None, lote_diario=None, hechas=None):
+    """
+    Escaneo concurrente + conversión a la vez: cada raster se convierte en cuanto se encuentra.
+    Si dos entradas comparten nombre de salida, el grupo entero se rehace al final en orden,
+    para que el resultado sea el mismo que en modo secuencial.
+    'hechas': rutas ya convertidas en el lote que se está reanudando (no se repiten).
+    """
+    _log(f"\n🚀 Iniciando procesamiento en streaming (workers: {num_workers})...\n")
+
+    grupos = {}      # nombre_cog -> [rutas]
+    resultados = {}  # nombre_cog -> lista de resultados de _convertir_grupo
+    futuros = {}
+    omitidos = set()
+    executor = _crear_pool(num_workers) if num_workers and num_workers > 1 else None
+
+    try:
+        for item in iterar_carpeta_concurrente(carpeta_origen, extensiones, num_hilos=num_hilos_escaneo):
+            nombre = nombre_salida_cog(item['Ruta'])
+            grupos.setdefault(nombre, []).append(item['Ruta'])
+            if len(grupos[nombre]) > 1:
+                continue
+            if manifiesto is not None and _comprobar_al_dia(item['Ruta'], carpeta_destino, manifiesto, firmas, opciones):
+                omitidos.add(nombre)
+                resultados[nombre] = [(item['Ruta'], os.path.join(carpeta_destino, nombre), None)]
+                continue
+            if _ya_hecho(item['Ruta'], carpeta_destino, hechas):
+                omitidos.add(nombre)
+                resultados[nombre] = [(item['Ruta'], os.path.join(carpeta_destino, nombre), None)]
+                continue
+            if executor:
+                futuros[nombre] = executor.submit(_convertir_grupo, [item['Ruta']], carpeta_destino, opciones, lote_diario)
+            else:
+                resultados[nombre] = _convertir_grupo([item['Ruta']], carpeta_destino, opciones, lote_diario)
+
+        for nombre, futuro in futuros.items():
+            resultados[nombre] = futuro.result()
+
+        repetidos = {nombre: sorted(rutas) for nombre, rutas in grupos.items() if len(rutas) > 1}
+        for nombre, rutas in repetidos.items():
+            resultados[nombre] = _convertir_grupo(rutas, carpeta_destino, opciones, lote_diario)
+            omitidos.discard(nombre)
+            if firmas is not None:
+                # Un nombre de salida compartido no se puede dar por "al día"
+                for ruta in rutas:
+                    firmas.pop(ruta, None)
+                manifiesto.pop(nombre, None)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if not grupos:
+        _log("No se encontraron rasters para procesar.")
+        return None, 0
+
+    return sorted((r for grupo in resultados.values() for r in grupo), key=lambda r: r[0]), len(omitidos)
+
+def procesar_todo_a_cog(carpeta_origen, carpeta_destino, num_workers=1, escaneo_concurrente=False, num_hilos_escaneo=8,
+                        incremental=False, compresion=None, reducir_tipo=False, cortes_clases=None, verbose=True,
+                        ruta_metricas=None, reanudar=False, diario=False):
     """
     Función maestra para CARPETAS (No GDBs): Recorre, convierte e inyecta tabla básica.
+    Con num_workers > 1 reparte los archivos entre procesos (cada uno con su GDAL).
+    Con escaneo_concurrente=True la conversión empieza mientras el recorrido sigue.
+    Con incremental=True se consulta el manifiesto de la carpeta de salida y solo se rehacen
+    los COG cuya entrada u opciones han cambiado (por defecto se rehace todo, como siempre).
+    compresion="auto" elige codec/predictor para cada raster (ver convertir_a_cog_con_tabla).
+    reducir_tipo=True guarda como Byte/UInt16/Int16 los flotantes que solo contienen enteros.
+    cortes_clases da a los flotantes continuos una RAT por clases (ej. "cuantiles:5").
+    verbose=False silencia los mensajes por archivo (solo queda el resumen).
+    ruta_metricas: archivo JSON-lines donde se registran las etapas de cada archivo;
+    al terminar se imprime el desglose por etapa del lote.
+    Los COG se escriben como '.parcial' hasta estar completos. Con diario=True cada archivo queda
+    anotado en el diario de la carpeta de salida (pendiente / en curso / hecho / fallido); si esa
+    ejecución se corta, reanudar=True continúa el lote sin repetir lo que ya estaba hecho.
+    Sin diario ni reanudar no se crea el '_diario_cog.sqlite'.
+    El orden de los archivos y del resumen es siempre el mismo, sea cual sea num_workers.
+    """
+    if compresion:
+        _politica_compresion(compresion)  # Una opción mal escrita falla aquí, no en cada archivo
+    verbose_anterior = VERBOSE
+    configurar_salida(verbose)
+    lote = f"{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}_{os.urandom(2).hex()}"
+    if ruta_metricas:
+        metricas.activar(ruta_metricas, lote)
+
+    try:
+        opciones = {"compresion": compresion, "reducir_tipo": reducir_tipo, "cortes_clases": cortes_clases}
+        return _procesar_todo_a_cog(carpeta_origen, carpeta_destino, num_workers, escaneo_concurrente,
+                                    num_hilos_escaneo, incremental, opciones, lote, reanudar, diario or reanudar)
+    finally:
+        configurar_salida(verbose_anterior)
+        if ruta_metricas:
+            metricas.activar(None)
+            metricas.imprimir_resumen_etapas(metricas.resumir_eventos(ruta_metricas, lote))
+
+def _procesar_todo_a_cog(carpeta_origen, carpeta_destino, num_workers, escaneo_concurrente, num_hilos_escaneo,
+                         incremental, opciones, lote, reanudar=False, con_diario=False):
+    """Cuerpo de procesar_todo_a_cog (la configuración de consola/métricas la pone la función pública)."""
+    manifiesto = cargar_manifiesto(carpeta_destino) if incremental else None
+    firmas = {} if incremental else None
+
+    os.makedirs(carpeta_destino, exist_ok=True)
+    parciales = limpiar_parciales(carpeta_destino)
+    if parciales:
+        _log(f"🧹 Borrados {parciales} COG a medio escribir de una ejecución anterior.")
+    diario = abrir_diario(carpeta_destino) if con_diario else None
+    try:
+        return _procesar_con_diario(carpeta_origen, carpeta_destino, num_workers, escaneo_concurrente,
+                                    num_hilos_escaneo, manifiesto, firmas, opciones, diario, lote, reanudar)
+    finally:
+        if diario is not None:
+            diario.close()
+
+def _procesar_con_diario(carpeta_origen, carpeta_destino, num_workers, escaneo_concurrente, num_hilos_escaneo,
+                         manifiesto, firmas, opciones, diario, lote, reanudar):
     """
-    archivos = inspeccionar_carpeta(carpeta_origen, extensiones_validas=['.tif', '.tiff', '.img'])
+    Recorre y convierte anotando cada archivo en el diario; el lote se cierra si no hubo fallos.
+    Con diario=None no se anota nada (lote_diario None, nada hecho de antes).
+    """
+    extensiones = ['.tif', '.tiff', '.img']
+    incremental = manifiesto is not None
+    descripcion = os.path.abspath(carpeta_origen)
+
+    if escaneo_concurrente:
+        lote_diario, hechas = _iniciar_lote(diario, lote, descripcion, [], reanudar)
+        resultados, omitidos = _procesar_en_streaming(carpeta_origen, carpeta_destino, extensiones, num_workers,
+                                                      num_hilos_escaneo, manifiesto, firmas, opciones,
+                                                      lote_diario, hechas)
+        if resultados is not None:
+            if incremental:
+                _actualizar_manifiesto(carpeta_destino, manifiesto, firmas, resultados)
+            _imprimir_resumen(resultados, omitidos)
+            if diario and all(salida for _, salida, _ in resultados):
+                cerrar_lote(diario, lote_diario)
+        return resultados
+
+    archivos = inspeccionar_carpeta(carpeta_origen, extensiones_validas=extensiones)
     
     if not archivos:
-        print("No se encontraron rasters para procesar.")
+        _log("No se encontraron rasters para procesar.")
         return
 
-    print(f"\n🚀 Iniciando procesamiento por lotes de {len(archivos)} archivos...\n")
+    rutas = sorted(item['Ruta'] for item in archivos)
+    lote_diario, hechas = _iniciar_lote(diario, lote, descripcion, rutas, reanudar)
     
-    errores = 0
-    exitos = 0
-    
-    for item in archivos:
-        # Aquí no pasamos diccionario_datos porque en una carpeta suelta no solemos tenerlo a mano
-        resultado = convertir_a_cog_con_tabla(item['Ruta'], carpeta_destino, inyectar_tabla=True)
-        if resultado:
-            exitos += 1
+    # Agrupamos por nombre de salida: si dos entradas generan el mismo _COG.tif
+    # se procesan en el mismo worker y en orden, igual que en modo secuencial.
+    grupos = {}
+    for ruta in rutas:
+        grupos.setdefault(nombre_salida_cog(ruta), []).append(ruta)
+
+    lista_grupos = []
+    resultados_omitidos = []
+    for nombre, grupo in grupos.items():
+        if incremental and len(grupo) == 1 and _comprobar_al_dia(grupo[0], carpeta_destino, manifiesto, firmas, opciones):
+            resultados_omitidos.append((grupo[0], os.path.join(carpeta_destino, nombre), None))
+        elif len(grupo) == 1 and _ya_hecho(grupo[0], carpeta_destino, hechas):
+            resultados_omitidos.append((grupo[0], os.path.join(carpeta_destino, nombre), None))
         else:
-            errores += 1
-            
-    print("\n" + "="*50)
-    print(f"RESUMEN FINAL: Éxitos: {exitos} | Fallos: {errores}")
-    print("="*50 + "\n")
\ No newline at end of file
+            lista_grupos.append(grupo)
+            if incremental and len(grupo) > 1:
+                manifiesto.pop(nombre, None)
+
+    _log(f"\n🚀 Iniciando procesamiento por lotes de {len(rutas)} archivos (workers: {num_workers})...\n")
+    
+    if num_workers and num_workers > 1:
+        # Nota Windows: el script que llama debe estar protegido con if __name__ == "__main__"
+        with _crear_pool(num_workers) as executor:
+            # map() devuelve los resultados en el orden de entrada
+            resultados_grupos = list(executor.map(_convertir_grupo, lista_grupos, [carpeta_destino] * len(lista_grupos),
+                                                  [opciones] * len(lista_grupos), [lote_diario] * len(lista_grupos)))
+    else:
+        resultados_grupos = [_convertir_grupo(grupo, carpeta_destino, opciones, lote_diario) for grupo in lista_grupos]
+
+    resultados = [r for grupo in resultados_grupos for r in grupo]
+    if incremental:
+        # Incluye los omitidos: los ya hechos en un lote reanudado aún no estaban en el manifiesto
+        _actualizar_manifiesto(carpeta_destino, manifiesto, firmas, resultados + resultados_omitidos)
+
+    resultados = sorted(resultados + resultados_omitidos, key=lambda r: r[0])
+    _imprimir_resumen(resultados, len(resultados_omitidos))
+    if diario and all(salida for _, salida, _ in resultados):
+        cerrar_lote(diario, lote_diario)
+    
+    return resultados
@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+
+# --- MANIFIESTO INCREMENTAL (estilo 'make') ---
+# Un JSON por carpeta de salida con, para cada COG, la firma con la que se generó (huella de la
+# entrada, opciones y atributos) y el tamaño/mtime con que quedó. Si nada ha cambiado no se rehace.
+# La firma concreta de una conversión COG la arma gdal_utils.firma_conversion.
+
+NOMBRE_MANIFIESTO = "_manifiesto_cog.json"
+
+def huella_entrada(ruta_entrada):
+    """
+    Huella barata de una entrada (sin leer píxeles): tamaño y mtime.
+    Si es una carpeta (p.ej. una .gdb) se agregan todos sus archivos.
+    """
+    if os.path.isdir(ruta_entrada):
+        tamano, mtime = 0, 0
+        for raiz, _, archivos in os.walk(ruta_entrada):
+            for nombre in archivos:
+                try:
+                    st = os.stat(os.path.join(raiz, nombre))
+                except OSError:
+                    continue
+                tamano += st.st_size
+                mtime = max(mtime, st.st_mtime_ns)
+    else:
+        st = os.stat(ruta_entrada)
+        tamano, mtime = st.st_size, st.st_mtime_ns
+    return {"ruta": os.path.normpath(ruta_entrada), "tamano": tamano, "mtime": mtime}
+
+def hash_diccionario(diccionario_datos):
+    """Hash estable del diccionario de atributos de la RAT (None -> None)."""
+    if not diccionario_datos:
+        return None
+    texto = json.dumps({str(k): v for k, v in diccionario_datos.items()}, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+def cargar_manifiesto(carpeta_destino):
+    """Lee el manifiesto de la carpeta de salida (vacío si no existe o está corrupto)."""
+    ruta = os.path.join(carpeta_destino, NOMBRE_MANIFIESTO)
+    try:
+        with open(ruta, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def guardar_manifiesto(carpeta_destino, manifiesto):
+    """Escribe el manifiesto de forma atómica (temporal + os.replace)."""
+    os.makedirs(carpeta_destino, exist_ok=True)
+    ruta = os.path.join(carpeta_destino, NOMBRE_MANIFIESTO)
+    ruta_tmp = ruta + ".tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False, sort_keys=True)
+    os.replace(ruta_tmp, ruta)
+
+def esta_al_dia(manifiesto, ruta_final, firma):
+    """True si el COG existe, no lo han tocado y se generó con la misma firma."""
+    entrada = manifiesto.get(os.path.basename(ruta_final))
+    if not entrada or entrada.get("firma") != firma:
+        return False
+    try:
+        st = os.stat(ruta_final)
+    except OSError:
+        return False
+    return entrada.get("salida") == {"tamano": st.st_size, "mtime": st.st_mtime_ns}
+
+def registrar_en_manifiesto(manifiesto, ruta_final, firma, exito=True):
+    """Anota el resultado de una conversión. Si falló, se borra la entrada para forzar rehacerla."""
+    clave = os.path.basename(ruta_final)
+    if exito and os.path.exists(ruta_final):
+        st = os.stat(ruta_final)
+        manifiesto[clave] = {
+            "firma": firma,
+            "salida": {"tamano": st.st_size, "mtime": st.st_mtime_ns},
+        }
+    else:
+        manifiesto.pop(clave, None)
@@ -0,0 +1,224 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource  # Solo Linux / macOS
+except ImportError:
+    resource = None
+
+# --- MÉTRICAS POR ETAPA DEL PIPELINE COG ---
+# Cada etapa (scan, rasterize, stage, translate, reopen, histogram, rat_write, verify) emite un evento JSON
+# por línea: tiempo, bytes de entrada/salida, píxeles y memoria.
+# Sin archivo de destino el registro no hace nada (coste prácticamente nulo).
+
+ETAPAS = ["scan", "rasterize", "stage", "translate", "reopen", "histogram", "rat_write", "verify"]
+
+def memoria_actual_mb():
+    """Memoria residente del proceso en este momento (MB), o None si no se puede medir."""
+    try:
+        with open("/proc/self/statm") as f:  # Linux: sin dependencias
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 1)
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().rss / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+def pico_memoria_mb():
+    """
+    Pico de memoria residente del proceso desde que arrancó (MB), o None si no se puede medir.
+    Es un máximo de toda la vida del proceso: no dice cuánto gastó una etapa concreta.
+    """
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux lo da en KB, macOS en bytes
+        return round(pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024, 1)
+    try:
+        import psutil
+        return round(psutil.Process().memory_info().peak_wset / (1024 * 1024), 1)
+    except Exception:
+        return None
+
+class RegistroMetricas:
+    """
+    Escribe eventos JSON-lines en 'ruta_jsonl' (modo append, una línea por evento).
+    Varios procesos pueden compartir el mismo archivo: cada uno abre su propio registro.
+    'lote' identifica la ejecución, para poder separar varias en el mismo archivo.
+    """
+
+    def __init__(self, ruta_jsonl=None, lote=None):
+        self.ruta_jsonl = ruta_jsonl
+        self.lote = lote
+        self._archivo = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return bool(self.ruta_jsonl)
+
+    def emitir(self, evento):
+        if not self.ruta_jsonl:
+            return
+        if self.lote is not None:
+            evento["lote"] = self.lote
+        linea = json.dumps(evento, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._archivo is None:
+                self._archivo = open(self.ruta_jsonl, "a", encoding="utf-8", buffering=1)
+            self._archivo.write(linea)
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+    @contextmanager
+    def etapa(self, nombre, archivo=None, **datos):
+        """
+        Mide una etapa. El diccionario que devuelve se puede completar dentro del bloque
+        (bytes_salida, pixeles, ok=False...). Al salir se emite el evento.
+        Memoria: 'delta_rss_mb' es lo que creció la memoria residente durante la etapa (RSS al
+        salir - RSS al entrar), 'rss_mb' la RSS al salir y 'pico_proceso_mb' el pico de toda
+        la vida del proceso (ru_maxrss), que no baja nunca y por sí solo no es atribuible a la etapa.
+        """
+        evento = {"tipo": "etapa", "etapa": nombre, "archivo": archivo, **datos}
+        if not self.ruta_jsonl:
+            yield evento
+            return
+
+        rss_inicio = memoria_actual_mb()
+        inicio = time.perf_counter()
+        try:
+            yield evento
+        except BaseException:
+            evento["ok"] = False
+            raise
+        finally:
+            evento.setdefault("ok", True)
+            evento["segundos"] = round(time.perf_counter() - inicio, 4)
+            rss_fin = memoria_actual_mb()
+            evento["rss_mb"] = rss_fin
+            evento["delta_rss_mb"] = round(rss_fin - rss_inicio, 1) if rss_fin is not None and rss_inicio is not None else None
+            evento["pico_proceso_mb"] = pico_memoria_mb()
+            evento["pid"] = os.getpid()
+            evento["instante"] = round(time.time(), 3)
+            self.emitir(evento)
+
+# Registro activo del proceso. Por defecto no escribe nada.
+_actual = RegistroMetricas()
+
+def activar(ruta_jsonl=None, lote=None):
+    """Activa (o desactiva, con None) el registro de métricas de este proceso."""
+    global _actual
+    _actual.cerrar()
+    _actual = RegistroMetricas(ruta_jsonl, lote)
+    return _actual
+
+def actual():
+    return _actual
+
+def etapa(nombre, archivo=None, **datos):
+    """Atajo: _actual.etapa(...)."""
+    return _actual.etapa(nombre, archivo=archivo, **datos)
+
+def callback_progreso(nombre_etapa, archivo=None, bytes_totales=None, verbose=True, intervalo=2.0):
+    """
+    Callback de progreso para gdal.Translate & co. Calcula MB/s y ETA y los emite
+    como eventos 'progreso' (y en consola si verbose). Devuelve None si no hay a quién avisar,
+    para que GDAL no pague ni la llamada.
+    """
+    if not verbose and not _actual.activo:
+        return None
+
+    inicio = time.perf_counter()
+    estado = {"ultimo": 0.0}
+
+    def _callback(completado, mensaje, datos_usuario):
+        ahora = time.perf_counter()
+        if completado < 1.0 and ahora - estado["ultimo"] < intervalo:
+            return 1
+        estado["ultimo"] = ahora
+
+        transcurrido = ahora - inicio
+        mb_s = None
+        if bytes_totales and transcurrido > 0:
+            mb_s = round(bytes_totales * completado / 1e6 / transcurrido, 2)
+        eta = round(transcurrido * (1 - completado) / completado, 1) if completado > 0 else None
+
+        _actual.emitir({
+            "tipo": "progreso", "etapa": nombre_etapa, "archivo": archivo, "completado": round(completado, 4),
+            "segundos": round(transcurrido, 2), "mb_s": mb_s, "eta_s": eta, "pid": os.getpid(),
+        })
+        if verbose:
+            velocidad = f"{mb_s:.1f} MB/s" if mb_s is not None else "-- MB/s"
+            restante = f"ETA {eta:.0f} s" if eta is not None else "ETA --"
+            print(f"   ⏳ {nombre_etapa}: {completado * 100:5.1f}%  {velocidad}  {restante}")
+        return 1
+
+    return _callback
+
+# --- AGREGACIÓN ---
+
+def resumir_eventos(ruta_jsonl, lote=None):
+    """
+    Lee un archivo de eventos y devuelve el desglose por etapa (solo del 'lote' indicado, si se da).
+    'delta_rss_mb' es el mayor crecimiento de RSS de una sola ejecución de la etapa;
+    'pico_proceso_mb' el mayor pico de proceso visto al terminarla.
+    """
+    resumen = {}
+    if not ruta_jsonl or not os.path.exists(ruta_jsonl):
+        return resumen
+
+    with open(ruta_jsonl, "r", encoding="utf-8") as f:
+        for linea in f:
+            try:
+                evento = json.loads(linea)
+            except ValueError:
+                continue
+            if evento.get("tipo") != "etapa":
+                continue
+            if lote is not None and evento.get("lote") != lote:
+                continue
+
+            r = resumen.setdefault(evento["etapa"], {
+                "eventos": 0, "fallos": 0, "segundos": 0.0, "bytes_entrada": 0,
+                "bytes_salida": 0, "pixeles": 0, "delta_rss_mb": None, "pico_proceso_mb": 0.0,
+            })
+            r["eventos"] += 1
+            r["fallos"] += 0 if evento.get("ok", True) else 1
+            r["segundos"] += evento.get("segundos") or 0.0
+            r["bytes_entrada"] += evento.get("bytes_entrada") or 0
+            r["bytes_salida"] += evento.get("bytes_salida") or 0
+            r["pixeles"] += evento.get("pixeles") or 0
+            if evento.get("delta_rss_mb") is not None:
+                r["delta_rss_mb"] = max(r["delta_rss_mb"] if r["delta_rss_mb"] is not None else evento["delta_rss_mb"],
+                                        evento["delta_rss_mb"])
+            r["pico_proceso_mb"] = max(r["pico_proceso_mb"], evento.get("pico_proceso_mb") or 0.0)
+
+    for r in resumen.values():
+        r["segundos"] = round(r["segundos"], 3)
+        r["mpix_s"] = round(r["pixeles"] / 1e6 / r["segundos"], 2) if r["segundos"] and r["pixeles"] else None
+        r["mb_s"] = round(r["bytes_entrada"] / 1e6 / r["segundos"], 2) if r["segundos"] and r["bytes_entrada"] else None
+    return resumen
+
+def imprimir_resumen_etapas(resumen):
+    """Tabla por etapa: número de eventos, tiempo total, throughput, ΔRSS máximo y pico del proceso."""
+    if not resumen:
+        return
+    total = sum(r["segundos"] for r in resumen.values()) or 1.0
+
+    print(f"\n{'Etapa':<12} {'N':>6} {'Fallos':>6} {'Tiempo (s)':>11} {'%':>6} {'MPix/s':>9} {'MB/s':>9} {'ΔRSS (MB)':>10} {'Pico (MB)':>10}")
+    print("-" * 87)
+    orden = [e for e in ETAPAS if e in resumen] + sorted(e for e in resumen if e not in ETAPAS)
+    for nombre in orden:
+        r = resumen[nombre]
+        print(f"{nombre:<12} {r['eventos']:>6} {r['fallos']:>6} {r['segundos']:>11.2f} {r['segundos'] / total * 100:>5.1f}% "
+              f"{r['mpix_s'] if r['mpix_s'] is not None else '—':>9} {r['mb_s'] if r['mb_s'] is not None else '—':>9} "
+              f"{r['delta_rss_mb'] if r['delta_rss_mb'] is not None else '—':>10} {r['pico_proceso_mb']:>10}")
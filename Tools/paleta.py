@@ -0,0 +1,116 @@
+import os
+import numpy as np
+from osgeo import gdal
+
+from . import metricas
+from .gdal_utils import (OPCIONES_COG_TABLA, _borrar_parcial, _iterar_filas_bloques, _log, _publicar_salida,
+                         _resolver_compresion, _ruta_parcial, _translate_medido, liberar_intermedio, verificar_rat)
+from .teselas import TABLA_COLORES, _paleta_rgba, clasificar_valores
+
+# --- COG CON PALETA (Byte + tabla de colores, listo para pintar) ---
+# Versión clasificada de un raster, con la paleta y las etiquetas del visor dentro del propio COG.
+
+def _tabla_colores_gdal(colores):
+    """gdal.ColorTable con la entrada 0 transparente y una entrada por clase."""
+    tabla = gdal.ColorTable()
+    for i, (r, g, b, a) in enumerate(colores.tolist()):
+        tabla.SetColorEntry(i, (r, g, b, a))
+    return tabla
+
+def _rat_paleta(tabla_colores, colores, conteos):
+    """RAT de la versión con paleta: Value / Count / Etiqueta / Limite / Red / Green / Blue."""
+    rat = gdal.RasterAttributeTable()
+    rat.CreateColumn("Value", gdal.GFT_Integer, gdal.GFU_MinMax)
+    rat.CreateColumn("Count", gdal.GFT_Integer, gdal.GFU_PixelCount)
+    rat.CreateColumn("Etiqueta", gdal.GFT_String, gdal.GFU_Name)
+    rat.CreateColumn("Limite", gdal.GFT_Real, gdal.GFU_Max)
+    rat.CreateColumn("Red", gdal.GFT_Integer, gdal.GFU_Red)
+    rat.CreateColumn("Green", gdal.GFT_Integer, gdal.GFU_Green)
+    rat.CreateColumn("Blue", gdal.GFT_Integer, gdal.GFU_Blue)
+
+    for fila, clase in enumerate(tabla_colores):
+        valor = fila + 1
+        rat.SetValueAsInt(fila, 0, valor)
+        rat.SetValueAsInt(fila, 1, int(conteos[valor]))
+        rat.SetValueAsString(fila, 2, str(clase.get("texto", f"Clase {valor}")))
+        rat.SetValueAsDouble(fila, 3, float(clase["limite"]))
+        for j in range(3):
+            rat.SetValueAsInt(fila, 4 + j, int(colores[valor][j]))
+    return rat
+
+def convertir_a_cog_paleta(ruta_entrada, carpeta_destino, tabla_colores=None, compresion=None):
+    """
+    Versión "lista para pintar" de un raster clasificado: COG Byte con tabla de colores
+    (la entrada 0 transparente) y RAT con la etiqueta de cada clase.
+    Las clases salen de 'tabla_colores' (por defecto TABLA_COLORES, la del visor) con la misma
+    regla que reglasColor en el visor, así que cualquier cliente lo pinta sin expresiones por píxel.
+    1. Clasifica por bloques a un GeoTIFF Byte en /vsimem (contando píxeles por clase).
+    2. gdal.Translate(format="COG") con overviews NEAREST (no mezcla clases).
+    Solo el COG final toca el disco.
+    """
+    tabla_colores = tabla_colores or TABLA_COLORES
+    if len(tabla_colores) > 255:
+        _log("❌ Una paleta Byte admite como máximo 255 clases.")
+        return None
+    os.makedirs(carpeta_destino, exist_ok=True)
+
+    nombre_sin_ext = os.path.splitext(os.path.basename(ruta_entrada))[0]
+    ruta_final = os.path.join(carpeta_destino, f"{nombre_sin_ext}_COG_paleta.tif")
+    ruta_tmp = f"/vsimem/{nombre_sin_ext}_paleta_{os.getpid()}.tif"
+    ruta_vrt = f"/vsimem/{nombre_sin_ext}_paleta_{os.getpid()}.vrt"
+    _log(f"\n🎨 PALETA: {os.path.basename(ruta_entrada)}")
+
+    ds_vrt = gdal.Translate(ruta_vrt, ruta_entrada, options=gdal.TranslateOptions(format="VRT", outputSRS="EPSG:25831"))
+    if ds_vrt is None:
+        _log(f"❌ Error CRÍTICO creando VRT intermedio: {gdal.GetLastErrorMsg()}")
+        return None
+
+    ds_tmp = None
+    try:
+        banda = ds_vrt.GetRasterBand(1)
+        nodata = banda.GetNoDataValue()
+        limites, colores = _paleta_rgba(tabla_colores)
+
+        ds_tmp = gdal.GetDriverByName("GTiff").Create(
+            ruta_tmp, ds_vrt.RasterXSize, ds_vrt.RasterYSize, 1, gdal.GDT_Byte,
+            options=["TILED=YES", "COMPRESS=LZW", "BIGTIFF=IF_SAFER"])
+        if ds_tmp is None:
+            _log(f"❌ No se pudo crear el temporal: {gdal.GetLastErrorMsg()}")
+            return None
+        ds_tmp.SetGeoTransform(ds_vrt.GetGeoTransform())
+        ds_tmp.SetProjection(ds_vrt.GetProjection())
+        banda_tmp = ds_tmp.GetRasterBand(1)
+        banda_tmp.SetNoDataValue(0)
+
+        # 1. Clasificación por bloques (una lectura) + conteo por clase
+        conteos = np.zeros(len(colores), dtype=np.int64)
+        with metricas.etapa("clasificar", archivo=ruta_entrada, pixeles=banda.XSize * banda.YSize):
+            for y, array in _iterar_filas_bloques(banda):
+                clases = clasificar_valores(array, nodata, limites)
+                conteos += np.bincount(clases.ravel(), minlength=len(colores))
+                banda_tmp.WriteArray(clases, 0, y)
+
+        banda_tmp.SetRasterColorInterpretation(gdal.GCI_PaletteIndex)
+        banda_tmp.SetRasterColorTable(_tabla_colores_gdal(colores))
+        banda_tmp.SetDefaultRAT(_rat_paleta(tabla_colores, colores, conteos))
+        ds_tmp.FlushCache()
+
+        # 2. COG final (la compresión automática se evalúa sobre el Byte clasificado)
+        opciones_creacion, metadatos = _resolver_compresion(ruta_tmp, compresion, OPCIONES_COG_TABLA)
+        opciones_creacion = [o for o in opciones_creacion if not o.startswith("PREDICTOR=")]
+        ruta_parcial = _ruta_parcial(ruta_final)
+        if not _translate_medido(ruta_parcial, ds_tmp, ruta_entrada, format="COG",
+                                 creationOptions=opciones_creacion, metadataOptions=metadatos):
+            _log(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
+            return None
+        _publicar_salida(ruta_parcial, ruta_final)
+    finally:
+        ds_tmp = ds_vrt = None
+        gdal.Unlink(ruta_vrt)
+        liberar_intermedio(ruta_tmp)  # También su .aux.xml (la RAT de GTiff va a PAM)
+        _borrar_parcial(_ruta_parcial(ruta_final))
+
+    vacias = sum(1 for c in conteos[1:] if c == 0)
+    _log(f"   ✅ COG con paleta: {len(tabla_colores)} clases ({vacias} sin píxeles) -> {os.path.basename(ruta_final)}")
+    verificar_rat(ruta_final)
+    return ruta_final
@@ -0,0 +1,433 @@
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from osgeo import gdal, ogr
+
+from . import metricas
+from .gdal_utils import (OPCIONES_COG_TABLA, SUFIJO_TESELAS, _AcumuladorHistograma, _borrar_parcial, _crear_pool,
+                         _diccionario_histograma, _log, _publicar_salida, _resolver_compresion, _ruta_parcial,
+                         _tamano_archivo, _translate_medido, _valores_validos, generar_inyectar_rat,
+                         tipo_entero_minimo, verificar_rat)
+
+# --- RASTERIZACIÓN DE POLÍGONOS (gdal.Rasterize, sin arcpy) ---
+# Equivalente a PolygonToRaster de ArcGIS para GeoPackage / Shapefile / FileGDB:
+# cada capa poligonal se quema en un GeoTIFF teselado con el valor de un campo.
+
+TAMANO_CELDA_RASTER = 10  # metros, como en batch_polygon_to_raster
+
+OPCIONES_RASTER_TESELADO = [
+    "TILED=YES",
+    "BLOCKXSIZE=512",
+    "BLOCKYSIZE=512",
+    "COMPRESS=LZW",
+    "BIGTIFF=IF_SAFER",
+]
+
+# NoData de los rásters flotantes (el mismo que usa ArcGIS)
+NODATA_FLOTANTE = -3.4028234663852886e+38
+
+TIPOS_GEOMETRIA_POLIGONO = (ogr.wkbPolygon, ogr.wkbMultiPolygon, ogr.wkbCurvePolygon, ogr.wkbMultiSurface)
+
+def listar_capas_poligonales(ruta_vector):
+    """Nombres de las capas de polígonos de una fuente vectorial (GPKG, SHP, carpeta .gdb...)."""
+    ds = gdal.OpenEx(ruta_vector, gdal.OF_VECTOR)
+    if ds is None:
+        _log(f"❌ No se puede abrir la fuente vectorial: {gdal.GetLastErrorMsg()}")
+        return []
+    capas = []
+    for i in range(ds.GetLayerCount()):
+        capa = ds.GetLayerByIndex(i)
+        if ogr.GT_Flatten(capa.GetGeomType()) in TIPOS_GEOMETRIA_POLIGONO:
+            capas.append(capa.GetName())
+    ds = None
+    return capas
+
+def _tipo_raster_campo(ds_vector, nombre_capa, campo_valor):
+    """
+    (tipo_gdal, nodata) para quemar 'campo_valor': el entero más pequeño que contiene
+    [MIN, MAX] del campo (con un NoData fuera de ese rango), o Float32 si es decimal.
+    Solo lee la tabla de atributos, no las geometrías.
+    """
+    capa = ds_vector.GetLayerByName(nombre_capa)
+    defn = capa.GetLayerDefn()
+    indice = defn.GetFieldIndex(campo_valor)
+    if indice < 0:
+        raise ValueError(f"La capa '{nombre_capa}' no tiene el campo '{campo_valor}'")
+    if defn.GetFieldDefn(indice).GetType() not in (ogr.OFTInteger, ogr.OFTInteger64):
+        return gdal.GDT_Float32, NODATA_FLOTANTE
+
+    sql = ds_vector.ExecuteSQL(f'SELECT MIN("{campo_valor}") AS minimo, MAX("{campo_valor}") AS maximo FROM "{nombre_capa}"')
+    try:
+        fila = sql.GetNextFeature() if sql is not None else None
+        minimo = fila.GetField("minimo") if fila else None
+        maximo = fila.GetField("maximo") if fila else None
+    finally:
+        if sql is not None:
+            ds_vector.ReleaseResultSet(sql)
+
+    if minimo is not None and maximo is not None and maximo - minimo <= 65535:
+        # Todo el rango cuenta como "usado": el NoData queda fuera de [minimo, maximo]
+        destino = tipo_entero_minimo({"min": minimo, "max": maximo, "valores": np.arange(minimo, maximo + 1)})
+        if destino is not None:
+            return destino
+    return gdal.GDT_Int32, -2147483648
+
+def rasterizar_capa(ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda=TAMANO_CELDA_RASTER,
+                    inyectar_tabla=True):
+    """
+    Quema una capa poligonal en un GeoTIFF teselado (sin arcpy). Celdas de 'tamano_celda'
+    alineadas a la rejilla, valor del centro de celda (como PolygonToRaster) y RAT en los enteros
+    (como build_rat="BUILD"). Se escribe como '.parcial' y se renombra al terminar.
+    Devuelve la ruta de salida o None si falla.
+    """
+    ds_vector = gdal.OpenEx(ruta_vector, gdal.OF_VECTOR)
+    if ds_vector is None:
+        _log(f"❌ No se puede abrir la fuente vectorial: {gdal.GetLastErrorMsg()}")
+        return None
+
+    ruta_parcial = _ruta_parcial(ruta_salida)
+    try:
+        try:
+            tipo, nodata = _tipo_raster_campo(ds_vector, nombre_capa, campo_valor)
+        except ValueError as e:
+            _log(f"❌ {e}")
+            return None
+        ds_vector = None
+
+        with metricas.etapa("rasterize", archivo=ruta_vector, capa=nombre_capa) as evento:
+            ds = gdal.Rasterize(ruta_parcial, ruta_vector, options=gdal.RasterizeOptions(
+                format="GTiff",
+                layers=[nombre_capa],
+                attribute=campo_valor,
+                xRes=tamano_celda,
+                yRes=tamano_celda,
+                targetAlignedPixels=True,
+                outputType=tipo,
+                noData=nodata,
+                initValues=[nodata],
+                creationOptions=OPCIONES_RASTER_TESELADO,
+            ))
+            evento["ok"] = ds is not None
+            if ds is None:
+                _log(f"❌ Error en gdal.Rasterize ({nombre_capa}): {gdal.GetLastErrorMsg()}")
+                return None
+            evento["pixeles"] = ds.RasterXSize * ds.RasterYSize
+
+            if inyectar_tabla and tipo != gdal.GDT_Float32:
+                generar_inyectar_rat(ds)
+            ds = None
+            evento["bytes_salida"] = _tamano_archivo(ruta_parcial)
+
+        _publicar_salida(ruta_parcial, ruta_salida)
+        return ruta_salida
+    finally:
+        ds_vector = None
+        _borrar_parcial(ruta_parcial)
+
+# Campos de la tabla de atributos que no se copian a la RAT (los genera el formato)
+CAMPOS_IGNORAR_RAT = ["OBJECTID", "FID", "OID", "Shape_Length", "Shape_Area", "Value", "Count"]
+
+def atributos_por_valor(ds_vector, nombre_capa, campo_valor):
+    """
+    { valor: {'Campo': valor, ...} } a partir de los atributos de los polígonos (sin leer geometrías),
+    el mismo formato que 'diccionario_datos'. Un campo solo se conserva si es constante para
+    cada valor (si dos polígonos del mismo valor difieren, no cabe en una fila de la RAT).
+    """
+    capa = ds_vector.GetLayerByName(nombre_capa)
+    defn = capa.GetLayerDefn()
+    ignorar = {c.lower() for c in CAMPOS_IGNORAR_RAT + [campo_valor]}
+    campos = [defn.GetFieldDefn(i).GetName() for i in range(defn.GetFieldCount())]
+    campos = [c for c in campos if c.lower() not in ignorar]
+
+    capa.SetIgnoredFields(["OGR_GEOMETRY", "OGR_STYLE"])
+    atributos, variables = {}, set()
+    capa.ResetReading()
+    for feature in capa:
+        valor = feature.GetField(campo_valor)
+        if valor is None:
+            continue
+        datos = {c: feature.GetField(c) for c in campos}
+        previos = atributos.setdefault(int(valor), datos)
+        if previos is not datos:
+            variables.update(c for c in campos if previos.get(c) != datos[c])
+    capa.SetIgnoredFields([])
+
+    if variables:
+        _log(f"   ℹ️  Campos con valores distintos dentro de una misma clase (no van a la RAT): {sorted(variables)}")
+    return {valor: {c: v for c, v in datos.items() if c not in variables} for valor, datos in atributos.items()}
+
+def rasterizar_a_cog_con_tabla(ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda=TAMANO_CELDA_RASTER,
+                               compresion=None):
+    """
+    Polígonos -> COG con RAT en un solo paso, sin temporales en disco ni pausas:
+    1. gdal.Rasterize a un GeoTIFF comprimido en /vsimem (el único intermedio).
+    2. Histograma + RAT con los atributos de los polígonos (atributos_por_valor).
+    3. gdal.Translate(format="COG") con overviews NEAREST (no mezclan clases) a '.parcial' y renombrado.
+    Con el campo de rangos de concentración (1..10) sale un COG Byte.
+    Devuelve la ruta del COG o None si falla.
+    """
+    ds_vector = gdal.OpenEx(ruta_vector, gdal.OF_VECTOR)
+    if ds_vector is None:
+        _log(f"❌ No se puede abrir la fuente vectorial: {gdal.GetLastErrorMsg()}")
+        return None
+
+    _log(f"\n⚙️  POLÍGONOS -> COG: {nombre_capa}")
+    ruta_mem = f"/vsimem/{nombre_capa}_{os.getpid()}.tif"
+    ruta_parcial = _ruta_parcial(ruta_salida)
+    ds = None
+    try:
+        try:
+            tipo, nodata = _tipo_raster_campo(ds_vector, nombre_capa, campo_valor)
+        except ValueError as e:
+            _log(f"❌ {e}")
+            return None
+        if tipo != gdal.GDT_Byte:
+            _log(f"   ⚠️  Los valores de '{campo_valor}' no caben en Byte. Se usa {gdal.GetDataTypeName(tipo)}.")
+        diccionario_datos = atributos_por_valor(ds_vector, nombre_capa, campo_valor)
+        ds_vector = None
+
+        # 1. Rasterizado en memoria
+        with metricas.etapa("rasterize", archivo=ruta_vector, capa=nombre_capa) as evento:
+            ds = gdal.Rasterize(ruta_mem, ruta_vector, options=gdal.RasterizeOptions(
+                format="GTiff",
+                layers=[nombre_capa],
+                attribute=campo_valor,
+                xRes=tamano_celda,
+                yRes=tamano_celda,
+                targetAlignedPixels=True,
+                outputType=tipo,
+                noData=nodata,
+                initValues=[nodata],
+                creationOptions=OPCIONES_RASTER_TESELADO,
+            ))
+            evento["ok"] = ds is not None
+            if ds is not None:
+                evento["pixeles"] = ds.RasterXSize * ds.RasterYSize
+        if ds is None:
+            _log(f"❌ Error en gdal.Rasterize ({nombre_capa}): {gdal.GetLastErrorMsg()}")
+            return None
+
+        # 2. RAT (y estadísticas exactas: el driver COG no las recalcula)
+        exito_rat = generar_inyectar_rat(ds, diccionario_datos=diccionario_datos)
+        if not exito_rat:
+            _log("   ⚠️  No se generó la tabla.")
+
+        # 3. COG final
+        ds.FlushCache()
+        opciones_creacion, metadatos = _resolver_compresion(ruta_mem, compresion, OPCIONES_COG_TABLA)
+        if not exito_rat:
+            opciones_creacion.append("STATISTICS=YES")
+        if not _translate_medido(ruta_parcial, ds, ruta_vector, format="COG",
+                                 creationOptions=opciones_creacion, metadataOptions=metadatos):
+            _log(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
+            return None
+        _publicar_salida(ruta_parcial, ruta_salida)
+    finally:
+        ds = ds_vector = None
+        gdal.Unlink(ruta_mem)
+        gdal.Unlink(ruta_mem + ".aux.xml")
+        _borrar_parcial(ruta_parcial)
+
+    if exito_rat:
+        if verificar_rat(ruta_salida):
+            _log("   ✨ ÉXITO TOTAL: COG creado y Tabla completa.")
+        else:
+            _log("   ⚠️  ALERTA: Falló la verificación de la tabla.")
+    return ruta_salida
+
+# --- RASTERIZACIÓN POR TESELAS (capas enormes con memoria acotada) ---
+
+# Lado (px) de cada tesela de rasterizado: 4096 x 4096 son 16 MB en Byte, 64 MB en Int32/Float32
+TAM_TESELA_RASTERIZADO = 4096
+
+# Capa vectorial abierta en cada proceso del pool de rasterizado (se abre una vez por proceso)
+_CAPA_RASTERIZADO = None
+_DS_RASTERIZADO = None
+
+def _inicializar_rasterizado(ruta_vector, nombre_capa):
+    """Cada proceso del pool abre la fuente vectorial una sola vez."""
+    global _CAPA_RASTERIZADO, _DS_RASTERIZADO
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    _DS_RASTERIZADO = gdal.OpenEx(ruta_vector, gdal.OF_VECTOR)
+    _CAPA_RASTERIZADO = _DS_RASTERIZADO.GetLayerByName(nombre_capa) if _DS_RASTERIZADO else None
+
+def _rasterizar_tesela(tarea):
+    """
+    Quema una tesela: el filtro espacial (que usa el índice de la fuente: R-tree del GPKG,
+    .qix/.sbn del Shapefile, índice de la FileGDB) deja solo los polígonos que la tocan.
+    Solo se escribe si tiene píxeles. Devuelve (ruta o None, {valor: conteo} o None si hay decimales).
+    """
+    ruta_tesela, geotransform, ancho, alto, wkt, tipo, nodata, campo_valor = tarea
+    capa = _CAPA_RASTERIZADO
+    if capa is None:
+        raise RuntimeError("No se pudo abrir la capa vectorial en el proceso de rasterizado")
+
+    xmin, ymax = geotransform[0], geotransform[3]
+    capa.SetSpatialFilterRect(xmin, ymax + alto * geotransform[5], xmin + ancho * geotransform[1], ymax)
+    capa.ResetReading()
+
+    mem = gdal.GetDriverByName("MEM").Create("", ancho, alto, 1, tipo)
+    mem.SetGeoTransform(geotransform)
+    mem.SetProjection(wkt)
+    banda = mem.GetRasterBand(1)
+    banda.SetNoDataValue(nodata)
+    banda.Fill(nodata)
+    if gdal.RasterizeLayer(mem, [1], capa, options=[f"ATTRIBUTE={campo_valor}"]) != 0:
+        raise RuntimeError(gdal.GetLastErrorMsg() or "gdal.RasterizeLayer falló")
+
+    valores = _valores_validos(banda.ReadAsArray(), nodata)
+    if valores.size == 0:
+        return None, {}
+    acumulador = _AcumuladorHistograma()
+    conteos = None
+    if acumulador.anadir(valores):
+        stats = acumulador.resultado()
+        conteos = dict(zip(stats["valores"].tolist(), stats["conteos"].tolist()))
+
+    gdal.GetDriverByName("GTiff").CreateCopy(ruta_tesela, mem, options=OPCIONES_RASTER_TESELADO)
+    mem = None
+    return ruta_tesela, conteos
+
+def rasterizar_por_teselas(ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda=TAMANO_CELDA_RASTER,
+                           tam_tesela=TAM_TESELA_RASTERIZADO, num_workers=4, inyectar_tabla=True, compresion=None):
+    """
+    Como rasterizar_a_cog_con_tabla pero para capas que a 10 m dan cientos de millones de celdas:
+    1. La extensión de la capa (alineada a la celda) se parte en teselas de 'tam_tesela' px.
+    2. Cada proceso quema sus teselas con filtro espacial; las vacías no se escriben.
+       Cada tesela devuelve sus conteos por valor, así que el histograma sale sin releer nada.
+    3. Un VRT une las teselas y un único gdal.Translate(format="COG") escribe el resultado con la RAT.
+    La memoria por proceso es una tesela, sea cual sea la extensión. Devuelve la ruta del COG o None.
+    """
+    ds_vector = gdal.OpenEx(ruta_vector, gdal.OF_VECTOR)
+    if ds_vector is None:
+        _log(f"❌ No se puede abrir la fuente vectorial: {gdal.GetLastErrorMsg()}")
+        return None
+    capa = ds_vector.GetLayerByName(nombre_capa)
+    if capa is None:
+        _log(f"❌ La fuente vectorial no tiene la capa '{nombre_capa}'.")
+        return None
+
+    _log(f"\n⚙️  POLÍGONOS -> COG (por teselas): {nombre_capa}")
+    try:
+        tipo, nodata = _tipo_raster_campo(ds_vector, nombre_capa, campo_valor)
+    except ValueError as e:
+        _log(f"❌ {e}")
+        return None
+    diccionario_datos = atributos_por_valor(ds_vector, nombre_capa, campo_valor) if inyectar_tabla else None
+    srs = capa.GetSpatialRef()
+    wkt = srs.ExportToWkt() if srs is not None else ""
+
+    # Extensión alineada a la rejilla de 'tamano_celda' (como targetAlignedPixels)
+    xmin, xmax, ymin, ymax = capa.GetExtent()
+    ds_vector = capa = None
+    xmin = float(np.floor(xmin / tamano_celda) * tamano_celda)
+    ymin = float(np.floor(ymin / tamano_celda) * tamano_celda)
+    xmax = float(np.ceil(xmax / tamano_celda) * tamano_celda)
+    ymax = float(np.ceil(ymax / tamano_celda) * tamano_celda)
+    ancho = int(round((xmax - xmin) / tamano_celda))
+    alto = int(round((ymax - ymin) / tamano_celda))
+
+    ruta_parcial = _ruta_parcial(ruta_salida)
+    carpeta_teselas = ruta_salida + SUFIJO_TESELAS
+    os.makedirs(carpeta_teselas, exist_ok=True)
+    ruta_vrt = f"/vsimem/{nombre_capa}_teselas_{os.getpid()}.vrt"
+
+    tareas = []
+    for y0 in range(0, alto, tam_tesela):
+        for x0 in range(0, ancho, tam_tesela):
+            geotransform = (xmin + x0 * tamano_celda, tamano_celda, 0.0, ymax - y0 * tamano_celda, 0.0, -tamano_celda)
+            tareas.append((os.path.join(carpeta_teselas, f"{y0 // tam_tesela}_{x0 // tam_tesela}.tif"), geotransform,
+                           min(tam_tesela, ancho - x0), min(tam_tesela, alto - y0), wkt, tipo, nodata, campo_valor))
+
+    _log(f"   🧱 {ancho} x {alto} px en {len(tareas)} teselas de {tam_tesela} px ({num_workers} procesos)...")
+    ds_vrt = None
+    try:
+        # 1-2. Teselas en paralelo + conteos por valor
+        rutas, conteos, enteros = [], {}, True
+        with metricas.etapa("rasterize", archivo=ruta_vector, capa=nombre_capa, pixeles=ancho * alto) as evento:
+            with ProcessPoolExecutor(max_workers=max(1, num_workers), initializer=_inicializar_rasterizado,
+                                     initargs=(ruta_vector, nombre_capa)) as executor:
+                for ruta_tesela, conteos_tesela in executor.map(_rasterizar_tesela, tareas):
+                    if ruta_tesela is None:
+                        continue
+                    rutas.append(ruta_tesela)
+                    if conteos_tesela is None:
+                        enteros = False
+                    elif enteros:
+                        for valor, cuenta in conteos_tesela.items():
+                            conteos[valor] = conteos.get(valor, 0) + cuenta
+            evento["teselas"] = len(rutas)
+        if not rutas:
+            _log("❌ Ninguna tesela tiene píxeles: la capa está vacía o el campo es todo NULL.")
+            return None
+        _log(f"   ✅ Teselas con datos: {len(rutas)} | Vacías (omitidas): {len(tareas) - len(rutas)}")
+
+        # 3. VRT sobre las teselas con la extensión completa (los huecos quedan como NoData)
+        ds_vrt = gdal.BuildVRT(ruta_vrt, rutas, options=gdal.BuildVRTOptions(
+            outputBounds=(xmin, ymin, xmax, ymax), xRes=tamano_celda, yRes=tamano_celda,
+            srcNodata=nodata, VRTNodata=nodata))
+        if ds_vrt is None:
+            _log(f"❌ Error creando el VRT de teselas: {gdal.GetLastErrorMsg()}")
+            return None
+
+        stats = None
+        if enteros and conteos:
+            valores = np.array(sorted(conteos), dtype=np.int64)
+            stats = _diccionario_histograma(valores, np.array([conteos[v] for v in valores.tolist()], dtype=np.int64))
+        exito_rat = False
+        if inyectar_tabla:
+            exito_rat = generar_inyectar_rat(ds_vrt, diccionario_datos=diccionario_datos, stats=stats)
+            if not exito_rat:
+                _log("   ⚠️  No se generó la tabla.")
+        elif stats is not None:
+            ds_vrt.GetRasterBand(1).SetStatistics(stats["min"], stats["max"], stats["media"], stats["desviacion"])
+
+        # La compresión automática muestrea ventanas repartidas por todo el mosaico, no una tesela
+        ds_vrt.FlushCache()
+        opciones_creacion, metadatos = _resolver_compresion(ruta_vrt, compresion, OPCIONES_COG_TABLA)
+        if not exito_rat and stats is None:
+            opciones_creacion.append("STATISTICS=YES")
+        if not _translate_medido(ruta_parcial, ds_vrt, ruta_vector, format="COG",
+                                 creationOptions=opciones_creacion, metadataOptions=metadatos):
+            _log(f"❌ Error CRÍTICO en gdal.Translate: {gdal.GetLastErrorMsg()}")
+            return None
+        _publicar_salida(ruta_parcial, ruta_salida)
+    finally:
+        ds_vrt = None
+        gdal.Unlink(ruta_vrt)
+        shutil.rmtree(carpeta_teselas, ignore_errors=True)
+        _borrar_parcial(ruta_parcial)
+
+    if exito_rat:
+        if verificar_rat(ruta_salida):
+            _log("   ✨ ÉXITO TOTAL: COG creado y Tabla completa.")
+        else:
+            _log("   ⚠️  ALERTA: Falló la verificación de la tabla.")
+    return ruta_salida
+
+def _rasterizar_trabajo(trabajo, como_cog=False):
+    """Ejecuta un trabajo de rasterizar_capas en un proceso hijo. Devuelve (capa, salida, error, segundos)."""
+    ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda = trabajo
+    funcion = rasterizar_a_cog_con_tabla if como_cog else rasterizar_capa
+    inicio = time.time()
+    try:
+        salida = funcion(ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda)
+        error = None if salida else (gdal.GetLastErrorMsg() or "No se generó el raster")
+    except Exception as e:
+        salida, error = None, str(e)
+    return nombre_capa, salida, error, time.time() - inicio
+
+def rasterizar_capas(trabajos, num_workers=4, como_cog=False):
+    """
+    Rasteriza varias capas en paralelo (un proceso por capa; gdal.Rasterize no reparte
+    una capa entre hilos). 'trabajos' es una lista de
+    (ruta_vector, nombre_capa, campo_valor, ruta_salida, tamano_celda).
+    como_cog=True: cada capa sale directamente como COG con RAT (rasterizar_a_cog_con_tabla).
+    Devuelve [(capa, salida, error, segundos)] en el orden de 'trabajos'.
+    """
+    if num_workers <= 1 or len(trabajos) <= 1:
+        return [_rasterizar_trabajo(t, como_cog) for t in trabajos]
+    with _crear_pool(num_workers) as executor:
+        return list(executor.map(_rasterizar_trabajo, trabajos, [como_cog] * len(trabajos)))
@@ -0,0 +1,187 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from osgeo import gdal
+
+from . import metricas
+from .gdal_utils import _log, _obtener_crs_legible
+
+# --- PIRÁMIDE DE TESELAS PRE-RENDERIZADAS (PNG / WebP) ---
+# Renderiza un COG clasificado a teselas {z}/{x}/{y} coloreadas con la tabla del visor,
+# en un pool de procesos que abren el COG una vez cada uno.
+
+# Misma tabla que TABLA_CONFIGURACION de Test_Mapa/index.html: el color de un valor es el
+# del primer 'limite' mayor que él (el último, 9999, recoge todo lo demás). 0 y NoData son transparentes.
+TABLA_COLORES = [
+    {"limite": 2, "texto": "Menys de 1,14 %", "hex": "#30123b"},
+    {"limite": 3, "texto": "Entre 1,14 i 1,27 %", "hex": "#466be3"},
+    {"limite": 4, "texto": "Entre 1,27 i 1,36 %", "hex": "#28bbeb"},
+    {"limite": 5, "texto": "Entre 1,36 i 1,45 %", "hex": "#32f298"},
+    {"limite": 6, "texto": "Entre 1,45 i 1,55 %", "hex": "#a4fc3c"},
+    {"limite": 7, "texto": "Entre 1,55 i 1,62 %", "hex": "#eedd47"},
+    {"limite": 8, "texto": "Entre 1,62 i 1,72 %", "hex": "#ffa41b"},
+    {"limite": 9, "texto": "Entre 1,72 i 1,84 %", "hex": "#f56b09"},
+    {"limite": 10, "texto": "Entre 1,84 i 2,09 %", "hex": "#d12e07"},
+    {"limite": 9999, "texto": "Igual o més de 2,09 %", "hex": "#7a0403"},
+]
+
+# Teselas por tarea del pool (agrupar reduce el coste de enviar trabajo a los procesos)
+TESELAS_POR_TAREA = 64
+
+# Dataset abierto en cada proceso del pool de teselas (se abre una vez por proceso)
+_DS_TESELAS = None
+
+def _paleta_rgba(tabla_colores):
+    """
+    (límites, colores RGBA uint8) a partir de una tabla [{'limite', 'hex'}, ...].
+    La fila 0 de 'colores' es el transparente; la clase i (1..N) es la fila i.
+    """
+    limites = np.array([c["limite"] for c in tabla_colores[:-1]], dtype=np.float64)
+    colores = np.array([[0, 0, 0, 0]] + [[int(c["hex"][i:i + 2], 16) for i in (1, 3, 5)] + [255] for c in tabla_colores],
+                       dtype=np.uint8)
+    return limites, colores
+
+def clasificar_valores(array, nodata, limites):
+    """Array de valores -> índice de clase uint8 (1..N) con las reglas del visor; 0 = transparente (0 / NoData)."""
+    indices = (np.searchsorted(limites, array, side="right") + 1).astype(np.uint8)
+    transparente = array == 0
+    if nodata is not None:
+        transparente |= np.isnan(array) if np.isnan(nodata) else array == nodata
+    if array.dtype.kind == 'f':
+        transparente |= np.isnan(array)
+    indices[transparente] = 0
+    return indices
+
+def colorear_clases(array, nodata, limites, colores):
+    """Array de valores -> imagen RGBA (alto, ancho, 4) con las reglas del visor."""
+    return colores[clasificar_valores(array, nodata, limites)]
+
+def rejilla_teselas(ds, tam_tesela=256):
+    """
+    Rejilla de teselas en el CRS del raster (sin reproyectar): el nivel más detallado es la
+    resolución nativa y cada nivel anterior la divide por 2, hasta que el raster cabe en una tesela.
+    """
+    gt = ds.GetGeoTransform()
+    lado = max(ds.RasterXSize, ds.RasterYSize)
+    zoom_max = max(0, int(np.ceil(np.log2(lado / tam_tesela)))) if lado > tam_tesela else 0
+    return {
+        "origen": [gt[0], gt[3]],
+        "extension": [gt[0], gt[3] + gt[5] * ds.RasterYSize, gt[0] + gt[1] * ds.RasterXSize, gt[3]],
+        "resoluciones": [gt[1] * 2 ** (zoom_max - z) for z in range(zoom_max + 1)],
+        "zoom_max": zoom_max,
+        "tam_tesela": tam_tesela,
+    }
+
+def _inicializar_teselas(ruta_cog):
+    """Cada proceso del pool abre el COG una sola vez."""
+    global _DS_TESELAS
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    _DS_TESELAS = gdal.Open(ruta_cog)
+
+def _renderizar_teselas(tarea):
+    """
+    Renderiza un grupo de teselas (z, x, y). La lectura con buf_xsize/buf_ysize menor que la
+    ventana hace que GDAL use la overview adecuada del COG. Con los COG de gdal_utils
+    (OPCIONES_COG_TABLA) esas overviews son de vecino más próximo y no mezclan clases.
+    Devuelve (escritas, vacías).
+    """
+    carpeta_salida, formato, tam_tesela, zoom_max, tabla_colores, teselas = tarea
+    ds = _DS_TESELAS
+    banda = ds.GetRasterBand(1)
+    nodata = banda.GetNoDataValue()
+    limites, colores = _paleta_rgba(tabla_colores)
+    driver = gdal.GetDriverByName(formato)
+    extension = "webp" if formato == "WEBP" else "png"
+    opciones = ["LOSSLESS=TRUE"] if formato == "WEBP" else []
+
+    escritas = vacias = 0
+    for z, x, y in teselas:
+        factor = 2 ** (zoom_max - z)
+        lado = tam_tesela * factor
+        x0, y0 = x * lado, y * lado
+        ancho = min(lado, ds.RasterXSize - x0)
+        alto = min(lado, ds.RasterYSize - y0)
+        buf_x = max(1, int(np.ceil(ancho / factor)))
+        buf_y = max(1, int(np.ceil(alto / factor)))
+
+        array = banda.ReadAsArray(x0, y0, ancho, alto, buf_xsize=buf_x, buf_ysize=buf_y)
+        rgba = colorear_clases(array, nodata, limites, colores)
+        if not rgba[..., 3].any():
+            vacias += 1
+            continue
+
+        # Las teselas del borde se completan con transparente hasta tam_tesela x tam_tesela
+        imagen = np.zeros((tam_tesela, tam_tesela, 4), dtype=np.uint8)
+        imagen[:buf_y, :buf_x] = rgba
+        mem = gdal.GetDriverByName("MEM").Create("", tam_tesela, tam_tesela, 4, gdal.GDT_Byte)
+        for b in range(4):
+            mem.GetRasterBand(b + 1).WriteArray(imagen[..., b])
+
+        carpeta = os.path.join(carpeta_salida, str(z), str(x))
+        os.makedirs(carpeta, exist_ok=True)
+        driver.CreateCopy(os.path.join(carpeta, f"{y}.{extension}"), mem, options=opciones)
+        mem = None
+        escritas += 1
+    return escritas, vacias
+
+def exportar_teselas(ruta_cog, carpeta_salida, tabla_colores=None, formato="PNG", tam_tesela=256, zoom_min=0,
+                     num_workers=4):
+    """
+    Exporta una pirámide de teselas coloreadas {z}/{x}/{y}.png (o .webp) a partir del COG,
+    con la tabla de clases del visor. Las teselas se renderizan en paralelo y las que solo
+    tienen NoData no se escriben. Las teselas salen de las overviews del COG: si no se creó
+    con RESAMPLING=NEAREST (ver gdal_utils.OPCIONES_COG_TABLA), en los zoom bajos pueden aparecer colores
+    de clases mezcladas. Deja un 'teselas.json' con la rejilla para el visor:
+    ol.source.XYZ({ url: '.../{z}/{x}/{y}.png', tileGrid: new ol.tilegrid.TileGrid({origin, resolutions, extent}) }).
+    Devuelve la ruta del JSON, o None si falla.
+    """
+    formato = formato.upper()
+    tabla_colores = tabla_colores or TABLA_COLORES
+    if gdal.GetDriverByName(formato) is None:
+        _log(f"❌ Este GDAL no tiene el driver {formato}.")
+        return None
+
+    ds = gdal.Open(ruta_cog)
+    if not ds:
+        _log(f"❌ No se puede abrir {ruta_cog}: {gdal.GetLastErrorMsg()}")
+        return None
+    rejilla = rejilla_teselas(ds, tam_tesela)
+    ancho, alto = ds.RasterXSize, ds.RasterYSize
+    crs = _obtener_crs_legible(ds)
+    ds = None
+
+    # Todas las teselas de todos los niveles, en grupos para el pool
+    teselas = []
+    for z in range(zoom_min, rejilla["zoom_max"] + 1):
+        lado = tam_tesela * 2 ** (rejilla["zoom_max"] - z)
+        for y in range(-(-alto // lado)):
+            for x in range(-(-ancho // lado)):
+                teselas.append((z, x, y))
+    tareas = [(carpeta_salida, formato, tam_tesela, rejilla["zoom_max"], tabla_colores, teselas[i:i + TESELAS_POR_TAREA])
+              for i in range(0, len(teselas), TESELAS_POR_TAREA)]
+
+    _log(f"🧱 Renderizando {len(teselas)} teselas ({zoom_min}..{rejilla['zoom_max']}) de {os.path.basename(ruta_cog)}...")
+    os.makedirs(carpeta_salida, exist_ok=True)
+    escritas = vacias = 0
+    with metricas.etapa("teselas", archivo=ruta_cog, pixeles=ancho * alto) as evento:
+        with ProcessPoolExecutor(max_workers=max(1, num_workers), initializer=_inicializar_teselas,
+                                 initargs=(ruta_cog,)) as executor:
+            for e, v in executor.map(_renderizar_teselas, tareas):
+                escritas += e
+                vacias += v
+        evento["teselas"] = escritas
+
+    extension = "webp" if formato == "WEBP" else "png"
+    ruta_json = os.path.join(carpeta_salida, "teselas.json")
+    with open(ruta_json, "w", encoding="utf-8") as f:
+        json.dump({
+            "url": "{z}/{x}/{y}." + extension,
+            "crs": crs,
+            "zoom_min": zoom_min,
+            **rejilla,
+            "tabla_colores": tabla_colores,
+        }, f, indent=2, ensure_ascii=False)
+
+    _log(f"   ✅ Teselas escritas: {escritas} | Vacías (omitidas): {vacias} -> {carpeta_salida}")
+    return ruta_json
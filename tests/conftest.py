@@ -0,0 +1,46 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# Subimos un nivel para encontrar 'Tools' (como los scripts del repo)
+carpeta_actual = os.path.dirname(os.path.abspath(__file__))
+carpeta_superior = os.path.dirname(carpeta_actual)
+sys.path.insert(0, carpeta_superior)
+
+CARPETA_TEST_MAPA = os.path.join(carpeta_superior, "Test_Mapa")
+
+class BandaNumpy:
+    """
+    Banda mínima sobre un array de numpy, con la parte de la API de gdal.Band que usan las
+    lecturas por bloques de gdal_utils (XSize, YSize, GetBlockSize, GetNoDataValue, ReadAsArray).
+    """
+
+    def __init__(self, array, nodata=None, alto_bloque=2):
+        self.array = np.asarray(array)
+        self.YSize, self.XSize = self.array.shape
+        self.nodata = nodata
+        self.alto_bloque = alto_bloque
+
+    def GetBlockSize(self):
+        return [self.XSize, self.alto_bloque]
+
+    def GetNoDataValue(self):
+        return self.nodata
+
+    def ReadAsArray(self, xoff=0, yoff=0, win_xsize=None, win_ysize=None, buf_xsize=None, buf_ysize=None):
+        win_xsize = self.XSize if win_xsize is None else win_xsize
+        win_ysize = self.YSize if win_ysize is None else win_ysize
+        ventana = self.array[yoff:yoff + win_ysize, xoff:xoff + win_xsize]
+        if buf_xsize or buf_ysize:
+            # Diezmado por vecino más próximo, como hace GDAL con buf_xsize/buf_ysize
+            filas = np.arange(buf_ysize or win_ysize) * win_ysize // (buf_ysize or win_ysize)
+            columnas = np.arange(buf_xsize or win_xsize) * win_xsize // (buf_xsize or win_xsize)
+            ventana = ventana[np.ix_(filas, columnas)]
+        return ventana.copy()
+
+@pytest.fixture
+def banda_numpy():
+    """Fábrica de BandaNumpy: banda_numpy(array, nodata=None, alto_bloque=2)."""
+    return BandaNumpy
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+from Tools import gdal_utils
+
+
+def test_conteos_clases_una_lectura(banda_numpy):
+    array = np.array([[0.5, 1.0, 1.5, 2.0], [2.5, 3.0, -9999.0, 4.0]], dtype=np.float32)
+    resultado = gdal_utils.calcular_conteos_clases(banda_numpy(array, nodata=-9999.0), [1.0, 2.0, 3.0])
+
+    # [.., 2) y [2, ..]: la primera y la última clase recogen lo que cae fuera de los cortes
+    assert resultado["conteos"].tolist() == [3, 4]
+    assert resultado["total"] == 7
+    validos = array[array != -9999.0].astype(np.float64)
+    assert (resultado["min"], resultado["max"]) == (0.5, 4.0)
+    assert resultado["media"] == pytest.approx(validos.mean())
+    assert resultado["desviacion"] == pytest.approx(validos.std())
+
+
+def test_conteos_clases_ignora_nan_e_infinitos(banda_numpy):
+    array = np.array([[np.nan, 1.0], [np.inf, 5.0]], dtype=np.float32)
+    resultado = gdal_utils.calcular_conteos_clases(banda_numpy(array), [0.0, 2.0, 10.0])
+    assert resultado["conteos"].tolist() == [1, 1]
+    assert resultado["total"] == 2
+
+
+def test_conteos_clases_sin_pixeles_validos(banda_numpy):
+    array = np.full((3, 3), -1.0, dtype=np.float32)
+    assert gdal_utils.calcular_conteos_clases(banda_numpy(array, nodata=-1.0), [0.0, 1.0]) is None
+
+
+def test_resolver_cortes(banda_numpy):
+    banda = banda_numpy(np.arange(100, dtype=np.float32).reshape(10, 10))
+    assert gdal_utils.resolver_cortes(banda, [3, 1, 2]) == [1.0, 2.0, 3.0]
+    assert gdal_utils.resolver_cortes(banda, "iguales:3") == pytest.approx([0.0, 33.0, 66.0, 99.0])
+    cuantiles = gdal_utils.resolver_cortes(banda, "cuantiles:4")
+    assert len(cuantiles) == 5 and cuantiles[0] == 0.0 and cuantiles[-1] == 99.0
+    with pytest.raises(ValueError):
+        gdal_utils.resolver_cortes(banda, [1])
+    with pytest.raises(ValueError):
+        gdal_utils.resolver_cortes(banda, "jenks:5")
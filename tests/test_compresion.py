@@ -0,0 +1,30 @@
+import pytest
+
+pytest.importorskip("osgeo")
+from Tools import gdal_utils
+
+
+def test_politica_compresion():
+    assert gdal_utils._politica_compresion("auto") == "equilibrada"
+    assert gdal_utils._politica_compresion("auto:rapida") == "rapida"
+    assert gdal_utils._politica_compresion("auto:1.1") == 1.1
+
+
+@pytest.mark.parametrize("compresion", ["auto:equilibrado", "auto:0.9", "auto:"])
+def test_politica_desconocida_da_error_claro(compresion):
+    with pytest.raises(ValueError, match="compresión"):
+        gdal_utils._politica_compresion(compresion)
+
+
+@pytest.mark.parametrize("compresion", ["zstd", "deflate", "AUTO", True])
+def test_solo_modo_auto(compresion):
+    # No existe una opción de codec fijo: no debe caer en silencio en la prueba "equilibrada"
+    with pytest.raises(ValueError, match="auto"):
+        gdal_utils._politica_compresion(compresion)
+    with pytest.raises(ValueError):
+        gdal_utils.opciones_creacion_previstas(compresion)
+
+
+def test_elegir_compresion_valida_la_politica_antes_de_abrir(tmp_path):
+    with pytest.raises(ValueError, match="equilibrada"):
+        gdal_utils.elegir_compresion(str(tmp_path / "no_existe.tif"), politica="equilibrado")
@@ -0,0 +1,58 @@
+import pytest
+
+from Tools import diario
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conexion = diario.abrir_diario(str(tmp_path))
+    yield conexion
+    conexion.close()
+
+
+def _estados(conn, lote):
+    return dict(conn.execute("SELECT clave, estado FROM archivos WHERE lote = ?", (lote,)))
+
+
+def test_lote_nuevo_todo_pendiente(conn, tmp_path):
+    assert (tmp_path / diario.NOMBRE_DIARIO).exists()
+    lote, hechas = diario.iniciar_lote(conn, "L1", "carpeta_a", ["a.tif", "b.tif"])
+    assert (lote, hechas) == ("L1", set())
+    assert _estados(conn, "L1") == {"a.tif": "pendiente", "b.tif": "pendiente"}
+
+
+def test_marcar_cuenta_intentos(conn):
+    diario.iniciar_lote(conn, "L1", "carpeta_a", ["a.tif"])
+    diario.marcar_en_diario(conn, "L1", "a.tif", "en_curso")
+    diario.marcar_en_diario(conn, "L1", "a.tif", "fallido", error="sin memoria")
+    diario.marcar_en_diario(conn, "L1", "a.tif", "en_curso")
+    diario.marcar_en_diario(conn, "L1", "a.tif", "hecho")
+    estado, intentos, error = conn.execute(
+        "SELECT estado, intentos, error FROM archivos WHERE lote = 'L1' AND clave = 'a.tif'").fetchone()
+    assert (estado, intentos, error) == ("hecho", 2, None)
+
+
+def test_reanudar_lote_sin_terminar(conn):
+    diario.iniciar_lote(conn, "L1", "carpeta_a", ["a.tif", "b.tif", "c.tif"])
+    diario.marcar_en_diario(conn, "L1", "a.tif", "hecho")
+    diario.marcar_en_diario(conn, "L1", "b.tif", "en_curso")  # El proceso murió aquí
+
+    # Sin reanudar siempre es un lote nuevo
+    assert diario.iniciar_lote(conn, "L2", "carpeta_a", ["a.tif"]) == ("L2", set())
+
+    lote, hechas = diario.iniciar_lote(conn, "L3", "carpeta_a", ["a.tif", "b.tif", "c.tif", "d.tif"], reanudar=True)
+    assert lote == "L2"  # El más reciente sin cerrar con la misma descripción
+    diario.cerrar_lote(conn, "L2")
+
+    lote, hechas = diario.iniciar_lote(conn, "L4", "carpeta_a", ["a.tif", "b.tif", "c.tif", "d.tif"], reanudar=True)
+    assert (lote, hechas) == ("L1", {"a.tif"})
+    assert _estados(conn, "L1") == {"a.tif": "hecho", "b.tif": "pendiente", "c.tif": "pendiente", "d.tif": "pendiente"}
+
+
+def test_lote_cerrado_no_se_reanuda(conn):
+    diario.iniciar_lote(conn, "L1", "carpeta_a", ["a.tif"])
+    diario.cerrar_lote(conn, "L1")
+    assert conn.execute("SELECT fin FROM lotes WHERE lote = 'L1'").fetchone()[0] is not None
+    assert diario.iniciar_lote(conn, "L2", "carpeta_a", ["a.tif"], reanudar=True) == ("L2", set())
+    # Otra carpeta (otra descripción) tampoco reanuda
+    assert diario.iniciar_lote(conn, "L3", "carpeta_b", ["a.tif"], reanudar=True) == ("L3", set())
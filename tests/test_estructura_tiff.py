@@ -0,0 +1,117 @@
+import struct
+
+import pytest
+
+from Tools import estructura_tiff
+
+TAM_TESELA_DATOS = 100  # Bytes "comprimidos" de cada tesela (el contenido da igual)
+
+
+def _ifd(entradas, siguiente, bigtiff):
+    """IFD little-endian. 'entradas' = [(tag, tipo, count, valor u offset)]."""
+    if bigtiff:
+        datos = struct.pack("<Q", len(entradas))
+        for tag, tipo, count, valor in sorted(entradas):
+            datos += struct.pack("<HHQQ", tag, tipo, count, valor)
+        return datos + struct.pack("<Q", siguiente)
+    datos = struct.pack("<H", len(entradas))
+    for tag, tipo, count, valor in sorted(entradas):
+        datos += struct.pack("<HHII", tag, tipo, count, valor)
+    return datos + struct.pack("<I", siguiente)
+
+
+def _tam_ifd(num_entradas, bigtiff):
+    return 8 + num_entradas * 20 + 8 if bigtiff else 2 + num_entradas * 12 + 4
+
+
+def construir_cog(ruta, bigtiff=False, metadatos=b"LAYOUT=IFDS_BEFORE_DATA\n", overview_al_final=False):
+    """
+    COG mínimo escrito a mano: imagen de 1024 x 1024 en 4 teselas de 512 + una overview de
+    512 x 512 en 1 tesela, DEFLATE. Los IFDs y los arrays de offsets van antes que los datos
+    y la overview antes que la imagen completa, salvo con overview_al_final=True.
+    """
+    tipo_offset = 16 if bigtiff else 4  # LONG8 / LONG
+    tam_offset = 8 if bigtiff else 4
+    fantasma = b""
+    if metadatos is not None:
+        fantasma = b"GDAL_STRUCTURAL_METADATA_SIZE=%06d bytes\n" % len(metadatos) + metadatos
+
+    comunes = lambda lado: [(256, 4, 1, lado), (257, 4, 1, lado), (258, 4, 1, 8), (259, 4, 1, 8),
+                            (277, 4, 1, 1), (322, 4, 1, 512), (323, 4, 1, 512)]
+    num_entradas_0, num_entradas_1 = len(comunes(0)) + 2, len(comunes(0)) + 3
+
+    inicio_ifd0 = (16 if bigtiff else 8) + len(fantasma)
+    inicio_ifd1 = inicio_ifd0 + _tam_ifd(num_entradas_0, bigtiff)
+    array_offsets = inicio_ifd1 + _tam_ifd(num_entradas_1, bigtiff)
+    array_tamanos = array_offsets + 4 * tam_offset
+    inicio_datos = array_tamanos + 4 * tam_offset
+
+    if overview_al_final:
+        teselas = [inicio_datos + i * TAM_TESELA_DATOS for i in range(4)]
+        tesela_overview = inicio_datos + 4 * TAM_TESELA_DATOS
+    else:
+        tesela_overview = inicio_datos
+        teselas = [inicio_datos + (i + 1) * TAM_TESELA_DATOS for i in range(4)]
+
+    ifd0 = _ifd(comunes(1024) + [(324, tipo_offset, 4, array_offsets), (325, tipo_offset, 4, array_tamanos)],
+                inicio_ifd1, bigtiff)
+    ifd1 = _ifd(comunes(512) + [(254, 4, 1, 1), (324, tipo_offset, 1, tesela_overview),
+                                (325, tipo_offset, 1, TAM_TESELA_DATOS)], 0, bigtiff)
+    formato_array = "<4Q" if bigtiff else "<4I"
+
+    if bigtiff:
+        cabecera = b"II+\x00" + struct.pack("<HHQ", 8, 0, inicio_ifd0)
+    else:
+        cabecera = b"II*\x00" + struct.pack("<I", inicio_ifd0)
+    contenido = (cabecera + fantasma + ifd0 + ifd1 + struct.pack(formato_array, *teselas)
+                 + struct.pack(formato_array, *[TAM_TESELA_DATOS] * 4))
+    contenido += b"\x00" * (5 * TAM_TESELA_DATOS)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    return teselas
+
+
+@pytest.mark.parametrize("bigtiff", [False, True])
+def test_cog_valido(tmp_path, bigtiff):
+    ruta = str(tmp_path / "cog.tif")
+    teselas = construir_cog(ruta, bigtiff=bigtiff)
+    informe = estructura_tiff.auditar_estructura(ruta, con_bloques=True)
+
+    assert informe["es_cog"], informe["errores"]
+    assert informe["bigtiff"] is bigtiff
+    assert informe["metadatos_gdal"] == {"LAYOUT": "IFDS_BEFORE_DATA"}
+    principal, overview = informe["ifds"]
+    assert (principal["tipo"], principal["ancho"], principal["num_bloques"]) == ("principal", 1024, 4)
+    assert (overview["tipo"], overview["ancho"], overview["num_bloques"]) == ("overview", 512, 1)
+    assert principal["bloque"] == (512, 512)
+    assert principal["compresion"] == "DEFLATE"
+    assert principal["tipo_dato"] == "Byte"
+    assert principal["offsets"] == teselas
+
+
+@pytest.mark.parametrize("bigtiff", [False, True])
+def test_overview_despues_de_la_imagen_completa(tmp_path, bigtiff):
+    ruta = str(tmp_path / "roto.tif")
+    construir_cog(ruta, bigtiff=bigtiff, overview_al_final=True)
+    informe = estructura_tiff.auditar_estructura(ruta)
+    assert not informe["es_cog"]
+    assert any("no van antes" in error for error in informe["errores"])
+
+
+def test_edicion_incompatible_y_sin_metadatos(tmp_path):
+    ruta = str(tmp_path / "editado.tif")
+    construir_cog(ruta, metadatos=b"KNOWN_INCOMPATIBLE_EDITION=YES\n")
+    informe = estructura_tiff.auditar_estructura(ruta)
+    assert not informe["es_cog"]
+    assert any("KNOWN_INCOMPATIBLE_EDITION" in error for error in informe["errores"])
+
+    construir_cog(ruta, metadatos=None)
+    informe = estructura_tiff.auditar_estructura(ruta)
+    assert informe["es_cog"]
+    assert any("metadatos estructurales" in aviso for aviso in informe["avisos"])
+
+
+def test_no_es_tiff(tmp_path):
+    ruta = tmp_path / "texto.tif"
+    ruta.write_bytes(b"esto no es un TIFF")
+    assert estructura_tiff.auditar_estructura(str(ruta)) is None
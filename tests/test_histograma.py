@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+from Tools import gdal_utils
+
+
+def test_acumulador_suma_bloques_y_amplia_el_rango():
+    acumulador = gdal_utils._AcumuladorHistograma()
+    assert acumulador.anadir(np.array([5, 5, 7], dtype=np.uint8))
+    assert acumulador.anadir(np.array([2, 7, 9], dtype=np.uint8))   # amplía por abajo y por arriba
+    assert acumulador.anadir(np.array([], dtype=np.uint8))          # bloque vacío (todo NoData)
+
+    stats = acumulador.resultado()
+    assert stats["valores"].tolist() == [2, 5, 7, 9]
+    assert stats["conteos"].tolist() == [1, 2, 2, 1]
+    assert (stats["min"], stats["max"], stats["total"]) == (2, 9, 6)
+    assert stats["media"] == pytest.approx(np.mean([5, 5, 7, 2, 7, 9]))
+    assert stats["desviacion"] == pytest.approx(np.std([5, 5, 7, 2, 7, 9]))
+    assert stats["nans"] == 0
+
+
+def test_acumulador_valores_negativos():
+    acumulador = gdal_utils._AcumuladorHistograma()
+    acumulador.anadir(np.array([-3, 0, 4], dtype=np.int16))
+    acumulador.anadir(np.array([-10], dtype=np.int16))
+    stats = acumulador.resultado()
+    assert stats["valores"].tolist() == [-10, -3, 0, 4]
+    assert stats["conteos"].tolist() == [1, 1, 1, 1]
+
+
+def test_acumulador_flotantes_enteros_si_y_con_decimales_no():
+    acumulador = gdal_utils._AcumuladorHistograma()
+    assert acumulador.anadir(np.array([1.0, 2.0, 2.0], dtype=np.float32))
+    assert acumulador.resultado()["conteos"].tolist() == [1, 2]
+    assert not acumulador.anadir(np.array([1.5], dtype=np.float32))
+    assert not gdal_utils._AcumuladorHistograma().anadir(np.array([np.inf], dtype=np.float32))
+
+
+@pytest.mark.parametrize("relleno", [-3.4028235e38, 3.4028235e38, 2.0 ** 60])
+def test_acumulador_relleno_sin_declarar_no_es_entero(relleno):
+    # Un ±FLT_MAX sin declarar como NoData no tiene decimales, pero no cabe en un int64
+    assert not gdal_utils._AcumuladorHistograma().anadir(np.array([1, 2, relleno], dtype=np.float32))
+    assert gdal_utils._AcumuladorHistograma().anadir(np.array([1, 2, 2.0 ** 53], dtype=np.float64))
+
+
+def test_histograma_exacto_relleno_sin_declarar(banda_numpy):
+    array = np.array([[1, 2, -3.4028235e38]], dtype=np.float32)
+    assert gdal_utils.calcular_histograma_exacto(banda_numpy(array)) is None
+    assert gdal_utils.calcular_histograma_exacto(banda_numpy(array, nodata=-3.4028235e38))["valores"].tolist() == [1, 2]
+
+
+def test_acumulador_uint64_fuera_de_int64():
+    assert not gdal_utils._AcumuladorHistograma().anadir(np.array([1, 2 ** 63], dtype=np.uint64))
+
+
+def test_acumulador_rango_enorme_pasa_al_respaldo():
+    acumulador = gdal_utils._AcumuladorHistograma()
+    acumulador.anadir(np.array([0, 0, 1], dtype=np.int64))
+    acumulador.anadir(np.array([gdal_utils.MAX_RANGO_BINCOUNT * 4], dtype=np.int64))
+    assert acumulador.extra is not None and acumulador.conteos is None
+
+    stats = acumulador.resultado()
+    assert stats["valores"].tolist() == [0, 1, gdal_utils.MAX_RANGO_BINCOUNT * 4]
+    assert stats["conteos"].tolist() == [2, 1, 1]
+
+
+def test_acumulador_sin_pixeles():
+    assert gdal_utils._AcumuladorHistograma().resultado() is None
+
+
+def test_histograma_exacto_por_bloques_excluye_nodata(banda_numpy):
+    array = np.array([[0, 1, 1], [2, 0, 3], [3, 3, 0]], dtype=np.uint8)
+    stats = gdal_utils.calcular_histograma_exacto(banda_numpy(array, nodata=0, alto_bloque=2))
+    assert stats["valores"].tolist() == [1, 2, 3]
+    assert stats["conteos"].tolist() == [2, 1, 3]
+    assert stats["total"] == 6
@@ -0,0 +1,89 @@
+import json
+import os
+
+import pytest
+
+from Tools import manifiesto
+
+
+@pytest.fixture
+def carpetas(tmp_path):
+    entrada = tmp_path / "entrada.tif"
+    entrada.write_bytes(b"II*\x00datos")
+    salida = tmp_path / "salida"
+    salida.mkdir()
+    return str(entrada), str(salida)
+
+
+def _escribir_cog(carpeta_salida, contenido=b"cog"):
+    ruta = os.path.join(carpeta_salida, "entrada_COG.tif")
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    return ruta
+
+
+def test_huella_entrada_archivo_y_carpeta(tmp_path):
+    gdb = tmp_path / "datos.gdb"
+    (gdb / "sub").mkdir(parents=True)
+    (gdb / "a").write_bytes(b"12345")
+    (gdb / "sub" / "b").write_bytes(b"678")
+    huella = manifiesto.huella_entrada(str(gdb))
+    assert huella["tamano"] == 8
+    assert huella["mtime"] == max(os.stat(gdb / "a").st_mtime_ns, os.stat(gdb / "sub" / "b").st_mtime_ns)
+    assert manifiesto.huella_entrada(str(gdb / "a"))["tamano"] == 5
+
+
+def test_hash_diccionario_estable():
+    assert manifiesto.hash_diccionario(None) is None
+    assert manifiesto.hash_diccionario({}) is None
+    a = manifiesto.hash_diccionario({1: {"Nom": "Baix"}, 2: {"Nom": "Alt"}})
+    b = manifiesto.hash_diccionario({2: {"Nom": "Alt"}, 1: {"Nom": "Baix"}})
+    assert a == b
+    assert a != manifiesto.hash_diccionario({1: {"Nom": "Baix"}, 2: {"Nom": "Mitjà"}})
+
+
+def test_registrar_y_comprobar(carpetas):
+    entrada, salida = carpetas
+    firma = {"entrada": manifiesto.huella_entrada(entrada), "opciones": {"modo": "pipeline"}}
+    ruta_cog = _escribir_cog(salida)
+
+    registro = {}
+    manifiesto.registrar_en_manifiesto(registro, ruta_cog, firma)
+    assert manifiesto.esta_al_dia(registro, ruta_cog, firma)
+
+    # Otra firma (opciones distintas) o un COG tocado a mano: hay que rehacerlo
+    assert not manifiesto.esta_al_dia(registro, ruta_cog, dict(firma, opciones={"modo": "reapertura"}))
+    _escribir_cog(salida, b"cog editado")
+    assert not manifiesto.esta_al_dia(registro, ruta_cog, firma)
+    os.remove(ruta_cog)
+    assert not manifiesto.esta_al_dia(registro, ruta_cog, firma)
+
+    # Una conversión fallida borra la entrada
+    manifiesto.registrar_en_manifiesto(registro, ruta_cog, firma, exito=False)
+    assert registro == {}
+
+
+def test_guardar_y_cargar(carpetas):
+    _, salida = carpetas
+    assert manifiesto.cargar_manifiesto(salida) == {}
+    datos = {"entrada_COG.tif": {"firma": {"hash_rat": None}, "salida": {"tamano": 3, "mtime": 1}}}
+    manifiesto.guardar_manifiesto(salida, datos)
+    assert manifiesto.cargar_manifiesto(salida) == datos
+    assert os.listdir(salida) == [manifiesto.NOMBRE_MANIFIESTO]  # Sin el .tmp
+
+    with open(os.path.join(salida, manifiesto.NOMBRE_MANIFIESTO), "w", encoding="utf-8") as f:
+        f.write("{corrupto")
+    assert manifiesto.cargar_manifiesto(salida) == {}
+
+
+def test_firma_conversion_cambia_con_las_opciones_resueltas(carpetas):
+    pytest.importorskip("osgeo")
+    from Tools import gdal_utils
+
+    entrada, _ = carpetas
+    base = gdal_utils.firma_conversion(entrada)
+    assert base["opciones"]["creacion"] == gdal_utils.OPCIONES_COG_TABLA
+    assert json.loads(json.dumps(base)) == base  # Se guarda tal cual en el JSON
+    assert gdal_utils.firma_conversion(entrada, modo="reapertura") != base
+    assert gdal_utils.firma_conversion(entrada, diccionario_datos={1: {"Nom": "Baix"}}) != base
+    assert gdal_utils.firma_conversion(entrada, reducir_tipo=True) != base
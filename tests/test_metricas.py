@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from Tools import metricas
+
+
+def _escribir(ruta, eventos):
+    with open(ruta, "w", encoding="utf-8") as f:
+        for evento in eventos:
+            f.write(json.dumps(evento) + "\n")
+        f.write("línea corrupta\n")
+
+
+def test_resumir_eventos(tmp_path):
+    ruta = str(tmp_path / "metricas.jsonl")
+    _escribir(ruta, [
+        {"tipo": "etapa", "etapa": "translate", "lote": "A", "ok": True, "segundos": 2.0,
+         "bytes_entrada": 4_000_000, "pixeles": 1_000_000, "delta_rss_mb": 50.0, "pico_proceso_mb": 300.0},
+        {"tipo": "etapa", "etapa": "translate", "lote": "A", "ok": False, "segundos": 2.0,
+         "bytes_entrada": 4_000_000, "pixeles": 3_000_000, "delta_rss_mb": -10.0, "pico_proceso_mb": 320.0},
+        {"tipo": "etapa", "etapa": "scan", "lote": "A", "segundos": 0.5, "delta_rss_mb": None},
+        {"tipo": "progreso", "etapa": "translate", "lote": "A", "segundos": 99.0},
+        {"tipo": "etapa", "etapa": "translate", "lote": "B", "segundos": 100.0},
+    ])
+
+    resumen = metricas.resumir_eventos(ruta, lote="A")
+    assert set(resumen) == {"translate", "scan"}
+
+    translate = resumen["translate"]
+    assert (translate["eventos"], translate["fallos"]) == (2, 1)
+    assert translate["segundos"] == 4.0
+    assert translate["mpix_s"] == 1.0
+    assert translate["mb_s"] == 2.0
+    assert translate["delta_rss_mb"] == 50.0
+    assert translate["pico_proceso_mb"] == 320.0
+
+    scan = resumen["scan"]
+    assert scan["delta_rss_mb"] is None
+    assert scan["mpix_s"] is None
+
+    # Sin lote se suman todas las ejecuciones del archivo
+    assert metricas.resumir_eventos(ruta)["translate"]["eventos"] == 3
+
+
+def test_resumir_eventos_sin_archivo(tmp_path):
+    assert metricas.resumir_eventos(str(tmp_path / "no_existe.jsonl")) == {}
+    assert metricas.resumir_eventos(None) == {}
+
+
+def test_etapa_emite_memoria_por_etapa(tmp_path):
+    ruta = str(tmp_path / "metricas.jsonl")
+    registro = metricas.RegistroMetricas(ruta, lote="L")
+    with registro.etapa("histogram", archivo="a.tif", pixeles=10) as evento:
+        evento["bytes_salida"] = 5
+    with pytest.raises(RuntimeError):
+        with registro.etapa("verify", archivo="a.tif"):
+            raise RuntimeError("falla")
+    registro.cerrar()
+
+    with open(ruta, encoding="utf-8") as f:
+        eventos = [json.loads(linea) for linea in f]
+    assert [(e["etapa"], e["ok"], e["lote"]) for e in eventos] == [("histogram", True, "L"), ("verify", False, "L")]
+    assert eventos[0]["bytes_salida"] == 5
+    for evento in eventos:
+        assert {"rss_mb", "delta_rss_mb", "pico_proceso_mb", "segundos"} <= set(evento)
+
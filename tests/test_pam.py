@@ -0,0 +1,92 @@
+import os
+import shutil
+from xml.etree import ElementTree
+
+import pytest
+
+from conftest import CARPETA_TEST_MAPA
+
+pytest.importorskip("osgeo")
+from osgeo import gdal
+from Tools import gdal_utils
+
+RUTA_AUX = os.path.join(CARPETA_TEST_MAPA, "distribucio_estimada_Al.tif.aux.xml")
+
+# Conteos por valor del histograma de Test_Mapa (256 cubetas de ArcGIS entre 1 y 10)
+CONTEOS_AL = [31281692, 36252205, 35340762, 34792193, 36015942, 34803290, 34430869, 33874953, 26324746, 17940508]
+
+# Basta con que el raster tenga al menos tantos píxeles como STATISTICS_COUNT
+ANCHO, ALTO = 20000, 20000
+
+
+class _Banda:
+    def __init__(self, tipo, nodata=None):
+        self.DataType = tipo
+        self.nodata = nodata
+
+    def GetNoDataValue(self):
+        return self.nodata
+
+
+class _Dataset:
+    """Lo que leer_estadisticas_pam mira del dataset: tamaño y tipo / NoData de las bandas."""
+
+    def __init__(self, tipo, nodata=None):
+        self.RasterXSize, self.RasterYSize, self.RasterCount = ANCHO, ALTO, 1
+        self.banda = _Banda(tipo, nodata)
+
+    def GetRasterBand(self, num_banda):
+        return self.banda
+
+
+def _banda_pam():
+    return ElementTree.parse(RUTA_AUX).getroot().find("PAMRasterBand")
+
+
+@pytest.fixture
+def raster_con_aux(tmp_path):
+    """Raster vacío con una copia del .aux.xml de Test_Mapa, más reciente que él."""
+    ruta = str(tmp_path / "distribucio_estimada_Al.tif")
+    open(ruta, "wb").close()
+    os.utime(ruta, (1_600_000_000, 1_600_000_000))
+    shutil.copy(RUTA_AUX, ruta + ".aux.xml")
+    return ruta
+
+
+def test_histograma_pam_cubetas_arcgis():
+    stats = gdal_utils._histograma_pam(_banda_pam(), ANCHO, ALTO, None)
+    assert stats["valores"].tolist() == list(range(1, 11))
+    assert stats["conteos"].tolist() == CONTEOS_AL
+    assert stats["total"] == 321057160
+    assert stats["media"] == pytest.approx(5.1897927179022, rel=1e-9)
+    assert stats["desviacion"] == pytest.approx(2.6988291684845, rel=1e-6)
+
+
+def test_histograma_pam_descarta_si_no_es_fiable():
+    # El NoData actual aparece en el histograma: se calculó con otro NoData
+    assert gdal_utils._histograma_pam(_banda_pam(), ANCHO, ALTO, 5) is None
+    # Más píxeles en el histograma que en el raster: es de otro raster
+    assert gdal_utils._histograma_pam(_banda_pam(), 1000, 1000, None) is None
+
+
+def test_estadisticas_pam_sin_histograma():
+    stats = gdal_utils._estadisticas_pam(_banda_pam(), ANCHO, ALTO)
+    assert stats == {"min": 1.0, "max": 10.0, "media": 5.1897927179022, "desviacion": 2.6988291684845}
+
+
+def test_leer_estadisticas_pam_banda_entera(raster_con_aux):
+    stats = gdal_utils.leer_estadisticas_pam(raster_con_aux, _Dataset(gdal.GDT_Byte))[0]
+    assert stats["conteos"].tolist() == CONTEOS_AL
+
+
+def test_leer_estadisticas_pam_banda_flotante(raster_con_aux):
+    # En Float32 el histograma no demuestra que los valores sean enteros: solo estadísticas
+    stats = gdal_utils.leer_estadisticas_pam(raster_con_aux, _Dataset(gdal.GDT_Float32))[0]
+    assert "valores" not in stats
+    assert (stats["min"], stats["max"]) == (1.0, 10.0)
+    assert gdal_utils._solo_histogramas([stats]) == [None]
+
+
+def test_leer_estadisticas_pam_aux_caducado(raster_con_aux):
+    os.utime(raster_con_aux + ".aux.xml", (1_500_000_000, 1_500_000_000))
+    assert gdal_utils.leer_estadisticas_pam(raster_con_aux, _Dataset(gdal.GDT_Float32)) == [None]
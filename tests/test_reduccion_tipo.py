@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+from osgeo import gdal
+from Tools import gdal_utils
+
+
+def _stats(valores, nans=0):
+    valores = np.array(sorted(valores), dtype=np.int64)
+    stats = gdal_utils._diccionario_histograma(valores, np.ones(len(valores), dtype=np.int64))
+    stats["nans"] = nans
+    return stats
+
+
+def test_tipo_entero_minimo():
+    assert gdal_utils.tipo_entero_minimo(_stats(range(1, 11)), necesita_nodata=False) == (gdal.GDT_Byte, None)
+    assert gdal_utils.tipo_entero_minimo(_stats(range(1, 11))) == (gdal.GDT_Byte, 0)
+    assert gdal_utils.tipo_entero_minimo(_stats(range(0, 255))) == (gdal.GDT_Byte, 255)
+    # Byte lleno: no queda NoData libre y se sube a UInt16
+    assert gdal_utils.tipo_entero_minimo(_stats(range(0, 256))) == (gdal.GDT_UInt16, 65535)
+    assert gdal_utils.tipo_entero_minimo(_stats([-5, 0, 5])) == (gdal.GDT_Int16, 32767)
+    assert gdal_utils.tipo_entero_minimo(_stats([0, 70000])) is None
+
+
+def test_tipo_entero_minimo_con_nan_siempre_reserva_nodata():
+    # Un entero no puede guardar NaN: sin NoData acabarían como 0, un valor real
+    assert gdal_utils.tipo_entero_minimo(_stats([1, 2], nans=3), necesita_nodata=False) == (gdal.GDT_Byte, 0)
+    assert gdal_utils.tipo_entero_minimo(_stats([0, 1], nans=1), necesita_nodata=False) == (gdal.GDT_Byte, 255)
+
+
+def test_histograma_exacto_cuenta_los_nan(banda_numpy):
+    array = np.array([[1, np.nan, 2], [np.nan, 2, -1]], dtype=np.float32)
+
+    stats = gdal_utils.calcular_histograma_exacto(banda_numpy(array, nodata=-1.0))
+    assert stats["valores"].tolist() == [1, 2]
+    assert stats["conteos"].tolist() == [1, 2]
+    assert stats["nans"] == 2
+
+    # Si el NoData declarado ya es NaN, no son píxeles perdidos
+    stats = gdal_utils.calcular_histograma_exacto(banda_numpy(array, nodata=float("nan")))
+    assert stats["valores"].tolist() == [-1, 1, 2]
+    assert stats["nans"] == 0
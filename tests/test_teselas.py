@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("osgeo")
+from Tools import teselas
+
+LIMITES = np.array([2, 3, 10], dtype=np.float64)  # 4 clases: <2, [2,3), [3,10), >=10
+
+
+def test_clasificar_valores_reglas_del_visor():
+    array = np.array([[1, 2, 2.5, 3], [9.99, 10, 5000, -1]], dtype=np.float32)
+    clases = teselas.clasificar_valores(array, None, LIMITES)
+    assert clases.dtype == np.uint8
+    assert clases.tolist() == [[1, 2, 2, 3], [3, 4, 4, 1]]
+
+
+def test_clasificar_valores_transparentes():
+    array = np.array([[0, -9999, np.nan, 4]], dtype=np.float32)
+    assert teselas.clasificar_valores(array, -9999.0, LIMITES).tolist() == [[0, 0, 0, 3]]
+    # NoData NaN declarado
+    assert teselas.clasificar_valores(array, float("nan"), LIMITES).tolist() == [[0, 1, 0, 3]]
+    # Enteros: solo 0 y el NoData
+    enteros = np.array([[0, 1, 255]], dtype=np.uint8)
+    assert teselas.clasificar_valores(enteros, 255, LIMITES).tolist() == [[0, 1, 0]]
+
+
+def test_colorear_clases_con_la_tabla_del_visor():
+    limites, colores = teselas._paleta_rgba(teselas.TABLA_COLORES)
+    assert len(limites) == len(teselas.TABLA_COLORES) - 1
+    assert colores.shape == (len(teselas.TABLA_COLORES) + 1, 4)
+
+    rgba = teselas.colorear_clases(np.array([[0, 1, 9999]], dtype=np.int16), None, limites, colores)
+    assert rgba[0, 0].tolist() == [0, 0, 0, 0]
+    assert rgba[0, 1].tolist() == [0x30, 0x12, 0x3b, 255]   # Primera clase (#30123b)
+    assert rgba[0, 2].tolist() == [0x7a, 0x04, 0x03, 255]   # Última clase (#7a0403)
+
+
+def test_rejilla_teselas():
+    class _Dataset:
+        RasterXSize, RasterYSize = 1000, 300
+        GetGeoTransform = staticmethod(lambda: (400000.0, 10.0, 0.0, 4700000.0, 0.0, -10.0))
+
+    rejilla = teselas.rejilla_teselas(_Dataset(), tam_tesela=256)
+    assert rejilla["zoom_max"] == 2
+    assert rejilla["resoluciones"] == [40.0, 20.0, 10.0]
+    assert rejilla["extension"] == [400000.0, 4697000.0, 410000.0, 4700000.0]